@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
+from prometheus_client import start_http_server
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -17,6 +18,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 # is populated before importing code that may import ORM models.
 django_asgi_app = get_asgi_application()
 
+from django.conf import settings  # noqa: E402
+
 def get_websocket_application():
     """Lazy load websocket routing to avoid import issues"""
     from messaging.routing import websocket_urlpatterns
@@ -28,6 +31,10 @@ def get_websocket_application():
         )
     )
 
+if settings.METRICS_PORT:
+    # Socket counters (e.g. chat_read_receipt_*) live in this process
+    start_http_server(int(settings.METRICS_PORT))
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": get_websocket_application(),
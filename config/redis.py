@@ -0,0 +1,24 @@
+"""
+Shared Redis client for data that lives outside the Django cache
+(counters, presence and similar structures that need native Redis commands).
+"""
+from django.conf import settings
+import redis
+
+_client = None
+
+
+def get_redis():
+    """
+    Return the process-wide Redis client (connection pooled, created lazily).
+    Callers are expected to handle redis.RedisError and fall back to the database.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=1,
+            socket_connect_timeout=1,
+            decode_responses=True,
+        )
+    return _client
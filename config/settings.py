@@ -245,6 +245,91 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache (shared by web, websocket and celery processes)
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL", f"{REDIS_URL}/1"),
+    }
+}
+
+# Conversation notifications for the same user within this window collapse into one
+NOTIFICATION_COALESCE_SECONDS = int(os.getenv("NOTIFICATION_COALESCE_SECONDS", 60))
+
+# read_messages frames from one user in one conversation within this window become a single write
+READ_RECEIPT_WINDOW_SECONDS = float(os.getenv("READ_RECEIPT_WINDOW_SECONDS", 0.5))
+
+# How long a process reuses its copy of PlatformConfig before checking the shared
+# cache for a newer version, i.e. how long admin changes take to reach every worker
+PLATFORM_CONFIG_LOCAL_SECONDS = float(os.getenv("PLATFORM_CONFIG_LOCAL_SECONDS", 5))
+# Same for the payment gateway rows
+PAYMENT_GATEWAY_LOCAL_SECONDS = float(os.getenv("PAYMENT_GATEWAY_LOCAL_SECONDS", 5))
+# Same for the catalogs (countries, regions, transport and package types)
+CATALOG_LOCAL_SECONDS = float(os.getenv("CATALOG_LOCAL_SECONDS", 30))
+
+# How long websocket handshakes trust cached user fields and token revocation checks
+WS_AUTH_CACHE_SECONDS = int(os.getenv("WS_AUTH_CACHE_SECONDS", 60))
+
+# Presence: sockets refresh their entry every PRESENCE_HEARTBEAT_SECONDS and count
+# as gone PRESENCE_TTL_SECONDS after the last refresh
+PRESENCE_STORE = os.getenv("PRESENCE_STORE", "messaging.presence.RedisPresenceStore")
+PRESENCE_HEARTBEAT_SECONDS = int(os.getenv("PRESENCE_HEARTBEAT_SECONDS", 30))
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 90))
+PRESENCE_MAX_SUBSCRIPTIONS = int(os.getenv("PRESENCE_MAX_SUBSCRIPTIONS", 500))
+
+# Uploads: request handlers spool files to UPLOAD_SPOOL_DIR (shared with the Celery
+# workers), which upload them to UPLOAD_STORAGE_BACKEND, UPLOAD_WORKERS at a time
+UPLOAD_STORAGE_BACKEND = os.getenv("UPLOAD_STORAGE_BACKEND", "config.storage.CloudinaryStorage")
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(MEDIA_ROOT, 'spool'))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", 3))
+UPLOAD_RETRY_BACKOFF = float(os.getenv("UPLOAD_RETRY_BACKOFF", 0.5))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 20 * 1024 * 1024))
+# Spooled files older than this (seconds) are swept and their uploads marked failed
+UPLOAD_SPOOL_MAX_AGE = int(os.getenv("UPLOAD_SPOOL_MAX_AGE", 6 * 60 * 60))
+
+# Chapa HTTP client (money.chapa_client): keep-alive pool size, timeouts, retries of
+# reads (backoff doubles from CHAPA_RETRY_BACKOFF seconds) and the circuit breaker,
+# which stops calling after CHAPA_BREAKER_THRESHOLD consecutive failures and tries
+# again every CHAPA_BREAKER_RESET_SECONDS
+CHAPA_POOL_SIZE = int(os.getenv("CHAPA_POOL_SIZE", 20))
+CHAPA_CONNECT_TIMEOUT = float(os.getenv("CHAPA_CONNECT_TIMEOUT", 3.05))
+CHAPA_READ_TIMEOUT = float(os.getenv("CHAPA_READ_TIMEOUT", 10))
+CHAPA_RETRIES = int(os.getenv("CHAPA_RETRIES", 2))
+CHAPA_RETRY_BACKOFF = float(os.getenv("CHAPA_RETRY_BACKOFF", 0.2))
+CHAPA_BREAKER_THRESHOLD = int(os.getenv("CHAPA_BREAKER_THRESHOLD", 5))
+CHAPA_BREAKER_RESET_SECONDS = float(os.getenv("CHAPA_BREAKER_RESET_SECONDS", 30))
+
+# Pending payment polling (money.verifier): batches of PAYMENT_VERIFY_BATCH_SIZE
+# checked PAYMENT_VERIFY_WORKERS at a time for at most PAYMENT_VERIFY_TIME_BUDGET
+# seconds per run; a row is re-checked after BASE_DELAY seconds, doubling up to
+# MAX_DELAY, and stops being polled after MAX_AGE_HOURS
+PAYMENT_VERIFY_BATCH_SIZE = int(os.getenv("PAYMENT_VERIFY_BATCH_SIZE", 50))
+PAYMENT_VERIFY_WORKERS = int(os.getenv("PAYMENT_VERIFY_WORKERS", 8))
+PAYMENT_VERIFY_TIME_BUDGET = int(os.getenv("PAYMENT_VERIFY_TIME_BUDGET", 240))
+PAYMENT_VERIFY_BASE_DELAY = int(os.getenv("PAYMENT_VERIFY_BASE_DELAY", 60))
+PAYMENT_VERIFY_MAX_DELAY = int(os.getenv("PAYMENT_VERIFY_MAX_DELAY", 3600))
+PAYMENT_VERIFY_MAX_AGE_HOURS = int(os.getenv("PAYMENT_VERIFY_MAX_AGE_HOURS", 48))
+
+# Webhook inbox (money.webhooks): events are drained in batches of WEBHOOK_BATCH_SIZE,
+# re-verified WEBHOOK_WORKERS at a time for at most WEBHOOK_TIME_BUDGET seconds per
+# run; an event still pending is retried after WEBHOOK_RETRY_BASE_DELAY seconds
+# (doubling) until it has been tried WEBHOOK_MAX_ATTEMPTS times
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 50))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))
+WEBHOOK_TIME_BUDGET = int(os.getenv("WEBHOOK_TIME_BUDGET", 50))
+WEBHOOK_RETRY_BASE_DELAY = int(os.getenv("WEBHOOK_RETRY_BASE_DELAY", 30))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+
+# The bank list (money.banks) is served from the cache as is for BANK_LIST_FRESH_SECONDS,
+# then for up to BANK_LIST_STALE_SECONDS more while it is rebuilt in the background
+BANK_LIST_FRESH_SECONDS = int(os.getenv("BANK_LIST_FRESH_SECONDS", 300))
+BANK_LIST_STALE_SECONDS = int(os.getenv("BANK_LIST_STALE_SECONDS", 86400))
+
+# Port for the Prometheus metrics of the ASGI process (disabled when unset)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
@@ -267,6 +352,21 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 300.0,  # Every 5 minutes
         'args': (),
     },
+    'process-webhook-events': {
+        'task': 'money.tasks.process_webhook_events',
+        'schedule': 60.0,  # Every minute, for retries and events whose task was lost
+        'args': (),
+    },
+    'sweep-upload-spool': {
+        'task': 'users.tasks.sweep_upload_spool',
+        'schedule': 3600.0,  # Every hour
+        'args': (),
+    },
+    'expire-attachment-uploads': {
+        'task': 'messaging.tasks.expire_attachment_uploads',
+        'schedule': 3600.0,  # Every hour
+        'args': (),
+    },
 }
 
 CELERY_TIMEZONE = 'Africa/Addis_Ababa'
@@ -0,0 +1,111 @@
+"""
+Background uploads.
+
+Request handlers spool incoming files to UPLOAD_SPOOL_DIR (a directory shared
+with the Celery workers) and return right away; a task then pushes the spooled
+files to the storage backend concurrently (with retries) and removes them
+from the spool.
+
+If the task can't be queued the files are removed and the caller records the
+upload as failed (queue_upload). Files whose task was lost later on (a worker
+died) are removed by sweep_spool once they are UPLOAD_SPOOL_MAX_AGE seconds old.
+"""
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from .utils import upload_images
+
+logger = logging.getLogger(__name__)
+
+
+def spool_dir():
+    return getattr(settings, 'UPLOAD_SPOOL_DIR', os.path.join(settings.MEDIA_ROOT, 'spool'))
+
+
+def spool(file):
+    """Write an uploaded file to the spool directory and return its path."""
+    directory = spool_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{uuid.uuid4().hex}{os.path.splitext(file.name)[1]}')
+    with open(path, 'wb') as destination:
+        if hasattr(file, 'chunks'):
+            for chunk in file.chunks():
+                destination.write(chunk)
+        else:
+            shutil.copyfileobj(file, destination)
+    return path
+
+
+def upload_spooled(uploads):
+    """
+    Upload spooled files concurrently (see config.utils.upload_images) and
+    remove them from the spool.
+
+    Args:
+        uploads: List of (spool path, public_id) pairs
+
+    Returns:
+        list: The backend result for each upload, or the exception it raised
+    """
+    if not uploads:
+        return []
+    paths, public_ids = zip(*uploads)
+    try:
+        return upload_images(paths, public_ids, return_exceptions=True)
+    finally:
+        discard(paths)
+
+
+def discard(paths):
+    """Remove spooled files."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def queue_upload(task, args, paths, on_failure):
+    """
+    Queue ``task.delay(*args)`` once the transaction commits. If the broker
+    can't be reached the spooled ``paths`` are removed and ``on_failure()``
+    records the failed upload; the request that spooled them still succeeds.
+    """
+    def enqueue():
+        try:
+            task.delay(*args)
+        except Exception as e:
+            logger.error(f"Could not queue {task.name}, dropping {len(paths)} spooled files: {str(e)}")
+            discard(paths)
+            on_failure()
+
+    # robust: even on_failure() going wrong must not fail the committed request
+    transaction.on_commit(enqueue, robust=True)
+
+
+def sweep_spool(max_age=None):
+    """
+    Remove spooled files older than ``max_age`` seconds (UPLOAD_SPOOL_MAX_AGE),
+    whose upload task can no longer be expected to run. Returns how many.
+    """
+    max_age = max_age or getattr(settings, 'UPLOAD_SPOOL_MAX_AGE', 6 * 60 * 60)
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(spool_dir()))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
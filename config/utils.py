@@ -6,8 +6,15 @@ from django.conf import settings
 from logging.handlers import TimedRotatingFileHandler
 
 from pythonjsonlogger import jsonlogger
+from .storage import get_storage
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import logging
 import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
 
 class DailyJSONFileHandler(TimedRotatingFileHandler):
     """
@@ -66,24 +73,61 @@ cloudinary.config(
 )
 
 def upload_image(image_path, public_id=None):
-    upload_result = cloudinary.uploader.upload(image_path, public_id=public_id)
-    print(upload_result)
-    return upload_result
+    return get_storage().upload(image_path, public_id=public_id)
+
+def upload_images(files, public_ids=None, max_workers=None, retries=None, backoff=None,
+                  return_exceptions=False, storage=None):
+    """
+    Upload several files at once through the storage backend.
+
+    Files (paths or file objects, streamed by the backend) are uploaded by a
+    pool of at most ``max_workers`` threads (UPLOAD_WORKERS). A file failing
+    with one of the backend's retryable errors is retried up to ``retries``
+    times (UPLOAD_RETRIES), waiting ``backoff`` * 2^attempt seconds
+    (UPLOAD_RETRY_BACKOFF) with jitter in between.
 
-# upload multiple files at once
-def upload_images(image_paths, public_ids=None):
+    Returns:
+        list: The backend result dict of each file (public_id, url, secure_url,
+        bytes, width, height, ...), in input order. With ``return_exceptions``
+        a failed file gets its exception in place of a result; otherwise the
+        first failure is raised once the whole batch is done.
+    """
+    files = list(files)
     if public_ids is None:
-        public_ids = [None] * len(image_paths)
-    
-    upload_results = []
-    for image_path, public_id in zip(image_paths, public_ids):
-        upload_result = cloudinary.uploader.upload(image_path, public_id=public_id)
-        upload_results.append(upload_result["secure_url"])
-    
-    return upload_results
+        public_ids = [None] * len(files)
+    if not files:
+        return []
+    storage = storage or get_storage()
+    max_workers = max_workers or getattr(settings, 'UPLOAD_WORKERS', 4)
+    retries = getattr(settings, 'UPLOAD_RETRIES', 3) if retries is None else retries
+    backoff = getattr(settings, 'UPLOAD_RETRY_BACKOFF', 0.5) if backoff is None else backoff
+
+    def upload(file, public_id):
+        start = file.tell() if hasattr(file, 'tell') else None
+        for attempt in range(retries + 1):
+            try:
+                return storage.upload(file, public_id=public_id)
+            except storage.retryable_errors as e:
+                if attempt == retries:
+                    logger.error(f"Upload of {public_id or file} failed after {attempt + 1} attempts: {str(e)}")
+                    raise
+                logger.warning(f"Upload of {public_id or file} failed (attempt {attempt + 1}), retrying: {str(e)}")
+                if start is not None:
+                    file.seek(start)
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        futures = [executor.submit(upload, file, public_id) for file, public_id in zip(files, public_ids)]
+    results = []
+    for future in futures:
+        error = future.exception()
+        if error is not None and not return_exceptions:
+            raise error
+        results.append(error if error is not None else future.result())
+    return results
 
 def delete_image(public_id):
-    return cloudinary.uploader.destroy(public_id)
+    return get_storage().delete(public_id)
 
 def optimized_image_url(public_id):
     optimized_url, _ = cloudinary_url(public_id, fetch_format="auto", quality="auto")
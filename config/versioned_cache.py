@@ -0,0 +1,69 @@
+"""
+Process-local cache in front of the shared cache, for rarely changing config rows.
+
+A process keeps its own copy of each value and checks a version key in the
+shared cache at most every ``local_seconds``; values are stored in the shared
+cache under that version, so only the first process to see a new version reads
+the database. invalidate() publishes a new version, which every process picks up
+within ``local_seconds``. Callers get copies, so mutating one cannot leak into
+other requests.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class VersionedCache:
+    def __init__(self, name, load, local_seconds_setting, default_local_seconds=5, timeout=24 * 60 * 60):
+        """
+        Args:
+            name: Prefix of the shared cache keys
+            load: Callable returning the value for a key (None when there is none)
+            local_seconds_setting: Setting holding how long a local copy is trusted
+            timeout: Shared cache timeout of the values
+        """
+        self.name = name
+        self.load = load
+        self.local_seconds_setting = local_seconds_setting
+        self.default_local_seconds = default_local_seconds
+        self.timeout = timeout
+        self._local = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f'{self.name}:version'
+
+    def get(self, key=''):
+        now = time.monotonic()
+        local = self._local.get(key)
+        local_seconds = getattr(settings, self.local_seconds_setting, self.default_local_seconds)
+        if local and now - local[2] < local_seconds:
+            return copy.copy(local[1])
+
+        version = cache.get(self.version_key)
+        if local and version is not None and version == local[0]:
+            value = local[1]
+        else:
+            if version is None:
+                cache.add(self.version_key, time.time_ns(), None)
+                version = cache.get(self.version_key)
+            shared_key = f'{self.name}:{version}:{key}'
+            # Wrapped, so that "there is no such row" is cached as well
+            cached = cache.get(shared_key)
+            if cached is None:
+                cached = {'value': self.load(key)}
+                cache.set(shared_key, cached, self.timeout)
+            value = cached['value']
+        with self._lock:
+            self._local[key] = (version, value, now)
+        return copy.copy(value)
+
+    def invalidate(self):
+        """Publish a new version, so every process reloads (this one right away)."""
+        cache.set(self.version_key, time.time_ns(), None)
+        with self._lock:
+            self._local.clear()
@@ -11,7 +11,7 @@ class TravelListingAdmin(admin.ModelAdmin):
                    'destination_region', 'travel_date', 'mode_of_transport', 'status')
     list_filter = ('status', 'mode_of_transport', 'pickup_country', 'destination_country')
     search_fields = ('user__username', 'pickup_country__name', 'destination_country__name')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('accepted_weight_kg', 'available_weight_kg', 'created_at', 'updated_at')
     inlines = [ListingImageInline]
     date_hierarchy = 'travel_date'
     fieldsets = (
@@ -22,7 +22,8 @@ class TravelListingAdmin(admin.ModelAdmin):
             'fields': ('pickup_country', 'pickup_region', 'destination_country', 'destination_region')
         }),
         ('Travel Details', {
-            'fields': ('travel_date', 'travel_time', 'mode_of_transport', 'maximum_weight_in_kg', 'notes')
+            'fields': ('travel_date', 'travel_time', 'mode_of_transport', 'maximum_weight_in_kg',
+                      'accepted_weight_kg', 'available_weight_kg', 'notes')
         }),
         ('Pricing', {
             'fields': ('price_per_kg', 'price_per_document', 'price_per_phone', 'price_per_tablet', 
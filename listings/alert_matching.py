@@ -0,0 +1,222 @@
+"""
+Alert matching engine.
+
+Matches a published travel listing against every active Alert without scanning
+the alerts table. Each worker process keeps an in-memory index:
+
+    (pickup_country_id, destination_country_id)
+        -> (pickup_region_id | ANY, destination_region_id | ANY)
+            -> date intervals sorted by from_travel_date
+
+A listing probes at most four region keys (exact/any on each side) and, per key,
+bisects to the alerts starting on or before its travel date; blocks of alerts
+that all ended before that date are skipped without looking at them.
+
+The index is versioned through the Django cache: alert saves bump a version and
+the index catches up from ``updated_at``; deletions bump a rebuild version.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Alert
+
+logger = logging.getLogger(__name__)
+
+ANY = None
+OPEN_ENDED = date.max.toordinal()
+BLOCK_SIZE = 64
+
+VERSION_CACHE_KEY = 'alerts:index-version'
+REBUILD_CACHE_KEY = 'alerts:index-rebuild'
+
+
+def _bump(key):
+    # Seeded with an int: the Redis cache pickles anything else, and INCR fails on that.
+    # A fresh seed (first bump, or evicted) differs from any version seen before.
+    cache.add(key, time.time_ns(), None)
+    try:
+        cache.incr(key)
+    except Exception:
+        # Evicted in between, or a non-integer value left by an earlier release
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_alert_index_version():
+    """Tell every process that alerts were created or updated."""
+    _bump(VERSION_CACHE_KEY)
+
+
+def bump_alert_index_rebuild():
+    """Tell every process that alerts were deleted and the index must be rebuilt."""
+    _bump(REBUILD_CACHE_KEY)
+
+
+class IntervalList:
+    """
+    Alert date intervals of one route key, sorted by start day, with the latest
+    end day of every block of BLOCK_SIZE entries for pruning.
+    """
+
+    def __init__(self):
+        self.entries = []  # (from_ordinal, to_ordinal, alert_id, user_id)
+        self.starts = []
+        self.block_max_end = []
+        self.dirty = False
+
+    def add(self, entry):
+        insort(self.entries, entry)
+        self.dirty = True
+
+    def remove(self, entry):
+        self.entries.remove(entry)
+        self.dirty = True
+
+    def _reindex(self):
+        self.starts = [entry[0] for entry in self.entries]
+        self.block_max_end = [
+            max(entry[1] for entry in self.entries[start:start + BLOCK_SIZE])
+            for start in range(0, len(self.entries), BLOCK_SIZE)
+        ]
+        self.dirty = False
+
+    def matching(self, day):
+        """Yield (alert_id, user_id) of intervals containing ``day`` (an ordinal)."""
+        if self.dirty:
+            self._reindex()
+        end = bisect_right(self.starts, day)
+        for block, block_start in enumerate(range(0, end, BLOCK_SIZE)):
+            if self.block_max_end[block] < day:
+                continue
+            for entry in self.entries[block_start:min(block_start + BLOCK_SIZE, end)]:
+                if entry[1] >= day:
+                    yield entry[2], entry[3]
+
+
+class AlertIndex:
+    """In-memory index of active alerts (see module docstring)."""
+
+    FIELDS = (
+        'id', 'user_id', 'pickup_country_id', 'pickup_region_id',
+        'destination_country_id', 'destination_region_id',
+        'from_travel_date', 'to_travel_date',
+        'notify_for_any_pickup_city', 'notify_for_any_destination_city',
+    )
+
+    def __init__(self):
+        self.routes = {}
+        self.locations = {}  # alert_id -> (route, region key, entry) to support updates
+        self.size = 0
+
+    @staticmethod
+    def active_alerts(today):
+        return Alert.objects.filter(is_active=True).filter(
+            Q(to_travel_date__isnull=True) | Q(to_travel_date__gte=today)
+        )
+
+    @classmethod
+    def build(cls, today=None):
+        today = today or timezone.localdate()
+        index = cls()
+        rows = cls.active_alerts(today).order_by().values_list(*cls.FIELDS)
+        for row in rows.iterator(chunk_size=5000):
+            index._insert(row)
+        return index
+
+    def apply(self, rows, today):
+        """Apply created/updated alerts (values_list rows of FIELDS plus is_active)."""
+        for row in rows:
+            self._discard(row[0])
+            *fields, is_active = row
+            to_travel_date = fields[7]
+            if is_active and (to_travel_date is None or to_travel_date >= today):
+                self._insert(fields)
+
+    def _insert(self, row):
+        (alert_id, user_id, pickup_country_id, pickup_region_id,
+         destination_country_id, destination_region_id,
+         from_travel_date, to_travel_date, any_pickup, any_destination) = row
+        route = (pickup_country_id, destination_country_id)
+        region_key = (
+            ANY if any_pickup else pickup_region_id,
+            ANY if any_destination else destination_region_id,
+        )
+        entry = (
+            from_travel_date.toordinal(),
+            to_travel_date.toordinal() if to_travel_date else OPEN_ENDED,
+            alert_id,
+            user_id,
+        )
+        self.routes.setdefault(route, {}).setdefault(region_key, IntervalList()).add(entry)
+        self.locations[alert_id] = (route, region_key, entry)
+        self.size += 1
+
+    def _discard(self, alert_id):
+        location = self.locations.pop(alert_id, None)
+        if location is None:
+            return
+        route, region_key, entry = location
+        self.routes[route][region_key].remove(entry)
+        self.size -= 1
+
+    def match(self, listing):
+        """
+        Return {user_id: [alert_id, ...]} for active alerts matching the listing's
+        route and travel date. The listing owner's own alerts are left out.
+        """
+        by_region = self.routes.get((listing.pickup_country_id, listing.destination_country_id))
+        if not by_region:
+            return {}
+
+        day = listing.travel_date.toordinal()
+        matches = {}
+        for region_key in {
+            (listing.pickup_region_id, listing.destination_region_id),
+            (ANY, listing.destination_region_id),
+            (listing.pickup_region_id, ANY),
+            (ANY, ANY),
+        }:
+            intervals = by_region.get(region_key)
+            if intervals is None:
+                continue
+            for alert_id, user_id in intervals.matching(day):
+                if user_id != listing.user_id:
+                    matches.setdefault(user_id, []).append(alert_id)
+        return matches
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'rebuild': None, 'built_for': None, 'synced_at': None}
+
+
+def get_alert_index():
+    """
+    Return this process's alert index, catching up with alert changes made by
+    other processes since it was last used.
+    """
+    version = cache.get(VERSION_CACHE_KEY)
+    rebuild = cache.get(REBUILD_CACHE_KEY)
+    today = timezone.localdate()
+
+    with _lock:
+        state = _state
+        if state['index'] is None or state['rebuild'] != rebuild or state['built_for'] != today:
+            started = timezone.now()
+            state['index'] = AlertIndex.build(today)
+            state.update(version=version, rebuild=rebuild, built_for=today, synced_at=started)
+            logger.info(f"Built alert index with {state['index'].size} alerts in {timezone.now() - started}")
+        elif state['version'] != version:
+            # Catch up from updated_at, with some slack for transactions that were in flight
+            started = timezone.now()
+            changed = Alert.objects.filter(
+                updated_at__gte=state['synced_at'] - timedelta(minutes=5)
+            ).order_by().values_list(*AlertIndex.FIELDS, 'is_active')
+            state['index'].apply(changed, today)
+            state.update(version=version, synced_at=started)
+        return state['index']
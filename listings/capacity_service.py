@@ -0,0 +1,162 @@
+"""
+Capacity Service for travel listing weight bookkeeping.
+Keeps TravelListing.accepted_weight_kg / available_weight_kg in step with the
+package requests accepted on the listing, under a row lock on the listing.
+"""
+from django.db import transaction
+from decimal import Decimal
+from .models import TravelListing, PackageRequest
+
+
+class InsufficientCapacityError(Exception):
+    """Raised when a travel listing has not enough available weight left."""
+    pass
+
+
+class InvalidStatusTransitionError(Exception):
+    """Raised when a package request is not in a status the requested transition starts from."""
+
+    def __init__(self, current_status, new_status):
+        self.current_status = current_status
+        self.new_status = new_status
+        super().__init__(f"Cannot move package request from '{current_status}' to '{new_status}'.")
+
+
+# target status -> statuses a package request may move there from
+REQUEST_TRANSITIONS = {
+    'accepted': ('pending',),
+    'rejected': ('pending',),
+    'completed': ('accepted',),
+}
+
+
+class CapacityService:
+    """
+    Service class for travel listing capacity.
+    Every change locks the listing row, so concurrent accepts are serialized per listing.
+    """
+
+    @staticmethod
+    def lock_listing(listing_id):
+        """
+        Lock and return the travel listing row. Must be called inside a transaction.
+        """
+        return TravelListing.objects.select_for_update().get(pk=listing_id)
+
+    @staticmethod
+    def lock_request_values(package_request_id):
+        """
+        Lock a package request's listing and then the request row (the order
+        transition_request uses) and return the request's stored tracked values,
+        or None if it doesn't exist. Must be called inside a transaction.
+        """
+        listing_id = PackageRequest.objects.filter(pk=package_request_id).values_list('travel_listing_id', flat=True).first()
+        if listing_id is None:
+            return None
+        CapacityService.lock_listing(listing_id)
+        return PackageRequest.objects.select_for_update().filter(pk=package_request_id).values(
+            *PackageRequest.tracked_fields
+        ).first()
+
+    @staticmethod
+    def counted_weight(status, weight):
+        """Weight a package request in the given status takes from its listing."""
+        return Decimal(weight or 0) if status == 'accepted' else Decimal('0')
+
+    @staticmethod
+    def capacity_status(status, available_weight):
+        """
+        Status of a listing given what is left: published listings without capacity
+        are fully booked, fully booked ones with capacity again are published.
+        """
+        if status == 'published' and available_weight <= 0:
+            return 'fully-booked'
+        if status == 'fully-booked' and available_weight > 0:
+            return 'published'
+        return status
+
+    @staticmethod
+    def _write_capacity(listing):
+        listing.available_weight_kg = listing.maximum_weight_in_kg - listing.accepted_weight_kg
+        listing.status = CapacityService.capacity_status(listing.status, listing.available_weight_kg)
+        # Queryset update: capacity columns are never written through TravelListing.save()
+        TravelListing.objects.filter(pk=listing.pk).update(
+            accepted_weight_kg=listing.accepted_weight_kg,
+            available_weight_kg=listing.available_weight_kg,
+            status=listing.status,
+        )
+        return listing
+
+    @staticmethod
+    @transaction.atomic
+    def apply_weight_delta(listing_id, delta):
+        """
+        Add ``delta`` kg to the accepted weight of a listing (negative values release capacity).
+        The status follows the capacity left (see capacity_status).
+
+        Args:
+            listing_id: TravelListing primary key
+            delta: Weight in kg to add to the accepted weight
+
+        Returns:
+            TravelListing: The locked listing with updated capacity values
+        """
+        listing = CapacityService.lock_listing(listing_id)
+        delta = Decimal(delta)
+        if not delta:
+            return listing
+
+        listing.accepted_weight_kg += delta
+        return CapacityService._write_capacity(listing)
+
+    @staticmethod
+    @transaction.atomic
+    def sync_listing(listing_id):
+        """
+        Recompute the available weight and status of a listing after its maximum
+        weight or status was saved.
+
+        Returns:
+            TravelListing: The locked listing with updated capacity values
+        """
+        return CapacityService._write_capacity(CapacityService.lock_listing(listing_id))
+
+    @staticmethod
+    @transaction.atomic
+    def transition_request(package_request_id, new_status):
+        """
+        Move a package request to ``new_status`` in one short transaction.
+
+        Locks the listing row first and the request row second (the same order on
+        every path), validates the transition against the locked request and, for
+        accepts, the weight against the locked listing. Saving the request runs the
+        pre_save signal, which applies the capacity change and wallet operations
+        using the status read from the locked row.
+
+        Args:
+            package_request_id: PackageRequest primary key
+            new_status: One of the REQUEST_TRANSITIONS targets
+
+        Returns:
+            PackageRequest: The updated package request
+
+        Raises:
+            InvalidStatusTransitionError: If the request is not in an allowed status
+            InsufficientCapacityError: If an accepted request would overbook the listing
+        """
+        listing_id = PackageRequest.objects.values_list('travel_listing_id', flat=True).get(pk=package_request_id)
+        listing = CapacityService.lock_listing(listing_id)
+        package_request = PackageRequest.objects.select_for_update().get(pk=package_request_id)
+        package_request.row_locked = True
+
+        if package_request.status not in REQUEST_TRANSITIONS[new_status]:
+            raise InvalidStatusTransitionError(package_request.status, new_status)
+
+        if new_status == 'accepted' and package_request.weight > listing.available_weight_kg:
+            raise InsufficientCapacityError(
+                f"Cannot accept request. Weight ({package_request.weight}kg) exceeds available capacity ({listing.available_weight_kg}kg)."
+            )
+
+        package_request.status = new_status
+        package_request.save()
+        return package_request
@@ -0,0 +1,82 @@
+"""
+Reference data catalogs: countries, regions, transport types and package types.
+
+Each catalog, the regions of each country and the combined bootstrap payload
+are rendered once into the exact response body (standard response envelope
+included) and kept in a VersionedCache (process-local copy in front of the
+shared cache), together with a strong ETag over the body. Requests are answered
+from there without touching the database, and with 304 Not Modified when the
+client already has the current ETag. Saving or deleting any catalog row
+publishes a new version (see listings.signals), so every process rebuilds
+within CATALOG_LOCAL_SECONDS.
+"""
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from config.utils import standard_response
+from config.versioned_cache import VersionedCache
+
+from .models import Country, PackageType, Region, TransportType
+from .serializers import CountrySerializer, PackageTypeSerializer, RegionSerializer, TransportTypeSerializer
+
+CATALOGS = {
+    'countries': (lambda: Country.objects.all(), CountrySerializer),
+    'regions': (lambda: Region.objects.select_related('country'), RegionSerializer),
+    'transport-types': (lambda: TransportType.objects.order_by('id'), TransportTypeSerializer),
+    'package-types': (lambda: PackageType.objects.order_by('id'), PackageTypeSerializer),
+}
+
+BOOTSTRAP = 'bootstrap'
+
+
+def serialize(name):
+    queryset, serializer_class = CATALOGS[name]
+    return serializer_class(queryset(), many=True).data
+
+
+def render(data):
+    body = JSONRenderer().render(standard_response(data=data).data)
+    return {'body': body, 'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
+
+
+def load(key):
+    """
+    Rendered body and ETag for a cache key: a catalog name, ``bootstrap``, or
+    ``regions:<country id>``.
+    """
+    if key == BOOTSTRAP:
+        return render({name.replace('-', '_'): serialize(name) for name in CATALOGS})
+    if key.startswith('regions:'):
+        regions = Region.objects.filter(country_id=key.split(':', 1)[1]).select_related('country')
+        return render(RegionSerializer(regions, many=True).data)
+    if key == 'countries':
+        # Kept alongside, so per-country lookups for unknown ids are rejected without a query
+        return dict(render(serialize(key)), country_ids=frozenset(Country.objects.values_list('id', flat=True)))
+    return render(serialize(key))
+
+
+catalog_cache = VersionedCache('catalog', load, local_seconds_setting='CATALOG_LOCAL_SECONDS', default_local_seconds=30)
+
+
+def country_exists(country_id):
+    return country_id in catalog_cache.get('countries')['country_ids']
+
+
+def catalog_response(request, key):
+    """
+    Response for a cached catalog, or 304 if the client's If-None-Match has its ETag.
+    """
+    entry = catalog_cache.get(key)
+    # If-None-Match uses the weak comparison, so W/"..." matches as well
+    client_etags = {etag.removeprefix('W/') for etag in parse_etags(request.headers.get('If-None-Match', ''))}
+    if '*' in client_etags or entry['etag'] in client_etags:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    # Clients may keep it, but must revalidate (cheaply, with the ETag) before reuse
+    response['Cache-Control'] = 'public, no-cache'
+    return response
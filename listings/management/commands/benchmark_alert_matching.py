@@ -0,0 +1,64 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from listings.alert_matching import AlertIndex
+
+
+class Command(BaseCommand):
+    help = 'Build an in-memory alert index from synthetic alerts and report match latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerts', type=int, default=300_000, help='Number of synthetic active alerts')
+        parser.add_argument('--countries', type=int, default=30)
+        parser.add_argument('--regions', type=int, default=10, help='Regions per country')
+        parser.add_argument('--wildcard-ratio', type=float, default=0.2, help='Share of alerts with a region wildcard')
+        parser.add_argument('--queries', type=int, default=5000, help='Number of listings to match')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        countries = options['countries']
+        regions = options['regions']
+        wildcard_ratio = options['wildcard_ratio']
+
+        def region_of(country):
+            return country * 1000 + random.randrange(regions)
+
+        index = AlertIndex()
+        started = time.perf_counter()
+        for alert_id in range(1, options['alerts'] + 1):
+            pickup, destination = random.randrange(countries), random.randrange(countries)
+            from_date = today + timedelta(days=random.randint(-60, 180))
+            to_date = None if random.random() < 0.3 else from_date + timedelta(days=random.randint(0, 60))
+            index._insert((
+                alert_id, random.randint(1, 100_000),
+                pickup, region_of(pickup), destination, region_of(destination),
+                from_date, to_date,
+                random.random() < wildcard_ratio, random.random() < wildcard_ratio,
+            ))
+        self.stdout.write(f'indexed {index.size} alerts in {time.perf_counter() - started:.2f}s')
+
+        samples, matched = [], []
+        for _ in range(options['queries']):
+            pickup, destination = random.randrange(countries), random.randrange(countries)
+            listing = SimpleNamespace(
+                user_id=0,
+                pickup_country_id=pickup, pickup_region_id=region_of(pickup),
+                destination_country_id=destination, destination_region_id=region_of(destination),
+                travel_date=today + timedelta(days=random.randint(0, 120)),
+            )
+            started = time.perf_counter()
+            matched.append(len(index.match(listing)))
+            samples.append((time.perf_counter() - started) * 1000)
+
+        samples.sort()
+        percentiles = statistics.quantiles(samples, n=100, method='inclusive')
+        self.stdout.write(
+            f'match n={len(samples)} p50={percentiles[49]:.3f}ms p99={percentiles[98]:.3f}ms '
+            f'max={samples[-1]:.3f}ms avg_users_matched={statistics.mean(matched):.1f}'
+        )
@@ -0,0 +1,159 @@
+import random
+import statistics
+import time
+from datetime import time as dt_time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from listings.models import Country, Region, TransportType, TravelListing
+from listings.search import route_search_queryset
+
+User = get_user_model()
+
+SEED_MARKER = '[route-search-benchmark]'
+SEED_EMAIL = 'route-search-benchmark@example.invalid'
+
+
+class Command(BaseCommand):
+    help = 'Seed travel listings and report p50/p99 latency of the route search query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1_000_000, help='Number of listings to seed (default: 1M)')
+        parser.add_argument('--countries', type=int, default=20, help='Number of benchmark countries')
+        parser.add_argument('--regions', type=int, default=10, help='Regions per benchmark country')
+        parser.add_argument('--queries', type=int, default=500, help='Number of search queries to time')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10_000, help='bulk_create batch size while seeding')
+        parser.add_argument('--explain', action='store_true', help='Print the query plan of one search query')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded benchmark data and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._cleanup()
+            return
+
+        regions = self._seed_locations(options['countries'], options['regions'])
+        self._seed_listings(regions, options['listings'], options['batch_size'])
+
+        region_ids = [region.id for region in regions]
+        page_size = options['page_size']
+        now = timezone.now()
+
+        if options['explain']:
+            queryset = self._search(region_ids, now)[:page_size]
+            self.stdout.write(queryset.explain())
+
+        first_page, deep_page = [], []
+        for _ in range(options['queries']):
+            started = time.perf_counter()
+            list(self._search(region_ids, now)[:page_size])
+            first_page.append(time.perf_counter() - started)
+
+            # What a cursor deep in the result set looks like: seek past a departure point
+            cursor_point = now + timedelta(days=random.randint(30, 300))
+            started = time.perf_counter()
+            list(self._search(region_ids, now).filter(departure_at__gt=cursor_point)[:page_size])
+            deep_page.append(time.perf_counter() - started)
+
+        self._report('first page', first_page)
+        self._report('deep page (cursor)', deep_page)
+
+    def _search(self, region_ids, now):
+        params = {
+            'pickup_region': str(random.choice(region_ids)),
+            'destination_region': str(random.choice(region_ids)),
+        }
+        return route_search_queryset(params, now=now).order_by('departure_at', 'id')
+
+    def _seed_locations(self, country_count, region_count):
+        regions = []
+        for index in range(country_count):
+            country, _ = Country.objects.get_or_create(
+                code=f'Z{index:02d}',
+                defaults={'name': f'Benchmark Country {index}'}
+            )
+            for region_index in range(region_count):
+                region, _ = Region.objects.get_or_create(
+                    country=country,
+                    name=f'Benchmark Region {index}-{region_index}'
+                )
+                regions.append(region)
+        return regions
+
+    def _seed_listings(self, regions, target, batch_size):
+        existing = TravelListing.objects.filter(notes=SEED_MARKER).count()
+        if existing >= target:
+            self.stdout.write(f'{existing} benchmark listings already seeded')
+            return
+
+        user = User.objects.filter(email=SEED_EMAIL).first()
+        if user is None:
+            user = User.objects.create_user(
+                email=SEED_EMAIL,
+                username='route-search-benchmark',
+                phone_number='000000000000',
+            )
+        transport, _ = TransportType.objects.get_or_create(name='Benchmark')
+
+        statuses = ['published'] * 8 + ['drafted', 'fully-booked']
+        today = timezone.now().date()
+        remaining = target - existing
+        started = time.perf_counter()
+        self.stdout.write(f'Seeding {remaining} listings...')
+
+        while remaining > 0:
+            batch = []
+            for _ in range(min(batch_size, remaining)):
+                pickup = random.choice(regions)
+                destination = random.choice(regions)
+                travel_date = today + timedelta(days=random.randint(-30, 365))
+                travel_time = dt_time(random.randint(0, 23), random.choice([0, 15, 30, 45]))
+                weight = Decimal(random.randint(1, 40))
+                batch.append(TravelListing(
+                    user=user,
+                    pickup_country_id=pickup.country_id,
+                    pickup_region=pickup,
+                    destination_country_id=destination.country_id,
+                    destination_region=destination,
+                    travel_date=travel_date,
+                    travel_time=travel_time,
+                    # bulk_create bypasses save(), so departure_at is set explicitly
+                    departure_at=TravelListing.compute_departure_at(travel_date, travel_time),
+                    mode_of_transport=transport,
+                    maximum_weight_in_kg=weight,
+                    available_weight_kg=weight,
+                    price_per_kg=Decimal(random.randint(100, 900)),
+                    status=random.choice(statuses),
+                    notes=SEED_MARKER,
+                ))
+            TravelListing.objects.bulk_create(batch, batch_size=batch_size)
+            remaining -= len(batch)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {TravelListing._meta.db_table}')
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    def _cleanup(self):
+        # Plain DELETE: going through the ORM collector would fire a signal per row
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TravelListing._meta.db_table} WHERE notes = %s', [SEED_MARKER])
+            deleted = cursor.rowcount
+        User.objects.filter(email=SEED_EMAIL).delete()
+        Region.objects.filter(name__startswith='Benchmark Region ').delete()
+        Country.objects.filter(name__startswith='Benchmark Country ').delete()
+        TransportType.objects.filter(name='Benchmark').delete()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} benchmark listings'))
+
+    def _report(self, label, samples):
+        samples_ms = sorted(sample * 1000 for sample in samples)
+        percentiles = statistics.quantiles(samples_ms, n=100, method='inclusive') if len(samples_ms) > 1 else samples_ms * 99
+        self.stdout.write(
+            f'{label:<20} n={len(samples_ms)} '
+            f'p50={percentiles[49]:.2f}ms p99={percentiles[98]:.2f}ms '
+            f'max={samples_ms[-1]:.2f}ms'
+        )
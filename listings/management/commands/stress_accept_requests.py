@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from listings.capacity_service import CapacityService, InsufficientCapacityError
+from listings.models import Country, PackageRequest, Region, TransportType, TravelListing
+
+User = get_user_model()
+
+STRESS_MARKER = '[accept-stress]'
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent accepts at one travel listing and check it is never overbooked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Pending package requests to accept concurrently')
+        parser.add_argument('--capacity', type=int, default=100, help='Listing maximum weight in kg')
+        parser.add_argument('--weight', type=int, default=3, help='Weight of every package request in kg')
+        parser.add_argument('--workers', type=int, default=32, help='Thread pool size')
+        parser.add_argument('--rounds', type=int, default=1, help='Number of independent runs')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            # SQLite ignores select_for_update and serializes writers on a file lock,
+            # so neither the race nor the throughput would be representative
+            raise CommandError('This stress test needs PostgreSQL (row locks are what is being tested).')
+
+        traveler, sender = self._users()
+        failures = 0
+        try:
+            for round_number in range(1, options['rounds'] + 1):
+                listing = self._listing(traveler, options['capacity'])
+                request_ids = self._pending_requests(listing, sender, options['requests'], options['weight'])
+                failures += self._run(round_number, listing, request_ids, options['workers'])
+        finally:
+            if not options['keep']:
+                TravelListing.objects.filter(notes=STRESS_MARKER).delete()
+                User.objects.filter(email__endswith='@accept-stress.invalid').delete()
+
+        if failures:
+            raise CommandError(f'{failures} round(s) overbooked or drifted')
+
+    def _run(self, round_number, listing, request_ids, workers):
+        def accept(request_id):
+            try:
+                CapacityService.transition_request(request_id, 'accepted')
+                return 'accepted'
+            except InsufficientCapacityError:
+                return 'full'
+            finally:
+                # Every worker thread holds its own connection
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(accept, request_ids))
+        elapsed = time.perf_counter() - started
+
+        listing.refresh_from_db()
+        accepted_sum = PackageRequest.objects.filter(
+            travel_listing=listing, status='accepted'
+        ).aggregate(total=Sum('weight'))['total'] or Decimal('0')
+        accepted = outcomes.count('accepted')
+
+        ok = (
+            accepted_sum <= listing.maximum_weight_in_kg
+            and accepted_sum == listing.accepted_weight_kg
+            and listing.available_weight_kg == listing.maximum_weight_in_kg - accepted_sum
+        )
+        self.stdout.write(
+            f'round {round_number}: {len(request_ids)} accepts in {elapsed:.2f}s '
+            f'({len(request_ids) / elapsed:.0f}/s), accepted={accepted} rejected_full={outcomes.count("full")} '
+            f'accepted_kg={accepted_sum}/{listing.maximum_weight_in_kg} '
+            f'counter={listing.accepted_weight_kg} available={listing.available_weight_kg} status={listing.status}'
+        )
+        if ok:
+            self.stdout.write(self.style.SUCCESS(f'round {round_number}: capacity invariant holds'))
+        else:
+            self.stdout.write(self.style.ERROR(f'round {round_number}: capacity invariant violated'))
+        return 0 if ok else 1
+
+    def _users(self):
+        users = []
+        for name in ('traveler', 'sender'):
+            user = User.objects.filter(email=f'{name}@accept-stress.invalid').first()
+            if user is None:
+                user = User.objects.create_user(
+                    email=f'{name}@accept-stress.invalid',
+                    username=f'accept-stress-{name}',
+                    phone_number=f'00000000{len(users)}',
+                )
+            users.append(user)
+        return users
+
+    def _listing(self, traveler, capacity):
+        country, _ = Country.objects.get_or_create(code='ZS', defaults={'name': 'Stress Country'})
+        region, _ = Region.objects.get_or_create(country=country, name='Stress Region')
+        transport, _ = TransportType.objects.get_or_create(name='Stress')
+        return TravelListing.objects.create(
+            user=traveler,
+            pickup_country=country,
+            pickup_region=region,
+            destination_country=country,
+            destination_region=region,
+            travel_date=(timezone.now() + timedelta(days=7)).date(),
+            travel_time=timezone.now().time().replace(microsecond=0),
+            mode_of_transport=transport,
+            maximum_weight_in_kg=Decimal(capacity),
+            price_per_kg=Decimal('100'),
+            status='published',
+            notes=STRESS_MARKER,
+        )
+
+    def _pending_requests(self, listing, sender, count, weight):
+        # bulk_create skips the wallet signals: only the accept path is under test
+        created = PackageRequest.objects.bulk_create([
+            PackageRequest(
+                user=sender,
+                travel_listing=listing,
+                package_description='stress',
+                weight=Decimal(weight),
+                total_price=Decimal('0'),
+                status='pending',
+            )
+            for _ in range(count)
+        ])
+        return [package_request.pk for package_request in created]
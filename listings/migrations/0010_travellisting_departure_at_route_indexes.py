@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:56
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_departure_at(apps, schema_editor):
+    TravelListing = apps.get_model('listings', 'TravelListing')
+    batch = []
+    queryset = TravelListing.objects.only('id', 'travel_date', 'travel_time').order_by('id')
+    for listing in queryset.iterator(chunk_size=2000):
+        listing.departure_at = timezone.make_aware(
+            datetime.combine(listing.travel_date, listing.travel_time)
+        )
+        batch.append(listing)
+        if len(batch) >= 2000:
+            TravelListing.objects.bulk_update(batch, ['departure_at'])
+            batch = []
+    if batch:
+        TravelListing.objects.bulk_update(batch, ['departure_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_remove_travellisting_price_per_file_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='travellisting',
+            name='departure_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_departure_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='travellisting',
+            index=models.Index(fields=['status', 'pickup_region', 'destination_region', 'travel_date', 'travel_time'], name='travel_route_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='travellisting',
+            index=models.Index(fields=['status', 'pickup_region', 'destination_region', 'departure_at'], name='travel_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='travellisting',
+            index=models.Index(fields=['status', 'departure_at'], name='travel_status_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:58
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_capacity(apps, schema_editor):
+    TravelListing = apps.get_model('listings', 'TravelListing')
+    PackageRequest = apps.get_model('listings', 'PackageRequest')
+    accepted_weight = PackageRequest.objects.filter(
+        travel_listing=OuterRef('pk'), status='accepted'
+    ).values('travel_listing').annotate(total=Sum('weight')).values('total')
+    TravelListing.objects.update(
+        accepted_weight_kg=Coalesce(Subquery(accepted_weight), Value(0), output_field=DecimalField())
+    )
+    TravelListing.objects.update(
+        available_weight_kg=F('maximum_weight_in_kg') - F('accepted_weight_kg')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_travellisting_departure_at_route_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='travellisting',
+            name='accepted_weight_kg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='travellisting',
+            name='available_weight_kg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=5),
+        ),
+        migrations.RunPython(backfill_capacity, migrations.RunPython.noop),
+    ]
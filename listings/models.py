@@ -1,10 +1,42 @@
-from django.db import models
+from datetime import datetime
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from users.models import CustomUser
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from config.utils import upload_image, delete_image, optimized_image_url, auto_crop_url
 
+class TrackedFieldsMixin:
+    """
+    Remembers the database values of ``tracked_fields`` (attnames) when an instance is
+    loaded and after every save, so signal handlers can tell what changed without
+    re-fetching the row. Instances loaded with a tracked field deferred are not tracked.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_fields()
+        return instance
+
+    def _remember_tracked_fields(self):
+        if all(name in self.__dict__ for name in self.tracked_fields):
+            self._loaded_values = {name: self.__dict__[name] for name in self.tracked_fields}
+        else:
+            self.__dict__.pop('_loaded_values', None)
+
+    @property
+    def loaded_values(self):
+        """Tracked values as last read from / written to the database, or None if unknown."""
+        return self.__dict__.get('_loaded_values')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_tracked_fields()
+
+
 class TransportType(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField(blank=True)
@@ -14,7 +46,7 @@ class TransportType(models.Model):
     def __str__(self):
         return self.name
 
-class TravelListing(models.Model):
+class TravelListing(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('drafted', 'Drafted'),
         ('published', 'Published'),
@@ -32,6 +64,10 @@ class TravelListing(models.Model):
     travel_time = models.TimeField()
     mode_of_transport = models.ForeignKey(TransportType, on_delete=models.PROTECT)
     maximum_weight_in_kg = models.DecimalField(max_digits=5, decimal_places=2)
+    # Weight of the package requests currently accepted on this listing, and what is left.
+    # Owned by CapacityService: plain saves never write these columns back.
+    accepted_weight_kg = models.DecimalField(max_digits=5, decimal_places=2, default=0, editable=False)
+    available_weight_kg = models.DecimalField(max_digits=5, decimal_places=2, default=0, editable=False)
     notes = models.TextField(blank=True)
     price_per_kg = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     price_per_document = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -41,11 +77,70 @@ class TravelListing(models.Model):
     price_full_suitcase = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     currency = models.CharField(max_length=10, default='ETB')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='published')
+    # travel_date + travel_time combined, so "not yet started" is a single range predicate
+    departure_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'pickup_region', 'destination_region', 'travel_date', 'travel_time'],
+                name='travel_route_date_idx',
+            ),
+            models.Index(
+                fields=['status', 'pickup_region', 'destination_region', 'departure_at'],
+                name='travel_route_departure_idx',
+            ),
+            models.Index(fields=['status', 'departure_at'], name='travel_status_departure_idx'),
+        ]
+
     def __str__(self):
         return f"{self.pickup_country.name} to {self.destination_country.name} - {self.travel_date}"
+
+    @staticmethod
+    def compute_departure_at(travel_date, travel_time):
+        """Combine a travel date and time into an aware datetime."""
+        if travel_date is None or travel_time is None:
+            return None
+        return timezone.make_aware(datetime.combine(travel_date, travel_time))
+
+    tracked_fields = ('status',)
+    CAPACITY_FIELDS = ('accepted_weight_kg', 'available_weight_kg')
+
+    def save(self, *args, **kwargs):
+        self.departure_at = self.compute_departure_at(self.travel_date, self.travel_time)
+
+        if self._state.adding:
+            self.available_weight_kg = self.maximum_weight_in_kg - self.accepted_weight_kg
+            super().save(*args, **kwargs)
+            return
+
+        from .capacity_service import CapacityService
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            # Don't write back capacity values that may have been changed by a concurrent accept,
+            # nor a status the caller didn't change (it may have become 'fully-booked' meanwhile)
+            skipped = set(self.CAPACITY_FIELDS)
+            if self.loaded_values is not None and self.loaded_values['status'] == self.status:
+                skipped.add('status')
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
+        elif {'travel_date', 'travel_time'} & set(update_fields):
+            update_fields = set(update_fields) | {'departure_at'}
+        kwargs['update_fields'] = update_fields
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if {'maximum_weight_in_kg', 'status'} & set(update_fields):
+                listing = CapacityService.sync_listing(self.pk)
+                self.available_weight_kg = listing.available_weight_kg
+                self.accepted_weight_kg = listing.accepted_weight_kg
+                self.status = listing.status
+        self._remember_tracked_fields()
     
 
 class PackageType(models.Model):
@@ -57,7 +152,7 @@ class PackageType(models.Model):
     def __str__(self):
         return self.name
 
-class PackageRequest(models.Model):
+class PackageRequest(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'), # by user who created the package request
         ('accepted', 'Accepted'), # accepted by owner of the travel_listing
@@ -83,9 +178,20 @@ class PackageRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('status', 'weight', 'travel_listing_id')
+    # Set by CapacityService on an instance read with select_for_update in the current
+    # transaction: the pre_save signal can then trust loaded_values without re-reading the row
+    row_locked = False
+
     def __str__(self):
         return f"Package request from {self.user.username} for {self.travel_listing}"
 
+    def save(self, *args, **kwargs):
+        # One transaction with the capacity and wallet bookkeeping of the pre_save signal
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self.row_locked = False
+
 class ListingImage(models.Model):
     travel_listing = models.ForeignKey(TravelListing, on_delete=models.CASCADE, related_name='images', null=True, blank=True)
     package_request = models.ForeignKey(PackageRequest, on_delete=models.CASCADE, related_name='images', null=True, blank=True)
@@ -148,7 +254,7 @@ class Region(models.Model):
         unique_together = ['name', 'country']
         ordering = ['country', 'name']
 
-class Review(models.Model):
+class Review(TrackedFieldsMixin, models.Model):
     travel_listing = models.ForeignKey('TravelListing', on_delete=models.CASCADE, related_name='reviews')
     package_request = models.ForeignKey('PackageRequest', on_delete=models.CASCADE, related_name='reviews')
     reviewer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
@@ -156,6 +262,8 @@ class Review(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    tracked_fields = ('rate', 'travel_listing_id')
+
     class Meta:
         unique_together = ('travel_listing', 'reviewer')
         ordering = ['-created_at']
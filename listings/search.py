@@ -0,0 +1,68 @@
+"""
+Route search for travel listings.
+
+The search path only looks at published listings that have not departed yet
+and pages through them with a keyset cursor on ``departure_at``, so every page
+is an index range scan instead of a sequential scan followed by an OFFSET.
+"""
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from rest_framework.pagination import CursorPagination
+
+from .models import TravelListing
+
+# query param -> model field, all of them covered by the route indexes
+ROUTE_FILTERS = {
+    'pickup_country': 'pickup_country_id',
+    'pickup_region': 'pickup_region_id',
+    'destination_country': 'destination_country_id',
+    'destination_region': 'destination_region_id',
+}
+
+
+class RouteSearchPagination(CursorPagination):
+    """Keyset pagination ordered by departure (id breaks ties)."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('departure_at', 'id')
+
+
+def route_search_queryset(params, now=None):
+    """
+    Build the route search queryset from request query params.
+
+    Supported params: pickup_country, pickup_region, destination_country,
+    destination_region (IDs), travel_date (YYYY-MM-DD, departures on or
+    after that day) and min_available_kg. Raises ValueError on malformed values.
+    """
+    now = now or timezone.now()
+    queryset = TravelListing.objects.filter(status='published', departure_at__gt=now)
+
+    travel_date = params.get('travel_date')
+    if travel_date:
+        date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
+        queryset = queryset.filter(departure_at__gte=timezone.make_aware(datetime.combine(date_obj, time.min)))
+
+    for param, field in ROUTE_FILTERS.items():
+        value = params.get(param)
+        if value:
+            queryset = queryset.filter(**{field: int(value)})
+
+    min_available_kg = params.get('min_available_kg')
+    if min_available_kg:
+        try:
+            queryset = queryset.filter(available_weight_kg__gte=Decimal(min_available_kg))
+        except InvalidOperation:
+            raise ValueError(f"Invalid min_available_kg: {min_available_kg}")
+
+    return queryset.select_related(
+        'user__profile__city_of_residence__country',
+        'user__profile__id_type',
+        'user__profile__issue_country',
+        'pickup_region__country',
+        'destination_region__country',
+        'mode_of_transport',
+    )
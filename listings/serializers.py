@@ -2,7 +2,7 @@ from rest_framework import serializers
 from .models import TravelListing, PackageRequest, Alert, Country, Region, TransportType, PackageType, Review
 from decimal import Decimal
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import Q
 
 class CountrySerializer(serializers.ModelSerializer):
     class Meta:
@@ -51,11 +51,14 @@ class TravelListingSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'pickup', 'pickup_region_id', 'destination', 'destination_region_id',
             'travel_date', 'travel_time', 'mode_of_transport', 'mode_of_transport_id', 'maximum_weight_in_kg',
-            'notes', 'price_per_kg', 'price_per_document', 'price_per_phone',
+            'accepted_weight_kg', 'available_weight_kg', 'notes', 'price_per_kg', 'price_per_document', 'price_per_phone',
             'price_per_tablet', 'price_per_pc', 'price_full_suitcase', 'currency', 'status',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['user', 'created_at', 'updated_at', 'pickup', 'destination', 'mode_of_transport']
+        read_only_fields = [
+            'user', 'created_at', 'updated_at', 'pickup', 'destination', 'mode_of_transport',
+            'accepted_weight_kg', 'available_weight_kg'
+        ]
 
     def validate(self, data):
         """
@@ -80,6 +83,12 @@ class TravelListingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "At least one pricing method (e.g., price per kg, per document, or full suitcase) must be provided."
             )
+
+        maximum_weight = data.get('maximum_weight_in_kg')
+        if self.instance and maximum_weight is not None and maximum_weight < self.instance.accepted_weight_kg:
+            raise serializers.ValidationError({
+                "maximum_weight_in_kg": f"Cannot be lower than the weight already accepted ({self.instance.accepted_weight_kg}kg)."
+            })
         
         # Check wallet balance for listing creation
         request = self.context.get('request')
@@ -195,18 +204,14 @@ class PackageRequestSerializer(serializers.ModelSerializer):
                     "travel_listing": "You cannot create a package request for a travel that has already started."
                 })
             # Check available weight
-            # Sum accepted package weights for this travel listing
-            from listings.models import PackageRequest
-            accepted_weight = PackageRequest.objects.filter(
-                travel_listing=travel_listing, status='accepted'
-            ).aggregate(Sum('weight'))['weight__sum'] or Decimal('0.0')
+            available_weight = travel_listing.available_weight_kg
             
             # If we are updating an existing request that is already accepted, 
-            # we should not count its own weight in the accepted_weight sum
-            if self.instance and self.instance.status == 'accepted':
-                accepted_weight -= self.instance.weight
+            # its own weight is part of the accepted weight and should be given back
+            if (self.instance and self.instance.status == 'accepted'
+                    and self.instance.travel_listing_id == travel_listing.id):
+                available_weight += self.instance.weight
 
-            available_weight = travel_listing.maximum_weight_in_kg - accepted_weight
             if Decimal(weight) > available_weight:
                 raise serializers.ValidationError({
                     "weight": f"Requested weight ({weight}kg) exceeds available capacity ({available_weight}kg)."
@@ -4,9 +4,15 @@ Handles wallet operations and profile statistics updates.
 """
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import PackageRequest, Review, TravelListing
+from .models import Alert, Country, PackageRequest, PackageType, Region, Review, TransportType, TravelListing
+from .catalog import catalog_cache
 from money.wallet_service import WalletService
-from django.db.models import Avg, Count, Q
+from .capacity_service import CapacityService
+from .alert_matching import bump_alert_index_rebuild, bump_alert_index_version
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Round
+from users.models import Profile
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,150 +31,277 @@ def handle_package_request_status_change(sender, instance, **kwargs):
     - When status changes to 'rejected': Refund locked amount to requester
     """
     if not instance.pk:
-        # New instance, skip
+        # New instance: only capacity bookkeeping applies
+        update_listing_capacity(None, instance)
         return
-    
-    try:
-        # Get the old instance from database
-        old_instance = PackageRequest.objects.get(pk=instance.pk)
-        
-        # Check if status has changed
-        if old_instance.status != instance.status:
-            logger.info(
-                f"PackageRequest #{instance.pk} status changed from {old_instance.status} to {instance.status}"
-            )
-            
-            # Handle status change to 'completed'
-            if instance.status == 'completed' and old_instance.status == 'accepted':
-                logger.info(f"Releasing payment for PackageRequest #{instance.pk}")
-                try:
-                    WalletService.release_payment_to_traveler(instance)
-                    logger.info(f"Payment released successfully for PackageRequest #{instance.pk}")
-                except Exception as e:
-                    logger.error(f"Failed to release payment for PackageRequest #{instance.pk}: {str(e)}")
-                    raise
-            
-            # Handle status change to 'rejected'
-            elif instance.status == 'rejected' and old_instance.status in ['pending', 'accepted']:
-                logger.info(f"Refunding locked amount for PackageRequest #{instance.pk}")
-                try:
-                    WalletService.refund_locked_amount(instance)
-                    logger.info(f"Refund processed successfully for PackageRequest #{instance.pk}")
-                except Exception as e:
-                    logger.error(f"Failed to refund for PackageRequest #{instance.pk}: {str(e)}")
-                    raise
-                    
-    except PackageRequest.DoesNotExist:
+
+    # CapacityService hands over the row it locked; any other save (serializer, admin)
+    # may hold a snapshot older than a concurrent transition, so lock and re-read the row
+    # (PackageRequest.save() runs this inside its transaction).
+    if instance.row_locked and instance.loaded_values is not None:
+        old_values = instance.loaded_values
+    else:
+        old_values = CapacityService.lock_request_values(instance.pk)
+    # count_package_request_saved diffs against these, not the possibly stale snapshot
+    instance._pre_save_values = old_values
+    if old_values is None:
         # This shouldn't happen, but just in case
         logger.warning(f"PackageRequest #{instance.pk} not found in database during pre_save")
+        return
+
+    update_listing_capacity(old_values, instance)
+
+    old_status = old_values['status']
+    # Check if status has changed
+    if old_status != instance.status:
+        logger.info(
+            f"PackageRequest #{instance.pk} status changed from {old_status} to {instance.status}"
+        )
+
+        # Handle status change to 'completed'
+        if instance.status == 'completed' and old_status == 'accepted':
+            logger.info(f"Releasing payment for PackageRequest #{instance.pk}")
+            try:
+                WalletService.release_payment_to_traveler(instance)
+                logger.info(f"Payment released successfully for PackageRequest #{instance.pk}")
+            except Exception as e:
+                logger.error(f"Failed to release payment for PackageRequest #{instance.pk}: {str(e)}")
+                raise
+
+        # Handle status change to 'rejected'
+        elif instance.status == 'rejected' and old_status in ['pending', 'accepted']:
+            logger.info(f"Refunding locked amount for PackageRequest #{instance.pk}")
+            try:
+                WalletService.refund_locked_amount(instance)
+                logger.info(f"Refund processed successfully for PackageRequest #{instance.pk}")
+            except Exception as e:
+                logger.error(f"Failed to refund for PackageRequest #{instance.pk}: {str(e)}")
+                raise
+
+
+def update_listing_capacity(old_values, instance):
+    """
+    Move the weight of a package request in or out of its listing's accepted weight
+    when it enters or leaves the 'accepted' status (or its weight/listing changes while accepted).
+
+    ``old_values`` holds the stored status, weight and travel_listing_id (None for new requests).
+    """
+    new_weight = CapacityService.counted_weight(instance.status, instance.weight)
+    if old_values is None:
+        if new_weight:
+            CapacityService.apply_weight_delta(instance.travel_listing_id, new_weight)
+        return
+
+    old_weight = CapacityService.counted_weight(old_values['status'], old_values['weight'])
+    old_listing_id = old_values['travel_listing_id']
+    if old_listing_id != instance.travel_listing_id:
+        if old_weight:
+            CapacityService.apply_weight_delta(old_listing_id, -old_weight)
+        if new_weight:
+            CapacityService.apply_weight_delta(instance.travel_listing_id, new_weight)
+    elif new_weight != old_weight:
+        CapacityService.apply_weight_delta(instance.travel_listing_id, new_weight - old_weight)
+
+
+@receiver(post_delete, sender=PackageRequest)
+def release_capacity_on_delete(sender, instance, **kwargs):
+    """Give the weight of a deleted accepted package request back to its listing."""
+    weight = CapacityService.counted_weight(instance.status, instance.weight)
+    if not weight:
+        return
+    try:
+        CapacityService.apply_weight_delta(instance.travel_listing_id, -weight)
+    except TravelListing.DoesNotExist:
+        # The listing itself is being deleted
         pass
 
 
+# ============================================================================
+# ALERT MATCHING
+# ============================================================================
+
+@receiver(post_save, sender=TravelListing)
+def match_alerts_on_publish(sender, instance, created, **kwargs):
+    """Queue alert matching when a travel listing is published for the first time."""
+    if instance.status != 'published':
+        return
+    old_values = instance.loaded_values
+    if created or (old_values is not None and old_values['status'] == 'drafted'):
+        from .tasks import notify_matching_alerts
+        transaction.on_commit(lambda: notify_matching_alerts.delay(instance.pk))
+
+
+@receiver(post_save, sender=Alert)
+def refresh_alert_index_on_save(sender, instance, **kwargs):
+    """Let the alert indexes in every process pick up the created/updated alert."""
+    transaction.on_commit(bump_alert_index_version)
+
+
+@receiver(post_delete, sender=Alert)
+def refresh_alert_index_on_delete(sender, instance, **kwargs):
+    """Deleted alerts leave nothing to catch up from: have the indexes rebuilt."""
+    transaction.on_commit(bump_alert_index_rebuild)
+
+
 # ============================================================================
 # PROFILE STATISTICS UPDATES
 # ============================================================================
+# Counters are maintained as deltas (F() updates) applied once the surrounding
+# transaction commits. The recalculate_profile_stats command rebuilds them from
+# scratch and is the reconciliation job if they ever drift.
+
+def bump_profile_counters(user_id, **deltas):
+    """Add the given deltas to the user's profile counters after the current transaction commits."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not user_id or not deltas:
+        return
+
+    def apply():
+        Profile.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        logger.info(f"Updated profile counters for user #{user_id}: {deltas}")
+
+    transaction.on_commit(apply)
+
+
+def bump_profile_rating(user_id, rate_delta, count_delta):
+    """
+    Add to the user's running rating (sum + count) after the current transaction
+    commits; average_rating is derived from both in the same UPDATE.
+    """
+    if not user_id or not (rate_delta or count_delta):
+        return
+
+    def apply():
+        new_sum = F('rating_sum') + rate_delta
+        new_count = F('total_rating_received') + count_delta
+        Profile.objects.filter(user_id=user_id).update(
+            rating_sum=new_sum,
+            total_rating_received=new_count,
+            average_rating=Case(
+                When(
+                    Q(total_rating_received__gt=-count_delta),
+                    # ROUND(x, 2) needs a numeric argument on PostgreSQL
+                    then=Round(Cast(Cast(new_sum, FloatField()) / new_count, DecimalField(max_digits=12, decimal_places=4)), 2),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+        logger.info(f"Updated rating for user #{user_id}: sum {rate_delta:+d}, count {count_delta:+d}")
+
+    transaction.on_commit(apply)
+
+
+def listing_owner_id(listing_id):
+    """User id of a travel listing's owner (None if the listing is gone)."""
+    return TravelListing.objects.filter(pk=listing_id).values_list('user_id', flat=True).first()
+
+
+def traveler_id_for(instance):
+    """Owner of the instance's travel listing, without a query when the listing is already loaded."""
+    if instance._meta.get_field('travel_listing').is_cached(instance):
+        return instance.travel_listing.user_id
+    return listing_owner_id(instance.travel_listing_id)
+
 
 @receiver(post_save, sender=TravelListing)
+def count_trip_created(sender, instance, created, **kwargs):
+    """Count a new travel listing in its owner's total_trips_created."""
+    if created:
+        bump_profile_counters(instance.user_id, total_trips_created=1)
+
+
 @receiver(post_delete, sender=TravelListing)
-def update_total_trips_created(sender, instance, **kwargs):
-    """Update total_trips_created when a travel listing is created or deleted."""
-    try:
-        profile = instance.user.profile
-        profile.total_trips_created = TravelListing.objects.filter(user=instance.user).count()
-        profile.save(update_fields=['total_trips_created'])
-        logger.info(f"Updated total_trips_created for {instance.user.username}: {profile.total_trips_created}")
-    except Exception as e:
-        logger.error(f"Failed to update total_trips_created: {str(e)}")
+def count_trip_deleted(sender, instance, **kwargs):
+    """Remove a deleted travel listing from its owner's total_trips_created."""
+    bump_profile_counters(instance.user_id, total_trips_created=-1)
 
 
 @receiver(post_save, sender=PackageRequest)
-@receiver(post_delete, sender=PackageRequest)
-def update_offer_counts(sender, instance, **kwargs):
+def count_package_request_saved(sender, instance, created, **kwargs):
     """
-    Update total_offer_sent and total_offer_received when package requests change.
+    Maintain total_offer_sent, total_offer_received and total_completed_deliveries.
     - total_offer_sent: Package requests created by the user
     - total_offer_received: Package requests for the user's travel listings
+    - total_completed_deliveries: Completed package requests for the user's travel listings
     """
-    try:
-        # Update requester's total_offer_sent
-        requester_profile = instance.user.profile
-        requester_profile.total_offer_sent = PackageRequest.objects.filter(user=instance.user).count()
-        requester_profile.save(update_fields=['total_offer_sent'])
-        logger.info(f"Updated total_offer_sent for {instance.user.username}: {requester_profile.total_offer_sent}")
-        
-        # Update traveler's total_offer_received
-        traveler = instance.travel_listing.user
-        traveler_profile = traveler.profile
-        traveler_profile.total_offer_received = PackageRequest.objects.filter(
-            travel_listing__user=traveler
-        ).count()
-        traveler_profile.save(update_fields=['total_offer_received'])
-        logger.info(f"Updated total_offer_received for {traveler.username}: {traveler_profile.total_offer_received}")
-        
-    except Exception as e:
-        logger.error(f"Failed to update offer counts: {str(e)}")
+    completed = 1 if instance.status == 'completed' else 0
+    if created:
+        traveler_id = traveler_id_for(instance)
+        bump_profile_counters(instance.user_id, total_offer_sent=1)
+        bump_profile_counters(traveler_id, total_offer_received=1, total_completed_deliveries=completed)
+        return
 
+    # The row as handle_package_request_status_change read it under lock
+    old_values = instance.__dict__.pop('_pre_save_values', None)
+    if old_values is None:
+        # Row was missing when the save started: nothing to diff against
+        return
+    was_completed = 1 if old_values['status'] == 'completed' else 0
+    old_listing_id = old_values['travel_listing_id']
 
-@receiver(post_save, sender=PackageRequest)
-@receiver(post_delete, sender=PackageRequest)
-def update_completed_deliveries(sender, instance, **kwargs):
-    """
-    Update total_completed_deliveries for the traveler when package requests are completed.
-    Only counts completed package requests.
-    """
-    try:
-        traveler = instance.travel_listing.user
-        traveler_profile = traveler.profile
-        
-        # Count completed deliveries for this traveler
-        traveler_profile.total_completed_deliveries = PackageRequest.objects.filter(
-            travel_listing__user=traveler,
-            status='completed'
-        ).count()
-        
-        traveler_profile.save(update_fields=['total_completed_deliveries'])
-        logger.info(
-            f"Updated total_completed_deliveries for {traveler.username}: "
-            f"{traveler_profile.total_completed_deliveries}"
+    if old_listing_id != instance.travel_listing_id:
+        old_traveler_id = listing_owner_id(old_listing_id)
+        new_traveler_id = traveler_id_for(instance)
+        if old_traveler_id != new_traveler_id:
+            bump_profile_counters(old_traveler_id, total_offer_received=-1, total_completed_deliveries=-was_completed)
+            bump_profile_counters(new_traveler_id, total_offer_received=1, total_completed_deliveries=completed)
+            return
+    if completed != was_completed:
+        bump_profile_counters(
+            traveler_id_for(instance),
+            total_completed_deliveries=completed - was_completed,
         )
-        
-    except Exception as e:
-        logger.error(f"Failed to update completed deliveries: {str(e)}")
+
+
+@receiver(post_delete, sender=PackageRequest)
+def count_package_request_deleted(sender, instance, **kwargs):
+    """Remove a deleted package request from the requester's and traveler's counters."""
+    completed = 1 if instance.status == 'completed' else 0
+    bump_profile_counters(instance.user_id, total_offer_sent=-1)
+    bump_profile_counters(
+        traveler_id_for(instance),
+        total_offer_received=-1,
+        total_completed_deliveries=-completed,
+    )
 
 
 @receiver(post_save, sender=Review)
-@receiver(post_delete, sender=Review)
-def update_traveler_rating(sender, instance, **kwargs):
+def rate_traveler_on_review_saved(sender, instance, created, **kwargs):
     """
-    Update the travel listing owner's profile rating when a review is created, updated, or deleted.
+    Update the travel listing owner's running rating when a review is created or updated.
     Reviews are given by package requesters to travelers (listing owners).
     """
-    try:
-        # Get the traveler (travel listing owner)
-        traveler = instance.travel_listing.user
-        
-        # Calculate new ratings from all reviews for this traveler's listings
-        traveler_listings = TravelListing.objects.filter(user=traveler)
-        
-        # Get all reviews for this traveler's listings
-        reviews = Review.objects.filter(travel_listing__in=traveler_listings)
-        
-        # Calculate average rating and total count
-        stats = reviews.aggregate(
-            avg_rating=Avg('rate'),
-            total_reviews=Count('id')
-        )
-        
-        # Update the traveler's profile
-        profile = traveler.profile
-        profile.average_rating = round(stats['avg_rating'], 2) if stats['avg_rating'] else 0.0
-        profile.total_rating_received = stats['total_reviews'] or 0
-        profile.save(update_fields=['average_rating', 'total_rating_received'])
-        
-        logger.info(
-            f"Updated ratings for {traveler.username}: "
-            f"avg_rating={profile.average_rating}, total_reviews={profile.total_rating_received}"
-        )
-        
-    except Exception as e:
-        logger.error(f"Failed to update traveler rating: {str(e)}")
+    if created:
+        bump_profile_rating(traveler_id_for(instance), instance.rate, 1)
+        return
+
+    old_values = instance.loaded_values
+    if old_values is None:
+        return
+    if old_values['travel_listing_id'] != instance.travel_listing_id:
+        bump_profile_rating(listing_owner_id(old_values['travel_listing_id']), -old_values['rate'], -1)
+        bump_profile_rating(traveler_id_for(instance), instance.rate, 1)
+    elif old_values['rate'] != instance.rate:
+        bump_profile_rating(traveler_id_for(instance), instance.rate - old_values['rate'], 0)
+
+
+@receiver(post_delete, sender=Review)
+def rate_traveler_on_review_deleted(sender, instance, **kwargs):
+    """Take a deleted review out of the travel listing owner's running rating."""
+    bump_profile_rating(traveler_id_for(instance), -instance.rate, -1)
+
+
+# ============================================================================
+# CATALOG CACHE
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender=TransportType)
+@receiver([post_save, post_delete], sender=PackageType)
+def invalidate_catalog(sender, instance, **kwargs):
+    # After commit, so no process can cache the old rows under the new version
+    transaction.on_commit(catalog_cache.invalidate)
@@ -0,0 +1,45 @@
+from celery import shared_task
+from .models import TravelListing
+from .alert_matching import get_alert_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 1000
+
+
+@shared_task
+def notify_matching_alerts(listing_id):
+    """
+    Notify the owners of active alerts matching a newly published travel listing.
+    One notification per user, however many of their alerts match.
+    """
+    from messaging.notification_service import NotificationService
+
+    listing = TravelListing.objects.select_related(
+        'pickup_country', 'destination_country'
+    ).filter(pk=listing_id, status='published').first()
+    if listing is None:
+        return 0
+
+    matches = get_alert_index().match(listing)
+    if not matches:
+        return 0
+
+    message = (
+        f"A new travel listing matches your alert: "
+        f"{listing.pickup_country.name} to {listing.destination_country.name} - {listing.travel_date}"
+    )
+    user_ids = list(matches)
+    for start in range(0, len(user_ids), NOTIFICATION_BATCH_SIZE):
+        # Already in a worker: push inline rather than through another task
+        NotificationService.dispatch(
+            [
+                (user_id, {'message': message, 'travel_listing_id': listing.id})
+                for user_id in user_ids[start:start + NOTIFICATION_BATCH_SIZE]
+            ],
+            defer_push=False,
+        )
+
+    logger.info(f"Travel listing #{listing_id} matched alerts of {len(user_ids)} users")
+    return len(user_ids)
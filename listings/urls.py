@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     TravelListingViewSet, PackageRequestViewSet, AlertViewSet,
-    CountryViewSet, RegionViewSet, ReviewViewSet, TransportTypeViewset, PackageTypeViewSet
+    CountryViewSet, RegionViewSet, ReviewViewSet, TransportTypeViewset, PackageTypeViewSet,
+    CatalogBootstrapView, CatalogView
 )
 
 router = DefaultRouter()
@@ -16,5 +17,7 @@ router.register(r'transport-types', TransportTypeViewset, basename='transport-ty
 router.register(r'package-types', PackageTypeViewSet, basename='package-type')
 
 urlpatterns = [
+    path('catalog/bootstrap/', CatalogBootstrapView.as_view(), name='catalog-bootstrap'),
+    path('catalog/<slug:name>/', CatalogView.as_view(), name='catalog'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -4,19 +4,21 @@ from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
-from django.db.models import Q, Sum
+from django.db.models import Q
 from datetime import datetime
 from .models import TravelListing, PackageRequest, Alert, Country, Region, Review
 from .serializers import TravelListingSerializer, PackageRequestSerializer, AlertSerializer, CountrySerializer, RegionSerializer, ReviewSerializer, TransportTypeSerializer, PackageTypeSerializer
-from config.views import StandardResponseViewSet
+from .search import RouteSearchPagination, route_search_queryset
+from .capacity_service import CapacityService, InsufficientCapacityError, InvalidStatusTransitionError
+from .catalog import BOOTSTRAP, CATALOGS, catalog_response, country_exists
+from config.views import StandardResponseViewSet, StandardAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import status
-from messaging.models import Conversation, Message, Notification
-from decimal import Decimal
+from messaging.models import Conversation, Message
+from decimal import Decimal, InvalidOperation
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from messaging.serializers import NotificationSerializer
-from messaging.utils import send_notification_to_user
+from messaging.notification_service import NotificationService
 from listings.models import TransportType, PackageType
 from reporting.models import EventLog
 # Create your views here.
@@ -100,6 +102,7 @@ class TravelListingViewSet(StandardResponseViewSet):
         - destination_country_name: Name (or partial name) of the destination country
         - destination_region_name: Name (or partial name) of the destination region
         - travel_date: listings with travel_date >= this date (YYYY-MM-DD)
+        - min_available_kg: listings with at least this much weight still available
         - status: filter by status
         """
         queryset = TravelListing.objects.all()
@@ -112,6 +115,7 @@ class TravelListingViewSet(StandardResponseViewSet):
         destination_country_name = self.request.query_params.get('destination_country_name', None)
         destination_region_name = self.request.query_params.get('destination_region_name', None)
         travel_date = self.request.query_params.get('travel_date', None)
+        min_available_kg = self.request.query_params.get('min_available_kg', None)
         status = self.request.query_params.get('status', None)
 
         # Apply visibility rules
@@ -141,17 +145,10 @@ class TravelListingViewSet(StandardResponseViewSet):
         now = timezone.now()
         if self.request.user.is_authenticated:
             queryset = queryset.filter(
-                Q(user=self.request.user) |
-                (
-                    Q(travel_date__gt=now.date()) |
-                    Q(travel_date=now.date(), travel_time__gt=now.time())
-                )
+                Q(user=self.request.user) | Q(departure_at__gt=now)
             )
         else:
-            queryset = queryset.filter(
-                Q(travel_date__gt=now.date()) |
-                Q(travel_date=now.date(), travel_time__gt=now.time())
-            )
+            queryset = queryset.filter(departure_at__gt=now)
 
         # Apply additional filters using IDs
         if pickup_country:
@@ -180,8 +177,48 @@ class TravelListingViewSet(StandardResponseViewSet):
             except ValueError:
                 return TravelListing.objects.none()
 
+        if min_available_kg:
+            try:
+                queryset = queryset.filter(available_weight_kg__gte=Decimal(min_available_kg))
+            except InvalidOperation:
+                return TravelListing.objects.none()
+
         return queryset
 
+    @extend_schema(
+        tags=['Travel Listings'],
+        description="Search upcoming published travel listings on a route, ordered by departure. "
+                    "Uses cursor pagination: follow the `next`/`previous` links instead of page numbers.",
+        parameters=[
+            OpenApiParameter('pickup_country', OpenApiTypes.INT, description='ID of the pickup country'),
+            OpenApiParameter('pickup_region', OpenApiTypes.INT, description='ID of the pickup region'),
+            OpenApiParameter('destination_country', OpenApiTypes.INT, description='ID of the destination country'),
+            OpenApiParameter('destination_region', OpenApiTypes.INT, description='ID of the destination region'),
+            OpenApiParameter('travel_date', OpenApiTypes.DATE, description='Departures on or after this date (YYYY-MM-DD)'),
+            OpenApiParameter('min_available_kg', OpenApiTypes.DECIMAL, description='Minimum weight (kg) still available on the listing'),
+            OpenApiParameter('page_size', OpenApiTypes.INT, description='Number of results per page (max 100)'),
+        ],
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Route search over published listings that have not departed yet.
+        """
+        try:
+            queryset = route_search_queryset(request.query_params)
+        except ValueError:
+            return self._standardize_response(
+                Response(
+                    {"detail": "Invalid search parameters."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            )
+
+        paginator = RouteSearchPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @extend_schema(tags=['Travel Listings'], description="Get all travel listings created by the current user")
     @action(detail=False, methods=['get'])
     def my_listings(self, request):
@@ -418,55 +455,34 @@ class PackageRequestViewSet(StandardResponseViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if request is in pending status
-        if package_request.status != 'pending':
+        # Status, capacity and the request/listing updates are checked and written
+        # under row locks, so concurrent accepts cannot overbook the listing
+        try:
+            package_request = CapacityService.transition_request(package_request.pk, 'accepted')
+        except InvalidStatusTransitionError as e:
             return Response(
                 {
                     "status": "FAILED",
                     "data": {},
                     "status_code": status.HTTP_400_BAD_REQUEST,
-                    "error": [f"Cannot accept request in '{package_request.status}' status."]
+                    "error": [f"Cannot accept request in '{e.current_status}' status."]
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        # Update travel listing status if fully booked
-        travel_listing = package_request.travel_listing
-        accepted_weight = PackageRequest.objects.filter(
-            travel_listing=travel_listing, status='accepted'
-        ).aggregate(Sum('weight'))['weight__sum'] or Decimal('0.0')
-        
-        available_weight = travel_listing.maximum_weight_in_kg - accepted_weight
-        
-        if package_request.weight > available_weight:
+        except InsufficientCapacityError as e:
             return self._standardize_response(
                 Response(
-                    {"detail": f"Cannot accept request. Weight ({package_request.weight}kg) exceeds available capacity ({available_weight}kg)."},
+                    {"detail": str(e)},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             )
 
-        package_request.status = 'accepted'
-        package_request.save()
-        
-        # Re-calculate accepted weight after saving this request
-        accepted_weight = PackageRequest.objects.filter(
-            travel_listing=travel_listing, status='accepted'
-        ).aggregate(Sum('weight'))['weight__sum'] or Decimal('0.0')
-        
-        available_weight = travel_listing.maximum_weight_in_kg - accepted_weight
-        if available_weight <= 0:
-            travel_listing.status = 'fully-booked'
-            travel_listing.save()
         serializer = self.get_serializer(package_request)
         # Send notification to package request owner
-        notification = Notification.objects.create(
-            user=package_request.user,
-            travel_listing=package_request.travel_listing,
-            message="Your package request has been accepted."
-        )
-        notification_serializer = NotificationSerializer(notification)
-        send_notification_to_user(package_request.user.id, notification_serializer.data)
+        NotificationService.dispatch([(package_request.user_id, {
+            'message': "Your package request has been accepted.",
+            'travel_listing_id': package_request.travel_listing_id,
+        })])
         return self._standardize_response(Response(serializer.data))
 
     @extend_schema(tags=['Package Requests'], description="Reject a package request")
@@ -489,29 +505,26 @@ class PackageRequestViewSet(StandardResponseViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if request is in pending status
-        if package_request.status != 'pending':
+        # Status is re-checked against the locked row
+        try:
+            package_request = CapacityService.transition_request(package_request.pk, 'rejected')
+        except InvalidStatusTransitionError as e:
             return Response(
                 {
                     "status": "FAILED",
                     "data": {},
                     "status_code": status.HTTP_400_BAD_REQUEST,
-                    "error": [f"Cannot reject request in '{package_request.status}' status."]
+                    "error": [f"Cannot reject request in '{e.current_status}' status."]
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        package_request.status = 'rejected'
-        package_request.save()
         serializer = self.get_serializer(package_request)
         # Send notification to package request owner
-        notification = Notification.objects.create(
-            user=package_request.user,
-            travel_listing=package_request.travel_listing,
-            message="Your package request has been rejected."
-        )
-        notification_serializer = NotificationSerializer(notification)
-        send_notification_to_user(package_request.user.id, notification_serializer.data)
+        NotificationService.dispatch([(package_request.user_id, {
+            'message': "Your package request has been rejected.",
+            'travel_listing_id': package_request.travel_listing_id,
+        })])
         return self._standardize_response(Response(serializer.data))
 
     @extend_schema(tags=['Package Requests'], description="Mark a package request as completed. Only the travel listing owner can complete the request.")
@@ -534,29 +547,26 @@ class PackageRequestViewSet(StandardResponseViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if request is in accepted status
-        if package_request.status != 'accepted':
+        # Status is re-checked against the locked row
+        try:
+            package_request = CapacityService.transition_request(package_request.pk, 'completed')
+        except InvalidStatusTransitionError as e:
             return Response(
                 {
                     "status": "FAILED",
                     "data": {},
                     "status_code": status.HTTP_400_BAD_REQUEST,
-                    "error": [f"Cannot complete request in '{package_request.status}' status. Request must be accepted first."]
+                    "error": [f"Cannot complete request in '{e.current_status}' status. Request must be accepted first."]
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        package_request.status = 'completed'
-        package_request.save()
         serializer = self.get_serializer(package_request)
         # Send notification to package request owner
-        notification = Notification.objects.create(
-            user=package_request.user,
-            travel_listing=package_request.travel_listing,
-            message="Your package request has been marked as completed."
-        )
-        notification_serializer = NotificationSerializer(notification)
-        send_notification_to_user(package_request.user.id, notification_serializer.data)
+        NotificationService.dispatch([(package_request.user_id, {
+            'message': "Your package request has been marked as completed.",
+            'travel_listing_id': package_request.travel_listing_id,
+        })])
         return self._standardize_response(Response(serializer.data))
 
 
@@ -668,7 +678,7 @@ class RegionViewSet(StandardResponseViewSet):
     """
     API endpoint for regions
     """
-    queryset = Region.objects.all()
+    queryset = Region.objects.select_related('country')
     serializer_class = RegionSerializer
 
     def get_permissions(self):
@@ -679,7 +689,7 @@ class RegionViewSet(StandardResponseViewSet):
         return [permission() for permission in permission_classes]
 
     def get_queryset(self):
-        queryset = Region.objects.all()
+        queryset = Region.objects.select_related('country')
         country_id = self.request.query_params.get('country', None)
         if country_id is not None:
             queryset = queryset.filter(country_id=country_id)
@@ -691,17 +701,15 @@ class RegionViewSet(StandardResponseViewSet):
         """
         Get all regions for a specific country.
         """
-        try:
-            regions = Region.objects.filter(country_id=country_id)
-            serializer = self.get_serializer(regions, many=True)
-            return self._standardize_response(Response(serializer.data))
-        except Region.DoesNotExist:
+        if not country_id.isdigit() or not country_exists(int(country_id)):
             return self._standardize_response(
                 Response(
                     {"error": "No regions found for this country"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             )
+        # Served from the catalog cache, with an ETag
+        return catalog_response(request, f'regions:{country_id}')
 
 @extend_schema(tags=['Reviews'])
 class ReviewViewSet(StandardResponseViewSet):
@@ -765,4 +773,24 @@ class PackageTypeViewSet(StandardResponseViewSet):
             permission_classes = [IsAdminUser]
         else:
             permission_classes = [AllowAny]
-        return [permission() for permission in permission_classes]
\ No newline at end of file
+        return [permission() for permission in permission_classes]
+
+
+@extend_schema(tags=['Locations'], description="Countries, regions, transport types and package types in one payload, for client startup (ETag / If-None-Match supported)")
+class CatalogBootstrapView(StandardAPIView):
+    # Public reference data: skip authentication, so a stale token can't turn it into a 401
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return catalog_response(request, BOOTSTRAP)
+
+@extend_schema(tags=['Locations'], description="One catalog: countries, regions, transport-types or package-types (ETag / If-None-Match supported)")
+class CatalogView(StandardAPIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, name):
+        if name not in CATALOGS:
+            return Response({"error": f"Unknown catalog '{name}'"}, status=status.HTTP_404_NOT_FOUND)
+        return catalog_response(request, name)
@@ -0,0 +1,58 @@
+"""
+Message attachments are uploaded after the request.
+
+The files are spooled and saved as ``processing`` attachments; once the
+transaction commits, messaging.tasks.upload_message_attachments uploads them,
+marks the rows ``ready`` (or ``failed``) and pushes the updated message to the
+conversation as a chat_message. Rows whose upload never ran are marked
+``failed`` by expire_attachment_uploads.
+"""
+from django.utils import timezone
+from config.uploads import queue_upload, spool
+from .models import MessageAttachment
+
+
+def attachment_public_id(message_id, file_name):
+    return f'message_attachments/{message_id}/{file_name}'
+
+
+def schedule_upload(message_id, uploads):
+    """Upload ``uploads`` ([attachment_id, spool path, public_id] lists) once the transaction commits."""
+    from .tasks import upload_message_attachments
+    if uploads:
+        attachment_ids = [attachment_id for attachment_id, _, _ in uploads]
+        queue_upload(
+            upload_message_attachments, (message_id, uploads), [path for _, path, _ in uploads],
+            on_failure=lambda: MessageAttachment.objects.filter(id__in=attachment_ids).update(
+                status='failed', updated_at=timezone.now()
+            ),
+        )
+
+
+def add_attachments(message, files):
+    """Create ``processing`` attachments for uploaded files and queue their upload."""
+    spooled = [(file, spool(file)) for file in files]
+    attachments = MessageAttachment.objects.bulk_create([
+        MessageAttachment(
+            message=message,
+            file_name=file.name,
+            file_type=getattr(file, 'content_type', '') or '',
+            status='processing',
+        )
+        for file, _ in spooled
+    ])
+    schedule_upload(message.id, [
+        [attachment.id, path, attachment_public_id(message.id, file.name)]
+        for attachment, (file, path) in zip(attachments, spooled)
+    ])
+    return attachments
+
+
+def replace_attachment_file(attachment, file):
+    """Point an attachment at a new file; the old one is deleted once the new one is uploaded."""
+    path = spool(file)
+    attachment.file_name = file.name
+    attachment.file_type = getattr(file, 'content_type', '') or ''
+    attachment.status = 'processing'
+    attachment.save()
+    schedule_upload(attachment.message_id, [[attachment.id, path, attachment_public_id(attachment.message_id, file.name)]])
@@ -1,10 +1,17 @@
+import asyncio
 import json
+import logging
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Message
+from . import read_receipts
+from .presence import get_presence_store, partner_ids, partners_among, presence_group
+from .unread_counters import UnreadCounterService
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -25,6 +32,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        # Apply a receipt still waiting in the window before the socket goes away
+        if self.user.is_authenticated:
+            await read_receipts.coalescer.flush((self.user.id, int(self.conversation_id)))
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -48,20 +59,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     }
                 )
             elif message_type == 'read_messages':
-                # Handle marking messages as read
+                # Coalesced per (user, conversation); one UPDATE and one
+                # messages_read broadcast per window
                 last_message_id = text_data_json.get('last_message_id')
                 if last_message_id:
-                    await self.mark_messages_as_read(last_message_id)
-                    
-                    # Broadcast to room group
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'messages_read',
-                            'user_id': self.scope['user'].id,
-                            'last_message_id': last_message_id
-                        }
-                    )
+                    read_receipts.coalescer.add(self.user.id, int(self.conversation_id), int(last_message_id))
 
         except Exception as e:
             # Send error to client
@@ -70,17 +72,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'message': f'Error: {str(e)}'
             }))
 
-    @database_sync_to_async
-    def mark_messages_as_read(self, last_message_id):
-        try:
-            last_message = Message.objects.get(id=last_message_id, conversation_id=self.conversation_id)
-            return Message.objects.filter(
-                conversation_id=self.conversation_id,
-                created_at__lte=last_message.created_at
-            ).exclude(sender=self.user).update(is_read=True)
-        except Message.DoesNotExist:
-            return 0
-
     async def chat_message(self, event):
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
@@ -118,6 +109,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
+        # Current badge state; later changes arrive as unread_count events
+        counts = await self.get_unread_counts()
+        await self.send(text_data=json.dumps({
+            'type': 'unread_counts',
+            'counts': counts,
+            'total': sum(counts.values())
+        }))
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -129,54 +128,141 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'type': 'notification',
             'notification': event['notification']
         }))
+
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            **event['unread']
+        }))
+
+    @database_sync_to_async
+    def get_unread_counts(self):
+        return UnreadCounterService.get_counts(self.user.id)
     
 class AppLevelConsumer(AsyncWebsocketConsumer):
+    """
+    App-wide socket carrying presence. The socket watches the user's conversation
+    partners instead of one group of everyone online; subscribing to anyone who
+    is not a partner is ignored.
+    """
 
     async def connect(self):
         self.user = self.scope['user']
         if not self.user.is_authenticated:
             await self.close()
             return
-        
-        self.room_group_name = 'applevel_online'
-
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
 
+        self.heartbeat_task = None
+        self.watching = set()
         await self.accept()
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'online_status',
-                'user_id': self.user.id,
-                'username': self.user.username,
-                'is_online': True
-            }
-        )
-    
+        await self.watch(await self.get_partner_ids())
+        try:
+            came_online = await sync_to_async(get_presence_store().connect)(self.user.id, self.channel_name)
+        except Exception as e:
+            logger.warning(f"Failed to record presence for user #{self.user.id}: {str(e)}")
+        else:
+            if came_online:
+                await self.publish_status(True)
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+
     async def disconnect(self, code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if not self.user.is_authenticated:
+            return
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+            for user_id in self.watching
+        ))
+        try:
+            went_offline = await sync_to_async(get_presence_store().disconnect)(self.user.id, self.channel_name)
+        except Exception as e:
+            logger.warning(f"Failed to clear presence for user #{self.user.id}: {str(e)}")
+        else:
+            if went_offline:
+                await self.publish_status(False)
+
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+            message_type = text_data_json.get('type')
+            user_ids = [int(user_id) for user_id in text_data_json.get('user_ids', [])]
+
+            if message_type == 'subscribe':
+                await self.watch(await self.get_partners_among(user_ids))
+            elif message_type == 'unsubscribe':
+                user_ids = set(user_ids) & self.watching
+                self.watching -= user_ids
+                await asyncio.gather(*(
+                    self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+                    for user_id in user_ids
+                ))
+        except Exception as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Error: {str(e)}'
+            }))
 
+    async def watch(self, user_ids):
+        """Subscribe to the status of ``user_ids`` and send their current status."""
+        limit = getattr(settings, 'PRESENCE_MAX_SUBSCRIPTIONS', 500)
+        user_ids = [
+            user_id for user_id in dict.fromkeys(user_ids)
+            if user_id != self.user.id and user_id not in self.watching
+        ][:max(limit - len(self.watching), 0)]
+        if not user_ids:
+            return
+        self.watching.update(user_ids)
+        await asyncio.gather(*(
+            self.channel_layer.group_add(presence_group(user_id), self.channel_name)
+            for user_id in user_ids
+        ))
+        try:
+            online = await sync_to_async(get_presence_store().online)(user_ids)
+        except Exception as e:
+            logger.warning(f"Failed to read presence: {str(e)}")
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'statuses': {str(user_id): user_id in online for user_id in user_ids}
+        }))
+
+    async def heartbeat(self):
+        store = get_presence_store()
+        interval = getattr(settings, 'PRESENCE_HEARTBEAT_SECONDS', 30)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync_to_async(store.heartbeat)(self.user.id, self.channel_name)
+            except Exception as e:
+                logger.warning(f"Presence heartbeat failed for user #{self.user.id}: {str(e)}")
+
+    async def publish_status(self, is_online):
         await self.channel_layer.group_send(
-            self.room_group_name,
+            presence_group(self.user.id),
             {
                 'type': 'online_status',
                 'user_id': self.user.id,
                 'username': self.user.username,
-                'is_online': False
+                'is_online': is_online
             }
         )
-    
+
+    @database_sync_to_async
+    def get_partner_ids(self):
+        return partner_ids(self.user.id)
+
+    @database_sync_to_async
+    def get_partners_among(self, user_ids):
+        partners = partners_among(self.user.id, user_ids)
+        return [user_id for user_id in user_ids if user_id in partners]
+
     async def online_status(self, event):
         await self.send(text_data=json.dumps({
             'type': 'online_status',
             'user_id': event['user_id'],
             'username': event['username'],
             'is_online': event['is_online']
-        }))
\ No newline at end of file
+        }))
@@ -0,0 +1,76 @@
+"""
+Message history for a conversation.
+
+Pages are seeks on (conversation_id, id) instead of OFFSETs, so a page deep in
+the history costs the same as the latest one: ``before_id`` scrolls back,
+``after_id`` catches up, neither loads the latest page. Senders are rendered
+from a small cached map resolved once per page rather than a nested profile
+serializer per message.
+"""
+from django.core.cache import cache
+from users.models import CustomUser
+
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 100
+
+SENDER_CACHE_TIMEOUT = 300
+SENDER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'profile__profile_picture_url')
+
+
+def sender_cache_key(user_id):
+    return f'messaging:sender:{user_id}'
+
+
+def get_senders(user_ids):
+    """
+    Return {user_id: lightweight sender dict} for the given users, from the
+    cache where possible and with one query for the rest.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    keys = {sender_cache_key(user_id): user_id for user_id in user_ids}
+    senders = {keys[key]: sender for key, sender in cache.get_many(list(keys)).items()}
+
+    missing = user_ids - senders.keys()
+    if missing:
+        fetched = {}
+        for row in CustomUser.objects.filter(id__in=missing).values(*SENDER_FIELDS):
+            fetched[row['id']] = {
+                'id': row['id'],
+                'username': row['username'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'profile_picture_url': row['profile__profile_picture_url'],
+            }
+        cache.set_many({sender_cache_key(user_id): sender for user_id, sender in fetched.items()}, SENDER_CACHE_TIMEOUT)
+        senders.update(fetched)
+    return senders
+
+
+def history_page(conversation, params):
+    """
+    Return (messages in chronological order, has_more) for one history page.
+
+    Supported params: before_id (messages older than that id), after_id (messages
+    newer than that id) and limit (default 30, max 100). Without a seek param the
+    latest messages are returned. Raises ValueError on malformed values.
+    """
+    limit = min(int(params.get('limit') or DEFAULT_LIMIT), MAX_LIMIT)
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {limit}")
+    before_id = params.get('before_id')
+    after_id = params.get('after_id')
+
+    queryset = conversation.messages.prefetch_related('attachments')
+    if after_id:
+        # Catching up: oldest first from the seek point
+        messages = list(queryset.filter(id__gt=int(after_id)).order_by('id')[:limit + 1])
+        has_more = len(messages) > limit
+        return messages[:limit], has_more
+
+    if before_id:
+        queryset = queryset.filter(id__lt=int(before_id))
+    messages = list(queryset.order_by('-id')[:limit + 1])
+    has_more = len(messages) > limit
+    return messages[:limit][::-1], has_more
@@ -0,0 +1,63 @@
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from config.storage import LocalStorage
+from config.utils import upload_images
+
+
+class SimulatedNetworkStorage(LocalStorage):
+    """Local storage with a per-upload delay and random transient failures."""
+
+    def __init__(self, root, latency, failure_rate):
+        super().__init__(root=root, base_url='/bench/')
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.attempts = 0
+
+    def upload(self, file, public_id=None):
+        self.attempts += 1
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionResetError('simulated connection reset')
+        return super().upload(file, public_id=public_id)
+
+
+class Command(BaseCommand):
+    help = 'Upload a batch of files to a local storage backend with simulated latency, serially and with a thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=40)
+        parser.add_argument('--size-kb', type=int, default=512)
+        parser.add_argument('--latency-ms', type=int, default=150, help='Simulated round trip per upload')
+        parser.add_argument('--failure-rate', type=float, default=0.1, help='Share of attempts failing transiently')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = []
+            for i in range(options['files']):
+                path = os.path.join(workdir, f'file_{i}.bin')
+                with open(path, 'wb') as f:
+                    f.write(os.urandom(options['size_kb'] * 1024))
+                paths.append(path)
+
+            for workers in options['workers']:
+                storage = SimulatedNetworkStorage(
+                    os.path.join(workdir, f'uploaded_{workers}'), options['latency_ms'] / 1000, options['failure_rate']
+                )
+                started = time.perf_counter()
+                results = upload_images(
+                    paths, [f'bench/{i}' for i in range(len(paths))],
+                    max_workers=workers, backoff=0.05, return_exceptions=True, storage=storage,
+                )
+                elapsed = time.perf_counter() - started
+                failed = sum(isinstance(result, Exception) for result in results)
+                uploaded = sum(result['bytes'] for result in results if not isinstance(result, Exception))
+                self.stdout.write(
+                    f'workers={workers}: {len(paths)} files in {elapsed:.2f}s '
+                    f'({uploaded / elapsed / 1024 / 1024:.1f} MiB/s), {storage.attempts} attempts, {failed} failed'
+                )
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from messaging.middleware import JWTAuthMiddlewareStack, revoked_token_cache_key, socket_user_cache_key
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Run websocket handshakes through the JWT middleware and report handshakes per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--handshakes', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=100, help='Distinct (existing, active) users to issue tokens for')
+        parser.add_argument('--concurrency', type=int, default=100, help='Handshakes in flight at the same time')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(is_active=True).order_by('id')[:options['users']])
+        if not users:
+            raise CommandError('No active users to issue tokens for.')
+        tokens = [AccessToken.for_user(user) for user in users]
+        asyncio.run(self.run(tokens, options))
+
+    async def run(self, tokens, options):
+        authenticated = 0
+
+        async def app(scope, receive, send):
+            nonlocal authenticated
+            authenticated += scope['user'].is_authenticated
+
+        application = JWTAuthMiddlewareStack(app)
+
+        async def handshake(token):
+            scope = {'type': 'websocket', 'path': '/ws/notifications/', 'headers': [],
+                     'query_string': f'token={token}'.encode()}
+            await application(scope, None, None)
+
+        def forget():
+            cache.delete_many(
+                [socket_user_cache_key(token['user_id']) for token in tokens]
+                + [revoked_token_cache_key(token['jti']) for token in tokens]
+            )
+
+        for phase in ('cold', 'warm'):
+            authenticated = 0
+            started = time.perf_counter()
+            for offset in range(0, options['handshakes'], options['concurrency']):
+                if phase == 'cold':
+                    # Every handshake of the batch misses the cache, like the first
+                    # wave of reconnects after a deploy
+                    await asyncio.to_thread(forget)
+                batch = range(offset, min(offset + options['concurrency'], options['handshakes']))
+                await asyncio.gather(*(handshake(tokens[i % len(tokens)]) for i in batch))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{phase}: {options["handshakes"]} handshakes in {elapsed:.2f}s '
+                f'({options["handshakes"] / elapsed:,.0f}/s), {authenticated} authenticated'
+            )
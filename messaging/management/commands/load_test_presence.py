@@ -0,0 +1,131 @@
+import asyncio
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import re_path
+
+from messaging import presence
+from messaging.consumers import AppLevelConsumer
+
+
+class LoadTestChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory layer that sweeps expired messages once a second instead of on
+    every receive: the stock sweep walks every channel, which at 10k sockets
+    would dominate the measurement.
+    """
+
+    swept_at = 0
+
+    def _clean_expired(self):
+        if time.monotonic() - self.swept_at >= 1:
+            self.swept_at = time.monotonic()
+            super()._clean_expired()
+
+
+class Command(BaseCommand):
+    help = 'Open thousands of app sockets against an in-memory channel layer and measure presence fan-out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=10_000, help='Number of simulated sockets (one user each)')
+        parser.add_argument('--partners', type=int, default=20, help='Conversation partners per user')
+        parser.add_argument('--churn', type=int, default=1000, help='Sockets that disconnect and reconnect')
+        parser.add_argument('--concurrency', type=int, default=200, help='Sockets connecting at the same time')
+
+    def handle(self, *args, **options):
+        # A message left unread past the expiry drops its channel from every group,
+        # so keep it well above the duration of a run
+        layers = {'default': {'BACKEND': f'{__name__}.LoadTestChannelLayer', 'CONFIG': {'capacity': 1000, 'expiry': 3600}}}
+        with override_settings(
+            CHANNEL_LAYERS=layers,
+            PRESENCE_STORE='messaging.presence.InMemoryPresenceStore',
+        ):
+            presence.reset_presence_store()
+            try:
+                asyncio.run(self.run(options))
+            finally:
+                presence.reset_presence_store()
+
+    async def run(self, options):
+        sockets = options['sockets']
+        graph = self.partner_graph(sockets, options['partners'])
+        stats = {'delivered': 0}
+
+        class LoadTestConsumer(AppLevelConsumer):
+            async def get_partner_ids(self):
+                return graph[self.user.id]
+
+            async def online_status(self, event):
+                stats['delivered'] += 1
+                await super().online_status(event)
+
+        application = URLRouter([re_path(r'ws/applevel/$', LoadTestConsumer.as_asgi())])
+
+        async def open_socket(user_id):
+            communicator = WebsocketCommunicator(application, '/ws/applevel/')
+            communicator.scope['user'] = SimpleNamespace(id=user_id, username=f'user{user_id}', is_authenticated=True)
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected, f'socket for user {user_id} was rejected'
+            return communicator, (time.perf_counter() - started) * 1000
+
+        communicators, latencies = {}, []
+        started = time.perf_counter()
+        user_ids = list(range(1, sockets + 1))
+        for offset in range(0, sockets, options['concurrency']):
+            batch = user_ids[offset:offset + options['concurrency']]
+            for user_id, (communicator, latency) in zip(batch, await asyncio.gather(*map(open_socket, batch))):
+                communicators[user_id] = communicator
+                latencies.append(latency)
+        await self.settle(stats)
+        self.report('connect', sockets, time.perf_counter() - started, latencies, stats['delivered'], sockets)
+
+        # Reconnect a sample of users: every disconnect and connect is a status change
+        stats['delivered'] = 0
+        churned = random.sample(user_ids, min(options['churn'], sockets))
+        started = time.perf_counter()
+        await asyncio.gather(*(communicators[user_id].disconnect(timeout=30) for user_id in churned))
+        latencies = []
+        for user_id, (communicator, latency) in zip(churned, await asyncio.gather(*map(open_socket, churned))):
+            communicators[user_id] = communicator
+            latencies.append(latency)
+        await self.settle(stats)
+        self.report('churn', len(churned), time.perf_counter() - started, latencies, stats['delivered'], 2 * len(churned))
+
+        await asyncio.gather(*(communicator.disconnect(timeout=30) for communicator in communicators.values()))
+        self.stdout.write(
+            f'one global group would have delivered {sockets * (sockets - 1):,} status events for the connect phase'
+        )
+
+    async def settle(self, stats):
+        """Wait until the consumers stop handling status events."""
+        delivered = -1
+        while delivered != stats['delivered']:
+            delivered = stats['delivered']
+            await asyncio.sleep(0.2)
+
+    def partner_graph(self, users, partners):
+        graph = {user_id: set() for user_id in range(1, users + 1)}
+        for user_id in graph:
+            while len(graph[user_id]) < min(partners, users - 1):
+                partner_id = random.randint(1, users)
+                if partner_id != user_id:
+                    graph[user_id].add(partner_id)
+                    graph[partner_id].add(user_id)
+        return {user_id: list(partner_ids) for user_id, partner_ids in graph.items()}
+
+    def report(self, phase, sockets, elapsed, latencies, delivered, transitions):
+        latencies.sort()
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f'{phase}: {sockets} sockets in {elapsed:.2f}s, connect p50={percentiles[49]:.1f}ms '
+            f'p99={percentiles[98]:.1f}ms, {delivered:,} status events delivered '
+            f'({delivered / max(transitions, 1):.1f} per status change)'
+        )
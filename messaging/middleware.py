@@ -1,50 +1,113 @@
+"""
+JWT authentication for websockets.
+
+The handshake trusts the signed access token for the user id and builds a
+lightweight SocketUser from it. The few user fields the consumers need, and
+whether the token was revoked, come from the cache; the database is only hit
+on a cache miss, so a reconnect storm after a deploy does not cost one user
+query per socket.
+"""
+from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from channels.auth import AuthMiddlewareStack
+from channels.sessions import SessionMiddlewareStack
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 from rest_framework_simplejwt.tokens import AccessToken
 from urllib.parse import parse_qs
-from django.db import close_old_connections
-from channels.db import database_sync_to_async
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff')
+
+
+def socket_user_cache_key(user_id):
+    return f'ws:user:{user_id}'
+
+
+def revoked_token_cache_key(jti):
+    return f'ws:revoked:{jti}'
+
+
+class SocketUser:
+    """
+    Authenticated websocket principal. Carries only what the consumers use;
+    load the CustomUser explicitly where a model instance is needed.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, is_active=True, is_staff=False):
+        self.id = id
+        self.pk = id
+        self.username = username
+        self.is_active = is_active
+        self.is_staff = is_staff
+
+    def __str__(self):
+        return self.username
+
+
+@database_sync_to_async
+def resolve_user(user_id, jti):
+    """
+    Return the SocketUser for a validated token, or None when the user is
+    missing or inactive, or the token has been blacklisted.
+    """
+    timeout = getattr(settings, 'WS_AUTH_CACHE_SECONDS', 60)
+    user_key, revoked_key = socket_user_cache_key(user_id), revoked_token_cache_key(jti)
+    cached = cache.get_many([user_key, revoked_key])
+
+    revoked = cached.get(revoked_key)
+    if revoked is None:
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        cache.set(revoked_key, revoked, timeout)
+    if revoked:
+        return None
+
+    fields = cached.get(user_key)
+    if fields is None:
+        fields = User.objects.filter(id=user_id).values(*USER_FIELDS).first() or {}
+        cache.set(user_key, fields, timeout)
+    if not fields or not fields['is_active']:
+        return None
+    return SocketUser(**fields)
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        close_old_connections()
+        scope = dict(scope)
+        scope['user'] = await self.get_user(scope)
+        return await self.inner(scope, receive, send)
 
+    @staticmethod
+    async def get_user(scope):
         # Get the token from the query string
-        query_string = scope.get('query_string', b'').decode()
-        query_params = parse_qs(query_string)
+        query_params = parse_qs(scope.get('query_string', b'').decode())
         token = query_params.get('token', [None])[0]
+        if not token:
+            return AnonymousUser()
 
-        if token:
-            try:
-                # Verify the token and get the user
-                access_token = AccessToken(token)
-                print(access_token)
-                user_id = access_token['user_id']
-                print(user_id)
-                user = await self.get_user(user_id)
-                print(user)
-                scope['user'] = user
-            except Exception as e:
-                print(e)
-                scope['user'] = AnonymousUser()
-        else:
-            scope['user'] = AnonymousUser()
-
-        return await self.inner(scope, receive, send)
-
-    @staticmethod
-    async def get_user(user_id):
         try:
-            return await database_sync_to_async(User.objects.get)(id=user_id)
-        except User.DoesNotExist:
+            access_token = AccessToken(token)
+        except TokenError as e:
+            logger.info(f"Rejected websocket token: {str(e)}")
             return AnonymousUser()
 
+        user = await resolve_user(access_token[api_settings.USER_ID_CLAIM], access_token[api_settings.JTI_CLAIM])
+        return user or AnonymousUser()
+
+
 def JWTAuthMiddlewareStack(inner):
-    return JWTAuthMiddleware(AuthMiddlewareStack(inner)) 
\ No newline at end of file
+    # Sockets authenticate with the token only; channels' AuthMiddleware would
+    # load a session user on every handshake just to be overridden here
+    return JWTAuthMiddleware(SessionMiddlewareStack(inner))
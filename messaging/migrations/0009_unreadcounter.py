@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Conversation = apps.get_model('messaging', 'Conversation')
+    UnreadCounter = apps.get_model('messaging', 'UnreadCounter')
+    Participant = Conversation.participants.through
+    rows = Participant.objects.values('conversation_id', 'customuser_id').annotate(
+        unread=Count(
+            'conversation__messages',
+            filter=Q(conversation__messages__is_read=False)
+            & ~Q(conversation__messages__sender_id=F('customuser_id')),
+        )
+    ).filter(unread__gt=0).order_by()
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(UnreadCounter(
+            user_id=row['customuser_id'],
+            conversation_id=row['conversation_id'],
+            count=row['unread'],
+        ))
+        if len(batch) >= 2000:
+            UnreadCounter.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        UnreadCounter.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_messageattachment_public_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='messaging.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'conversation'), name='unique_unread_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
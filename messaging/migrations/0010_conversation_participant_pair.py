@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_participant_pairs(apps, schema_editor):
+    """
+    Key every conversation with exactly two participants by its (user_low, user_high)
+    pair. When a pair has several conversations, the most recently updated one gets
+    the key (and is what get_or_create_conversation returns from now on); the others
+    stay reachable through their participants.
+    """
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Participant = Conversation.participants.through
+    pairs = Participant.objects.values('conversation_id').annotate(
+        participant_count=Count('customuser_id', distinct=True),
+        user_low=Min('customuser_id'),
+        user_high=Max('customuser_id'),
+        updated_at=Max('conversation__updated_at'),
+    ).filter(participant_count=2).order_by()
+
+    chosen = {}
+    for row in pairs.iterator(chunk_size=5000):
+        key = (row['user_low'], row['user_high'])
+        current = chosen.get(key)
+        if current is None or row['updated_at'] > current[1]:
+            chosen[key] = (row['conversation_id'], row['updated_at'])
+
+    batch = []
+    for (user_low, user_high), (conversation_id, _) in chosen.items():
+        batch.append(Conversation(id=conversation_id, user_low_id=user_low, user_high_id=user_high))
+        if len(batch) >= 2000:
+            Conversation.objects.bulk_update(batch, ['user_low', 'user_high'])
+            batch = []
+    if batch:
+        Conversation.objects.bulk_update(batch, ['user_low', 'user_high'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_unreadcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_participant_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation_pair'),
+        ),
+    ]
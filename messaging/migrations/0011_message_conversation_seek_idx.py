@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_conversation_participant_pair'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], include=('sender', 'is_read'), name='message_conversation_seek_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0012_messageattachment_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messageattachment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
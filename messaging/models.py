@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from users.models import CustomUser
 from listings.models import TravelListing
@@ -7,13 +7,20 @@ from listings.models import TravelListing
 class Conversation(models.Model):
     """
     Conversations are purely between users, not linked to packages or travel listings.
+    1:1 conversations carry their participant pair as (user_low, user_high), ordered by
+    user id, so the pair is found with one indexed read and can only exist once.
     """
     participants = models.ManyToManyField(CustomUser, related_name='conversations')
+    user_low = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+    user_high = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
 
     def __str__(self):
         return f"Conversation {self.id} - {self.participants.count()} participants"
@@ -22,25 +29,18 @@ class Conversation(models.Model):
     def get_or_create_conversation(user1, user2):
         """
         Finds or creates a 1-on-1 conversation between two users.
+        Concurrent calls for the same pair meet on the unique pair constraint, and the
+        loser waits for the winner's transaction before reading its conversation.
         """
-        from django.db.models import Count
-        
-        # Look for an existing conversation with exactly these two participants
-        conversation = Conversation.objects.annotate(
-            num_participants=Count('participants')
-        ).filter(
-            num_participants=2,
-            participants=user1
-        ).filter(
-            participants=user2
-        ).first()
-
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(user1, user2)
-            return conversation, True
-        
-        return conversation, False
+        user_low_id, user_high_id = sorted((user1.pk, user2.pk))
+        with transaction.atomic():
+            conversation, created = Conversation.objects.get_or_create(
+                user_low_id=user_low_id,
+                user_high_id=user_high_id,
+            )
+            if created:
+                conversation.participants.add(user_low_id, user_high_id)
+        return conversation, created
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
@@ -51,18 +51,50 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Seek index for message history: WHERE conversation_id = X AND id < Y ORDER BY id DESC.
+            # On PostgreSQL the INCLUDE columns let read-state lookups skip the table.
+            models.Index(fields=['conversation', 'id'], include=['sender', 'is_read'], name='message_conversation_seek_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender.username} in conversation {self.conversation.id}"
 
 
+class UnreadCounter(models.Model):
+    """
+    Number of unread messages from others per (user, conversation).
+    Source of truth for the Redis counters in messaging.unread_counters.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='unread_counters')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='unread_counters')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='unique_unread_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} unread for user {self.user_id} in conversation {self.conversation_id}"
+
+
 class MessageAttachment(models.Model):
+    STATUS_CHOICES = [
+        ('processing', 'Processing'), # spooled, upload pending (see messaging.tasks.upload_message_attachments)
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments')
     file_url = models.CharField(max_length=255, blank=True, null=True)
     public_id = models.CharField(max_length=255, blank=True, null=True)
     file_name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ready')
     created_at = models.DateTimeField(auto_now_add=True)
+    # When the status last changed; uploads still processing long after are given up on
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Attachment for message {self.message.id} - {self.file_name}"
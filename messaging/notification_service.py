@@ -0,0 +1,132 @@
+"""
+Notification dispatch service.
+Writes a batch of notifications with one INSERT and hands the websocket pushes
+to a Celery worker once the transaction commits, so the cost of a request no
+longer grows with the number of recipients.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Notification
+from .serializers import NotificationSerializer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce_cache_key(user_id, conversation_id):
+    return f'notifications:coalesce:{user_id}:{conversation_id}'
+
+
+class NotificationService:
+    """
+    Service class for creating and pushing user notifications in batches.
+    """
+
+    @staticmethod
+    def dispatch(items, coalesce=False, defer_push=True):
+        """
+        Create notifications for a batch of recipients and push them through WebSocket.
+
+        With ``coalesce``, a conversation notification for a user who already got an
+        unread one for the same conversation within NOTIFICATION_COALESCE_SECONDS
+        updates that notification instead of creating (and pushing) another.
+
+        Args:
+            items: Iterable of (user_id, payload) pairs; payload holds ``message`` and
+                optionally ``travel_listing_id`` / ``conversation_id``
+            coalesce: Collapse conversation notifications within the coalescing window
+            defer_push: Push from a Celery worker after commit (False pushes inline,
+                for callers that already run in a worker)
+
+        Returns:
+            list: The created Notification instances
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        window = getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 0)
+        if coalesce and window:
+            items = NotificationService._coalesce(items)
+            if not items:
+                return []
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                message=payload['message'],
+                travel_listing_id=payload.get('travel_listing_id'),
+                conversation_id=payload.get('conversation_id'),
+            )
+            for user_id, payload in items
+        ])
+
+        if coalesce and window:
+            keys = {
+                coalesce_cache_key(notification.user_id, notification.conversation_id): notification.id
+                for notification in notifications
+                if notification.conversation_id and notification.id
+            }
+            # robust: coalescing is an optimization, losing it must not fail the request
+            transaction.on_commit(lambda: cache.set_many(keys, timeout=window), robust=True)
+
+        pushes = [
+            (notification.user_id, data)
+            for notification, data in zip(notifications, NotificationSerializer(notifications, many=True).data)
+        ]
+        if defer_push:
+            # robust: the notifications are saved by then, a failed push must not turn
+            # the committed request into an error
+            transaction.on_commit(lambda: NotificationService._enqueue_push(pushes), robust=True)
+        else:
+            from .utils import send_notifications_to_users
+            send_notifications_to_users(pushes)
+        return notifications
+
+    @staticmethod
+    def _enqueue_push(pushes):
+        """Hand the pushes to a worker, or push them from here if the broker is unreachable."""
+        from .tasks import push_notifications
+        try:
+            push_notifications.delay(pushes)
+        except Exception as e:
+            logger.warning(f"Could not queue {len(pushes)} notification pushes, sending them inline: {str(e)}")
+            from .utils import send_notifications_to_users
+            send_notifications_to_users(pushes)
+
+    @staticmethod
+    def _coalesce(items):
+        """
+        Fold conversation notifications into still-unread ones created within the
+        window. Returns the items that still need a notification of their own.
+        """
+        keys = {
+            coalesce_cache_key(user_id, payload['conversation_id']): (user_id, payload)
+            for user_id, payload in items
+            if payload.get('conversation_id')
+        }
+        existing = cache.get_many(list(keys)) if keys else {}
+        if not existing:
+            return items
+
+        live = set(
+            Notification.objects.filter(id__in=existing.values(), is_read=False).values_list('id', flat=True)
+        )
+        by_message = {}
+        folded = set()
+        for key, notification_id in existing.items():
+            if notification_id in live:
+                user_id, payload = keys[key]
+                by_message.setdefault(payload['message'], []).append(notification_id)
+                folded.add(key)
+        for message, notification_ids in by_message.items():
+            Notification.objects.filter(id__in=notification_ids).update(message=message)
+
+        if folded:
+            logger.info(f"Coalesced {len(folded)} conversation notifications")
+        return [
+            (user_id, payload) for user_id, payload in items
+            if not payload.get('conversation_id')
+            or coalesce_cache_key(user_id, payload['conversation_id']) not in folded
+        ]
@@ -0,0 +1,167 @@
+"""
+Online presence.
+
+Each open app socket is a connection entry with an expiry in the presence store,
+refreshed by a heartbeat while the socket lives. A user is online while any of
+their entries has not expired, so a crashed server stops counting its sockets
+after PRESENCE_TTL_SECONDS without any cleanup.
+
+Status changes are not broadcast to everyone: a socket subscribes to the
+``presence_<user_id>`` group of the user's conversation partners (and of other
+partners it asks for), and only the first connect / last disconnect of a user
+is published to their group. Nobody gets the status of a user they share no
+conversation with.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from config.redis import get_redis
+from .models import Conversation
+
+KEY_PREFIX = 'presence:'
+
+
+def presence_group(user_id):
+    return f'presence_{user_id}'
+
+
+def presence_ttl():
+    return getattr(settings, 'PRESENCE_TTL_SECONDS', 90)
+
+
+class RedisPresenceStore:
+    """
+    Presence in Redis: one sorted set per user (``presence:<user_id>``) of
+    connection id -> expiry timestamp. Raises redis.RedisError when Redis is down.
+    """
+
+    def connect(self, user_id, connection_id):
+        """Register a connection. Returns True when the user just came online."""
+        now = time.time()
+        key = f'{KEY_PREFIX}{user_id}'
+        pipe = get_redis().pipeline()
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zcard(key)
+        pipe.zadd(key, {connection_id: now + presence_ttl()})
+        pipe.expire(key, presence_ttl())
+        _, live, _, _ = pipe.execute()
+        return live == 0
+
+    def heartbeat(self, user_id, connection_id):
+        now = time.time()
+        key = f'{KEY_PREFIX}{user_id}'
+        pipe = get_redis().pipeline()
+        pipe.zadd(key, {connection_id: now + presence_ttl()})
+        pipe.expire(key, presence_ttl())
+        pipe.execute()
+
+    def disconnect(self, user_id, connection_id):
+        """Drop a connection. Returns True when it was the user's last one."""
+        key = f'{KEY_PREFIX}{user_id}'
+        pipe = get_redis().pipeline()
+        pipe.zrem(key, connection_id)
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zcard(key)
+        _, _, live = pipe.execute()
+        return live == 0
+
+    def online(self, user_ids):
+        """Return the subset of ``user_ids`` that is online."""
+        user_ids = list(user_ids)
+        now = time.time()
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(f'{KEY_PREFIX}{user_id}', now, '+inf')
+        return {user_id for user_id, live in zip(user_ids, pipe.execute()) if live}
+
+
+class InMemoryPresenceStore:
+    """
+    Process-local presence, for a single-process setup and load tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _live(self, user_id, now):
+        connections = self._connections.get(user_id, {})
+        for connection_id in [c for c, expires in connections.items() if expires <= now]:
+            del connections[connection_id]
+        return connections
+
+    def connect(self, user_id, connection_id):
+        now = time.time()
+        with self._lock:
+            connections = self._connections.setdefault(user_id, {})
+            came_online = not self._live(user_id, now)
+            connections[connection_id] = now + presence_ttl()
+        return came_online
+
+    def heartbeat(self, user_id, connection_id):
+        with self._lock:
+            self._connections.setdefault(user_id, {})[connection_id] = time.time() + presence_ttl()
+
+    def disconnect(self, user_id, connection_id):
+        with self._lock:
+            self._connections.get(user_id, {}).pop(connection_id, None)
+            went_offline = not self._live(user_id, time.time())
+            if went_offline:
+                self._connections.pop(user_id, None)
+        return went_offline
+
+    def online(self, user_ids):
+        now = time.time()
+        with self._lock:
+            return {user_id for user_id in user_ids if self._live(user_id, now)}
+
+
+_store = None
+
+
+def get_presence_store():
+    """Return the configured presence store (PRESENCE_STORE, Redis by default)."""
+    global _store
+    if _store is None:
+        _store = import_string(
+            getattr(settings, 'PRESENCE_STORE', 'messaging.presence.RedisPresenceStore')
+        )()
+    return _store
+
+
+def reset_presence_store():
+    global _store
+    _store = None
+
+
+def partner_ids(user_id, limit=None):
+    """
+    Users sharing a conversation with ``user_id``, most recently active
+    conversations first, at most PRESENCE_MAX_SUBSCRIPTIONS of them.
+    """
+    limit = limit or getattr(settings, 'PRESENCE_MAX_SUBSCRIPTIONS', 500)
+    rows = Conversation.participants.through.objects.filter(
+        conversation__participants=user_id
+    ).exclude(customuser_id=user_id).order_by('-conversation__updated_at').values_list('customuser_id', flat=True)
+
+    partners = []
+    seen = set()
+    for partner_id in rows.iterator():
+        if partner_id not in seen:
+            seen.add(partner_id)
+            partners.append(partner_id)
+            if len(partners) >= limit:
+                break
+    return partners
+
+
+def partners_among(user_id, user_ids):
+    """The ids in ``user_ids`` that share a conversation with ``user_id``, in one query."""
+    return set(
+        Conversation.participants.through.objects.filter(
+            conversation__participants=user_id, customuser_id__in=user_ids
+        ).exclude(customuser_id=user_id).values_list('customuser_id', flat=True)
+    )
@@ -0,0 +1,113 @@
+"""
+Read receipt coalescing for chat sockets.
+
+Clients send a ``read_messages`` frame on every scroll. Instead of a query and
+a broadcast per frame, the frames for a (user, conversation) are collected for
+READ_RECEIPT_WINDOW_SECONDS and flushed once: a single UPDATE up to the highest
+``last_message_id`` seen and a single ``messages_read`` broadcast.
+"""
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from prometheus_client import REGISTRY, Counter
+
+from .models import Message
+from .unread_counters import UnreadCounterService
+
+logger = logging.getLogger(__name__)
+
+READ_RECEIPT_FRAMES = Counter(
+    'chat_read_receipt_frames_total', 'read_messages frames received on chat sockets'
+)
+READ_RECEIPT_WRITES = Counter(
+    'chat_read_receipt_writes_total', 'Read receipt UPDATEs issued after coalescing'
+)
+READ_RECEIPT_MESSAGES = Counter(
+    'chat_read_receipt_messages_total', 'Messages marked as read through read receipts'
+)
+
+
+def stats():
+    """Frames received versus database writes issued by this process."""
+    return {
+        'frames': int(REGISTRY.get_sample_value('chat_read_receipt_frames_total')),
+        'writes': int(REGISTRY.get_sample_value('chat_read_receipt_writes_total')),
+        'messages_marked_read': int(REGISTRY.get_sample_value('chat_read_receipt_messages_total')),
+    }
+
+
+@database_sync_to_async
+def mark_read_up_to(user_id, conversation_id, last_message_id):
+    """Mark the other participants' messages up to ``last_message_id`` as read (one UPDATE)."""
+    with transaction.atomic():
+        updated = Message.objects.filter(
+            conversation_id=conversation_id,
+            id__lte=last_message_id,
+            is_read=False
+        ).exclude(sender_id=user_id).update(is_read=True)
+        UnreadCounterService.decrement(user_id, conversation_id, updated)
+    return updated
+
+
+class ReadReceiptCoalescer:
+    """
+    Per-process buffer of pending read receipts keyed by (user_id, conversation_id).
+    Only the highest message id of a window is written and broadcast.
+    """
+
+    def __init__(self, window=None):
+        self.window = window if window is not None else getattr(settings, 'READ_RECEIPT_WINDOW_SECONDS', 0.5)
+        self.pending = {}
+        self.flushes = {}
+
+    def add(self, user_id, conversation_id, last_message_id):
+        READ_RECEIPT_FRAMES.inc()
+        key = (user_id, conversation_id)
+        self.pending[key] = max(self.pending.get(key, 0), last_message_id)
+        if key not in self.flushes:
+            self.flushes[key] = asyncio.ensure_future(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            # Frames arriving from here on start a new window
+            self.flushes.pop(key, None)
+        await self.flush(key)
+
+    async def flush(self, key):
+        last_message_id = self.pending.pop(key, None)
+        if last_message_id is None:
+            return
+        user_id, conversation_id = key
+        try:
+            updated = await mark_read_up_to(user_id, conversation_id, last_message_id)
+        except Exception as e:
+            logger.error(f"Failed to apply read receipt for user #{user_id} in conversation #{conversation_id}: {str(e)}")
+            return
+        READ_RECEIPT_WRITES.inc()
+        READ_RECEIPT_MESSAGES.inc(updated)
+
+        await get_channel_layer().group_send(
+            f'chat_{conversation_id}',
+            {
+                'type': 'messages_read',
+                'user_id': user_id,
+                'last_message_id': last_message_id
+            }
+        )
+
+    async def flush_all(self):
+        """Flush every pending receipt now (e.g. before a socket goes away)."""
+        for key in list(self.pending):
+            task = self.flushes.pop(key, None)
+            if task is not None:
+                task.cancel()
+            await self.flush(key)
+
+
+coalescer = ReadReceiptCoalescer()
@@ -1,28 +1,21 @@
 from rest_framework import serializers
 from .models import Conversation, Message, MessageAttachment, Notification
 from users.serializers import UserProfileSerializer
-from config.utils import upload_image
+from .attachments import add_attachments, replace_attachment_file
+
 class MessageAttachmentSerializer(serializers.ModelSerializer):
     file = serializers.FileField(write_only=True, required=False)
     class Meta:
         model = MessageAttachment
-        fields = ('id', 'file', 'file_name', 'file_url', 'public_id', 'file_type', 'created_at')
-        read_only_fields = ('file_name', 'file_url', 'public_id', 'file_type', 'created_at')
+        fields = ('id', 'file', 'file_name', 'file_url', 'public_id', 'file_type', 'status', 'created_at')
+        read_only_fields = ('file_name', 'file_url', 'public_id', 'file_type', 'status', 'created_at')
     
     def create(self, validated_data):
         file = validated_data.pop('file', None)
-        # Set file_name and file_type automatically from the uploaded file
-        if file:
-            validated_data['file_name'] = file.name
-            validated_data['file_type'] = getattr(file, 'content_type', '')
-        instance = MessageAttachment.objects.create(**validated_data)
-
         if file:
-            upload_result = upload_image(file, public_id=f'message_attachments/{instance.message.id}/{file.name}')
-            instance.file_url = upload_result['secure_url']
-            instance.public_id = upload_result['public_id']
-            instance.save()
-        return instance
+            # Uploaded in the background; the row starts as 'processing'
+            return add_attachments(validated_data['message'], [file])[0]
+        return MessageAttachment.objects.create(**validated_data)
     
     def update(self, instance, validated_data):
         file = validated_data.pop('file', None)
@@ -30,20 +23,10 @@ class MessageAttachmentSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
 
         if file:
-            old_public_id = instance.public_id
-            instance.file_name = file.name
-            instance.file_type = getattr(file, 'content_type', '')
-            upload_result = upload_image(file, public_id=f'message_attachments/{instance.message.id}/{file.name}')
-            instance.file_url = upload_result['secure_url']
-            instance.public_id = upload_result['public_id']
-            
-            if old_public_id and old_public_id != instance.public_id:
-                try:
-                    delete_image(old_public_id)
-                except:
-                    pass
-        
-        instance.save()
+            # Saves the instance; the old file is deleted once the new one is uploaded
+            replace_attachment_file(instance, file)
+        else:
+            instance.save()
         return instance
     
 class MessageSerializer(serializers.ModelSerializer):
@@ -78,17 +61,9 @@ class MessageSerializer(serializers.ModelSerializer):
 
         message = Message.objects.create(**validated_data)            
         
-        # Handle file attachments
-        for file in uploaded_files:
-            upload_result = upload_image(file, public_id=f'message_attachments/{message.id}/{file.name}')
-            MessageAttachment.objects.create(
-                message=message,
-                # file=file,
-                file_url=upload_result['secure_url'],
-                public_id=upload_result['public_id'],
-                file_name=file.name,
-                file_type=file.content_type
-            )
+        # Handle file attachments (uploaded in the background)
+        if uploaded_files:
+            add_attachments(message, uploaded_files)
         
         return message
     
@@ -103,22 +78,29 @@ class MessageSerializer(serializers.ModelSerializer):
         if attachment_ids_to_remove:
             MessageAttachment.objects.filter(id__in=attachment_ids_to_remove, message=instance).delete()
 
-        # Handle file attachments
+        # Handle file attachments (uploaded in the background)
         if uploaded_files:
-            for file in uploaded_files:
-                upload_result = upload_image(file, public_id=f'message_attachments/{instance.id}/{file.name}')
-                MessageAttachment.objects.create(
-                    message=instance,
-                    # file=file,
-                    file_url=upload_result['secure_url'],
-                    public_id=upload_result['public_id'],
-                    file_name=file.name,
-                    file_type=file.content_type
-                )
+            add_attachments(instance, uploaded_files)
         
         instance.save()
         return instance
 
+class MessageHistorySerializer(serializers.ModelSerializer):
+    """
+    Message as rendered in conversation history. ``sender`` comes from the
+    ``senders`` map in the context (see messaging.history.get_senders).
+    """
+    sender = serializers.SerializerMethodField()
+    attachments = MessageAttachmentSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ('id', 'conversation', 'sender', 'content', 'is_read', 'created_at', 'attachments')
+        read_only_fields = fields
+
+    def get_sender(self, obj):
+        return self.context['senders'].get(obj.sender_id, {'id': obj.sender_id})
+
 class ConversationSerializer(serializers.ModelSerializer):
     participants = UserProfileSerializer(many=True, read_only=True)
     last_message = serializers.SerializerMethodField()
@@ -130,12 +112,18 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
+        # Prefetched by the conversation list (see messaging.views.with_list_data)
+        if hasattr(obj, 'latest_messages'):
+            last_message = obj.latest_messages[0] if obj.latest_messages else None
+        else:
+            last_message = obj.messages.last()
         if last_message:
             return MessageSerializer(last_message).data
         return None
 
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread_messages'):
+            return obj.unread_messages
         user = self.context['request'].user
         return obj.messages.filter(is_read=False).exclude(sender=user).count()
 
@@ -1,8 +1,36 @@
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
+from django.conf import settings
+from django.core.cache import cache
 from django.dispatch import receiver
-from .models import MessageAttachment
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from users.models import CustomUser
+from .middleware import revoked_token_cache_key, socket_user_cache_key
+from .models import Conversation, Message, MessageAttachment
+from .unread_counters import UnreadCounterService
 from config.utils import delete_image
 
+
+def other_participant_ids(message):
+    return Conversation.participants.through.objects.filter(
+        conversation_id=message.conversation_id
+    ).exclude(customuser_id=message.sender_id).values_list('customuser_id', flat=True)
+
+
+@receiver(post_save, sender=Message)
+def count_unread_message(sender, instance, created, **kwargs):
+    """A new message is unread for every other participant."""
+    if created and not instance.is_read:
+        UnreadCounterService.increment(instance.conversation_id, other_participant_ids(instance))
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance, **kwargs):
+    """A deleted unread message no longer counts for the other participants."""
+    if not instance.is_read:
+        for user_id in other_participant_ids(instance):
+            UnreadCounterService.decrement(user_id, instance.conversation_id, 1)
+
+
 @receiver(post_delete, sender=MessageAttachment)
 def delete_attachment_from_cloudinary(sender, instance, **kwargs):
     if instance.public_id:
@@ -11,3 +39,15 @@ def delete_attachment_from_cloudinary(sender, instance, **kwargs):
         except Exception as e:
             # Log error but don't fail the deletion
             print(f"Error deleting image from Cloudinary: {e}")
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_socket_user(sender, instance, **kwargs):
+    """Websocket handshakes must not keep using stale (e.g. deactivated) user data."""
+    cache.delete(socket_user_cache_key(instance.id))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_socket_token(sender, instance, **kwargs):
+    cache.set(revoked_token_cache_key(instance.token.jti), True, getattr(settings, 'WS_AUTH_CACHE_SECONDS', 60))
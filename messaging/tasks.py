@@ -0,0 +1,79 @@
+from celery import shared_task
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from config.storage import get_storage
+from config.uploads import upload_spooled
+from .models import Message, MessageAttachment
+from .serializers import MessageSerializer
+from .utils import send_message_to_conversation, send_notifications_to_users
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def push_notifications(pushes):
+    """
+    Push serialized notifications to their users' WebSocket groups.
+    ``pushes`` is a list of [user_id, notification_data] pairs.
+    """
+    send_notifications_to_users(pushes)
+    logger.info(f"Pushed {len(pushes)} notifications")
+    return len(pushes)
+
+
+@shared_task
+def upload_message_attachments(message_id, uploads):
+    """
+    Upload spooled attachment files, update their rows and push the updated
+    message to the conversation.
+    ``uploads`` is a list of [attachment_id, spool path, public_id] lists.
+    """
+    results = upload_spooled([(path, public_id) for _, path, public_id in uploads])
+    attachments = MessageAttachment.objects.in_bulk([attachment_id for attachment_id, _, _ in uploads])
+
+    updated = []
+    for (attachment_id, _, _), result in zip(uploads, results):
+        attachment = attachments.get(attachment_id)
+        if attachment is None:
+            # Removed while uploading
+            if not isinstance(result, Exception):
+                get_storage().delete(result['public_id'])
+            continue
+        if isinstance(result, Exception):
+            attachment.status = 'failed'
+        else:
+            old_public_id = attachment.public_id
+            attachment.file_url = result['secure_url']
+            attachment.public_id = result['public_id']
+            attachment.status = 'ready'
+            if old_public_id and old_public_id != attachment.public_id:
+                try:
+                    get_storage().delete(old_public_id)
+                except Exception as e:
+                    logger.warning(f"Failed to delete replaced attachment file {old_public_id}: {str(e)}")
+        attachment.updated_at = timezone.now()
+        updated.append(attachment)
+    MessageAttachment.objects.bulk_update(updated, ['file_url', 'public_id', 'status', 'updated_at'])
+
+    message = Message.objects.select_related('sender__profile').prefetch_related('attachments').filter(id=message_id).first()
+    if message is not None:
+        send_message_to_conversation(message.conversation_id, MessageSerializer(message).data)
+    failed = sum(isinstance(result, Exception) for result in results)
+    logger.info(f"Uploaded {len(results) - failed} attachments for message #{message_id} ({failed} failed)")
+    return len(results) - failed
+
+
+@shared_task
+def expire_attachment_uploads():
+    """
+    Fail attachments still processing after UPLOAD_SPOOL_MAX_AGE seconds: their
+    spooled files are swept by then, so the upload can't happen anymore.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'UPLOAD_SPOOL_MAX_AGE', 6 * 60 * 60))
+    expired = MessageAttachment.objects.filter(status='processing', updated_at__lt=cutoff).update(
+        status='failed', updated_at=timezone.now()
+    )
+    logger.info(f"Failed {expired} attachment uploads that never completed")
+    return expired
@@ -1,3 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import Conversation, Message
+
+User = get_user_model()
+
+
+class ConversationListQueryCountTests(TestCase):
+    """The conversation list must not run queries per conversation on the page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.make_user(0)
+
+    @staticmethod
+    def make_user(number):
+        return User.objects.create_user(
+            email=f'user{number}@example.com', username=f'user{number}', phone_number=f'0900{number:06d}'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_conversations(self, total):
+        """Add conversations (with read and unread messages) until the user has ``total``."""
+        while Conversation.objects.filter(participants=self.user).count() < total:
+            other = self.make_user(Conversation.objects.count() + 1)
+            conversation = Conversation.objects.create()
+            conversation.participants.add(self.user, other)
+            Message.objects.create(conversation=conversation, sender=other, content='hello')
+            Message.objects.create(conversation=conversation, sender=other, content='are you there?')
+            Message.objects.create(conversation=conversation, sender=self.user, content='yes')
+
+    def list_conversations(self):
+        response = self.client.get('/api/messaging/conversations/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']['results']
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_conversations(1)
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(len(self.list_conversations()), 1)
+
+        for page_size in (5, 10):
+            self.add_conversations(page_size)
+            with self.assertNumQueries(len(single.captured_queries)):
+                results = self.list_conversations()
+            self.assertEqual(len(results), page_size)
+            self.assertTrue(all(result['last_message'] for result in results))
+            self.assertTrue(all(result['unread_count'] == 2 for result in results))
@@ -0,0 +1,160 @@
+"""
+Unread message counters per (user, conversation).
+
+The UnreadCounter table is the source of truth and is updated in the same
+transaction as the messages. A Redis hash per user (``unread:<user_id>``,
+conversation id -> count) mirrors it, so a badge refresh is a single HGETALL.
+The hash is only incremented while it exists and is loaded from the table as a
+whole on a miss, so it never holds partial data. Without Redis, reads go to the table.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from config.redis import get_redis
+from .models import UnreadCounter
+from .utils import send_unread_counts
+import logging
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'unread:'
+LOADED_FIELD = '_'  # present in every loaded hash, even for users without unread messages
+TTL_SECONDS = 24 * 60 * 60
+
+# KEYS: user hashes; ARGV: conversation id, delta.
+# Returns [count, total] per key, or false when the hash is not loaded.
+APPLY_DELTA_SCRIPT = """
+local results = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        local count = redis.call('HINCRBY', key, ARGV[1], ARGV[2])
+        if count <= 0 then
+            redis.call('HDEL', key, ARGV[1])
+            count = 0
+        end
+        local total = 0
+        local values = redis.call('HGETALL', key)
+        for j = 1, #values, 2 do
+            if values[j] ~= '_' then
+                total = total + tonumber(values[j + 1])
+            end
+        end
+        results[i] = {count, total}
+    else
+        results[i] = false
+    end
+end
+return results
+"""
+
+
+def redis_key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+class UnreadCounterService:
+    """
+    Service class for per-user unread message counters.
+    """
+
+    _script = None
+
+    @staticmethod
+    def increment(conversation_id, user_ids, amount=1):
+        """
+        Count ``amount`` new unread messages in a conversation for each of ``user_ids``.
+
+        Args:
+            conversation_id: Conversation primary key
+            user_ids: Recipients (participants other than the sender)
+            amount: Number of new messages
+        """
+        user_ids = list(user_ids)
+        if not user_ids or not amount:
+            return
+        counters = UnreadCounter.objects.filter(conversation_id=conversation_id, user_id__in=user_ids)
+        if counters.update(count=F('count') + amount) < len(user_ids):
+            existing = set(counters.values_list('user_id', flat=True))
+            UnreadCounter.objects.bulk_create(
+                [
+                    UnreadCounter(user_id=user_id, conversation_id=conversation_id, count=0)
+                    for user_id in user_ids if user_id not in existing
+                ],
+                ignore_conflicts=True,
+            )
+            counters.exclude(user_id__in=existing).update(count=F('count') + amount)
+        transaction.on_commit(lambda: UnreadCounterService._apply_delta(conversation_id, user_ids, amount))
+
+    @staticmethod
+    def decrement(user_id, conversation_id, amount):
+        """
+        Remove ``amount`` read messages from a user's counter for a conversation (never below zero).
+        """
+        if not amount:
+            return
+        UnreadCounter.objects.filter(user_id=user_id, conversation_id=conversation_id).update(
+            count=Greatest(F('count') - amount, 0)
+        )
+        transaction.on_commit(lambda: UnreadCounterService._apply_delta(conversation_id, [user_id], -amount))
+
+    @staticmethod
+    def get_counts(user_id):
+        """
+        Return {conversation_id: unread count} for a user's conversations with unread messages.
+        """
+        key = redis_key(user_id)
+        try:
+            client = get_redis()
+            cached = client.hgetall(key)
+            if cached:
+                client.expire(key, TTL_SECONDS)
+                return {int(field): int(value) for field, value in cached.items() if field != LOADED_FIELD}
+        except redis.RedisError as e:
+            logger.warning(f"Unread counters unavailable in Redis, reading from database: {str(e)}")
+            return UnreadCounterService._counts_from_db(user_id)
+
+        counts = UnreadCounterService._counts_from_db(user_id)
+        try:
+            pipe = client.pipeline()
+            pipe.delete(key)
+            pipe.hset(key, mapping={LOADED_FIELD: 1, **counts})
+            pipe.expire(key, TTL_SECONDS)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache unread counters for user #{user_id}: {str(e)}")
+        return counts
+
+    @staticmethod
+    def _counts_from_db(user_id):
+        return dict(
+            UnreadCounter.objects.filter(user_id=user_id, count__gt=0).values_list('conversation_id', 'count')
+        )
+
+    @staticmethod
+    def _apply_delta(conversation_id, user_ids, delta):
+        """Mirror a committed change into Redis and push the new counts to the users' sockets."""
+        try:
+            if UnreadCounterService._script is None:
+                UnreadCounterService._script = get_redis().register_script(APPLY_DELTA_SCRIPT)
+            results = UnreadCounterService._script(
+                keys=[redis_key(user_id) for user_id in user_ids], args=[conversation_id, delta]
+            )
+        except redis.RedisError as e:
+            # The table is already up to date; drop the cached hashes so they reload from it
+            logger.warning(f"Failed to update unread counters in Redis: {str(e)}")
+            try:
+                get_redis().delete(*(redis_key(user_id) for user_id in user_ids))
+            except redis.RedisError:
+                pass
+            results = [None] * len(user_ids)
+
+        updates = []
+        for user_id, result in zip(user_ids, results):
+            if result:
+                count, total = result
+            else:
+                counts = UnreadCounterService.get_counts(user_id)
+                count, total = counts.get(conversation_id, 0), sum(counts.values())
+            updates.append((user_id, {'conversation_id': conversation_id, 'count': count, 'total': total}))
+        send_unread_counts(updates)
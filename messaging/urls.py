@@ -11,4 +11,5 @@ router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('presence/', views.PresenceView.as_view(), name='presence'),
 ] 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -15,17 +16,67 @@ def send_message_to_conversation(conversation_id, message_data):
         }
     )
 
-def send_notification_to_user(user_id, notification_data):
+def broadcast_messages_read(conversation_id, user_id, last_message_id):
     """
-    Send a notification to a user through WebSocket
+    Tell everyone in a conversation that a user read it up to a message
     """
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.group_send)(
-        f'notifications_{user_id}',
+        f'chat_{conversation_id}',
         {
-            'type': 'user_notification',
-            'notification': notification_data
+            'type': 'messages_read',
+            'user_id': user_id,
+            'last_message_id': last_message_id
         }
-    ) 
+    )
+
+def send_unread_counts(updates):
+    """
+    Push unread counter changes to the users' notification sockets in a single event loop run.
+    ``updates`` is an iterable of (user_id, {'conversation_id', 'count', 'total'}) pairs.
+    """
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(
+                f'notifications_{user_id}',
+                {
+                    'type': 'unread_count',
+                    'unread': unread
+                }
+            )
+            for user_id, unread in updates
+        ))
+
+    async_to_sync(send_all)()
+
+def send_notification_to_user(user_id, notification_data):
+    """
+    Send a notification to a user through WebSocket
+    """
+    send_notifications_to_users([(user_id, notification_data)])
+
+
+def send_notifications_to_users(notifications):
+    """
+    Send many notifications through WebSocket in a single event loop run.
+    ``notifications`` is an iterable of (user_id, notification_data) pairs.
+    """
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(
+                f'notifications_{user_id}',
+                {
+                    'type': 'user_notification',
+                    'notification': notification_data
+                }
+            )
+            for user_id, notification_data in notifications
+        ))
+
+    async_to_sync(send_all)()
 
 # {'id': 2, 'user': 3, 'travel_listing': 6, 'message': 'A new travel listing matches your alert: France to Germany - 2024-07-01', 'is_read': False, 'created_at': '2025-06-25T14:40:44.316274Z'}
\ No newline at end of file
@@ -2,22 +2,63 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from rest_framework.permissions import IsAuthenticated
 from .models import Conversation, Message, MessageAttachment, Notification
 from .serializers import (
     ConversationSerializer, ConversationCreateSerializer,
-    MessageSerializer, MessageAttachmentSerializer, NotificationSerializer
+    MessageSerializer, MessageAttachmentSerializer, NotificationSerializer,
+    MessageHistorySerializer
 )
-from .utils import send_message_to_conversation
-from config.views import StandardResponseViewSet
+from .history import DEFAULT_LIMIT, MAX_LIMIT, get_senders, history_page
+from .utils import send_message_to_conversation, broadcast_messages_read
+from .unread_counters import UnreadCounterService
+from .notification_service import NotificationService
+from .presence import get_presence_store, partners_among
+from config.views import StandardResponseViewSet, StandardAPIView
 from .permissions import IsMessageOwner
 from config.utils import standard_response
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from users.models import CustomUser
 import datetime
+import redis
 
 # Create your views here.
 
+PROFILE_RELATED = (
+    'profile__city_of_residence__country',
+    'profile__id_type',
+    'profile__issue_country',
+)
+
+
+def with_list_data(queryset, user):
+    """
+    Annotate conversations with everything ConversationSerializer renders, in a
+    constant number of queries: the unread count as a conditional COUNT, the
+    participants (with profiles) and the last message (sender, profile and
+    attachments) as prefetches. The last message prefetch is sliced, which Django
+    runs as one ROW_NUMBER() window query over all the conversations of the page.
+    """
+    users = CustomUser.objects.select_related(*PROFILE_RELATED)
+    last_messages = (
+        Message.objects.select_related(*(f'sender__{path}' for path in PROFILE_RELATED))
+        .prefetch_related('attachments')
+        .order_by('-created_at', '-id')[:1]
+    )
+    return queryset.annotate(
+        unread_messages=Count(
+            'messages',
+            filter=Q(messages__is_read=False) & ~Q(messages__sender=user),
+        )
+    ).prefetch_related(
+        Prefetch('participants', queryset=users),
+        Prefetch('messages', queryset=last_messages, to_attr='latest_messages'),
+    ).order_by('-updated_at', '-id')  # Meta.ordering is dropped from aggregate queries
+
+
 @extend_schema(tags=['Messaging'])
 class ConversationViewSet(StandardResponseViewSet):
     serializer_class = ConversationSerializer
@@ -25,7 +66,10 @@ class ConversationViewSet(StandardResponseViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return Conversation.objects.filter(participants=user).distinct()
+        queryset = Conversation.objects.filter(participants=user)
+        if self.action in ('list', 'retrieve'):
+            queryset = with_list_data(queryset, user)
+        return queryset
 
 
     def get_serializer_class(self):
@@ -62,6 +106,33 @@ class ConversationViewSet(StandardResponseViewSet):
         serializer = MessageSerializer(messages, many=True)
         return Response(serializer.data)
 
+    @extend_schema(
+        tags=['Messaging'],
+        description="Message history in chronological order, navigated by message id. "
+                    "Without parameters returns the latest messages; before_id scrolls back, after_id catches up.",
+        parameters=[
+            OpenApiParameter('before_id', OpenApiTypes.INT, description='Return messages older than this message id'),
+            OpenApiParameter('after_id', OpenApiTypes.INT, description='Return messages newer than this message id'),
+            OpenApiParameter('limit', OpenApiTypes.INT, description=f'Messages per page (default {DEFAULT_LIMIT}, max {MAX_LIMIT})'),
+        ]
+    )
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        conversation = self.get_object()
+        try:
+            messages, has_more = history_page(conversation, request.query_params)
+        except ValueError:
+            return Response({"detail": "Invalid history parameters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        senders = get_senders(message.sender_id for message in messages)
+        serializer = MessageHistorySerializer(messages, many=True, context={'senders': senders})
+        return Response({
+            'results': serializer.data,
+            'has_more': has_more,
+            'before_id': messages[0].id if messages else None,
+            'after_id': messages[-1].id if messages else None,
+        })
+
     @extend_schema(tags=['Messaging'], description="Send a message in a conversation")
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -69,45 +140,38 @@ class ConversationViewSet(StandardResponseViewSet):
         serializer = MessageSerializer(data=request.data)
         
         if serializer.is_valid():
-            message = serializer.save(
-                conversation=conversation,
-                sender=request.user
+            # Attachment uploads are queued on commit, so their chat_message
+            # update always follows this first broadcast
+            with transaction.atomic():
+                message = serializer.save(
+                    conversation=conversation,
+                    sender=request.user
+                )
+
+                # Send message through WebSocket
+                message_data = MessageSerializer(message).data
+                send_message_to_conversation(conversation.id, message_data)
+
+            # Notify the other participants (one INSERT, pushed after commit);
+            # a burst of messages collapses into one notification per conversation
+            recipient_ids = conversation.participants.exclude(pk=request.user.pk).values_list('id', flat=True)
+            notification_message = f"New message from {request.user.username}: {message.content[:30]}..."
+            NotificationService.dispatch(
+                [
+                    (recipient_id, {'message': notification_message, 'conversation_id': conversation.id})
+                    for recipient_id in recipient_ids
+                ],
+                coalesce=True,
             )
             
-            # Send message through WebSocket
-            message_data = MessageSerializer(message).data
-            send_message_to_conversation(conversation.id, message_data)
-
-            # Send notification to other participants
-            from .utils import send_notification_to_user
-            for participant in conversation.participants.all():
-                if participant != request.user:
-                    notification = Notification.objects.create(
-                        user=participant,
-                        conversation=conversation,
-                        message=f"New message from {request.user.username}: {message.content[:30]}..."
-                    )
-                    notification_data = NotificationSerializer(notification).data
-                    send_notification_to_user(participant.id, notification_data)
-            
             return Response(message_data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
-    @extend_schema(tags=['Messaging'], description="Get unread message count for all conversations")
+    @extend_schema(tags=['Messaging'], description="Get unread message counts per conversation (conversations without unread messages are omitted)")
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        user = request.user
-        conversations = self.get_queryset()
-        
-        unread_counts = {}
-        for conversation in conversations:
-            unread_counts[conversation.id] = conversation.messages.filter(
-                is_read=False
-            ).exclude(
-                sender=user
-            ).count()
-        
+        unread_counts = UnreadCounterService.get_counts(request.user.id)
         return Response(unread_counts)
 
 @extend_schema(tags=['Messaging'])
@@ -137,10 +201,13 @@ class MessageViewSet(StandardResponseViewSet):
         message = self.get_object()
         
         # Mark this message and all previous messages in this conversation as read
-        updated_count = Message.objects.filter(
-            conversation=message.conversation,
-            id__lte=message.id
-        ).exclude(sender=request.user).update(is_read=True)
+        with transaction.atomic():
+            updated_count = Message.objects.filter(
+                conversation=message.conversation,
+                id__lte=message.id,
+                is_read=False
+            ).exclude(sender=request.user).update(is_read=True)
+            UnreadCounterService.decrement(request.user.id, message.conversation_id, updated_count)
         
         # Broadcast via WebSocket
         broadcast_messages_read(message.conversation.id, request.user.id, message.id)
@@ -196,11 +263,12 @@ class MessageAttachmentViewSet(viewsets.ModelViewSet):
             Message.objects.filter(conversation__participants=user),
             id=message_id
         )
-        attachment = serializer.save(message=message)
-        
-        # Send updated message through WebSocket
-        message_data = MessageSerializer(message).data
-        send_message_to_conversation(message.conversation.id, message_data)
+        with transaction.atomic():
+            attachment = serializer.save(message=message)
+
+            # Send updated message through WebSocket (again once the upload is done)
+            message_data = MessageSerializer(message).data
+            send_message_to_conversation(message.conversation.id, message_data)
 
 @extend_schema(tags=['Messaging'])
 class NotificationViewSet(viewsets.ModelViewSet):
@@ -223,4 +291,37 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def mark_all_as_read(self, request):
         notifications = self.get_queryset().filter(is_read=False)
         notifications.update(is_read=True)
-        return Response({'status': 'all marked as read'})
\ No newline at end of file
+        return Response({'status': 'all marked as read'})
+
+
+MAX_PRESENCE_IDS = 200
+
+
+@extend_schema(
+    tags=['Messaging'],
+    description="Online status of up to 200 users in one call (false for users you share no conversation with)",
+    parameters=[
+        OpenApiParameter(name='ids', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                         description='Comma separated user ids', required=True),
+    ]
+)
+class PresenceView(StandardAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user_ids = list(dict.fromkeys(
+                int(user_id) for user_id in request.query_params.get('ids', '').split(',') if user_id.strip()
+            ))
+        except ValueError:
+            return Response({'error': 'ids must be a comma separated list of user ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if not user_ids or len(user_ids) > MAX_PRESENCE_IDS:
+            return Response({'error': f'Provide between 1 and {MAX_PRESENCE_IDS} user ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only conversation partners get to see each other's status
+        partners = partners_among(request.user.id, user_ids)
+        try:
+            online = get_presence_store().online([user_id for user_id in user_ids if user_id in partners]) if partners else set()
+        except redis.RedisError:
+            return Response({'error': 'Presence is temporarily unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({str(user_id): user_id in online for user_id in user_ids})
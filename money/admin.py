@@ -3,7 +3,7 @@ from django.shortcuts import redirect
 from django.urls import path
 from django.forms import widgets
 import json
-from .models import Wallet, PaymentGateway, Transaction, Bank, PlatformConfig
+from .models import Wallet, PaymentGateway, Transaction, Bank, PlatformConfig, WebhookEvent
 from .services import ChapaService
 
 class PrettyJSONWidget(widgets.Textarea):
@@ -117,6 +117,16 @@ class TransactionAdmin(admin.ModelAdmin):
             level=messages.SUCCESS if failed_count == 0 else messages.WARNING
         )
 
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'kind', 'gateway', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'kind', 'gateway')
+    search_fields = ('reference', 'event_key')
+    readonly_fields = [f.name for f in WebhookEvent._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(PlatformConfig)
 class PlatformConfigAdmin(admin.ModelAdmin):
     """
@@ -0,0 +1,78 @@
+"""
+Cached bank list for withdrawals.
+
+The serialized list of a gateway's active banks is kept in the shared cache.
+For BANK_LIST_FRESH_SECONDS it is served as is; after that it is still served
+(stale) for up to BANK_LIST_STALE_SECONDS while one refresh_bank_list task
+rebuilds it in the background, so no user request waits on the database or the
+gateway. A gateway without any banks yet gets a bank sync queued instead of
+running one inside the request, and its empty list is not cached, so the next
+request tries again. Bank syncs and admin edits rebuild the entry. If the
+broker is down the list is served all the same and the task left for later.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Bank, PaymentGateway
+from .serializers import BankSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(gateway_code):
+    return f'bank_list:{gateway_code}'
+
+
+def build_bank_list(gateway_code):
+    """Serialize the active banks of a gateway and store them in the cache."""
+    banks = Bank.objects.filter(gateway__code=gateway_code, is_active=True).select_related('gateway').order_by('name')
+    data = BankSerializer(banks, many=True).data
+    if not data and PaymentGateway.objects.filter(code=gateway_code, banks_etag='').exists():
+        # Never synced (or the first sync failed): don't keep serving nothing for a day
+        return data
+    fresh_seconds = getattr(settings, 'BANK_LIST_FRESH_SECONDS', 300)
+    stale_seconds = getattr(settings, 'BANK_LIST_STALE_SECONDS', 24 * 60 * 60)
+    cache.set(
+        cache_key(gateway_code),
+        {'data': data, 'fresh_until': time.time() + fresh_seconds},
+        fresh_seconds + stale_seconds,
+    )
+    return data
+
+
+def enqueue(task, *args):
+    try:
+        task.delay(*args)
+    except Exception as e:
+        logger.warning(f"Could not queue {task.name}: {str(e)}")
+
+
+def get_bank_list(gateway_code):
+    """
+    Active banks of a gateway, serialized.
+
+    Returns:
+        list: BankSerializer data, possibly up to BANK_LIST_STALE_SECONDS old
+    """
+    from .tasks import refresh_bank_list, sync_chapa_banks
+
+    cached = cache.get(cache_key(gateway_code))
+    if cached is None:
+        data = build_bank_list(gateway_code)
+        if not data and gateway_code == 'chapa' and cache.add(f'{cache_key(gateway_code)}:syncing', 1, 60):
+            # First run: fetch the banks in the background; the sync rebuilds this entry
+            enqueue(sync_chapa_banks)
+        return data
+    if cached['fresh_until'] < time.time() and cache.add(f'{cache_key(gateway_code)}:refreshing', 1, 60):
+        # One refresh at a time; everyone else keeps getting the stale copy meanwhile
+        enqueue(refresh_bank_list, gateway_code)
+    return cached['data']
+
+
+def invalidate_bank_list(gateway_code):
+    """Rebuild the cached list after the banks of a gateway changed."""
+    build_bank_list(gateway_code)
+    cache.delete(f'{cache_key(gateway_code)}:refreshing')
@@ -0,0 +1,171 @@
+"""
+HTTP client for the Chapa API.
+
+One client per gateway configuration is shared by the whole process (see
+get_chapa_client), so every ChapaService reuses the same keep-alive connection
+pool. Calls have separate connect and read timeouts; reads (GET) are retried on
+connection errors, timeouts, 429 and 5xx with jittered exponential backoff,
+writes only when the connection could not be made at all. A circuit breaker
+fails calls fast with CircuitOpenError after CHAPA_BREAKER_THRESHOLD consecutive
+failures, and lets one trial call through every CHAPA_BREAKER_RESET_SECONDS.
+
+Latency is recorded per endpoint and outcome in the
+``chapa_request_duration_seconds`` histogram.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = Histogram(
+    'chapa_request_duration_seconds',
+    'Chapa API call latency by endpoint and outcome (2xx/4xx/5xx/error/circuit_open)',
+    ['endpoint', 'outcome'],
+)
+RETRIES = Counter('chapa_request_retries_total', 'Chapa API calls retried', ['endpoint'])
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the gateway while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_seconds=30):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one trial call at a time."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Chapa circuit breaker opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ChapaClient:
+    def __init__(self, base_url, secret_key, pool_size=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff=None, breaker=None):
+        pool_size = pool_size or getattr(settings, 'CHAPA_POOL_SIZE', 20)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (
+            connect_timeout or getattr(settings, 'CHAPA_CONNECT_TIMEOUT', 3.05),
+            read_timeout or getattr(settings, 'CHAPA_READ_TIMEOUT', 10),
+        )
+        self.retries = getattr(settings, 'CHAPA_RETRIES', 2) if retries is None else retries
+        self.backoff = getattr(settings, 'CHAPA_RETRY_BACKOFF', 0.2) if backoff is None else backoff
+        self.breaker = breaker or CircuitBreaker(
+            threshold=getattr(settings, 'CHAPA_BREAKER_THRESHOLD', 5),
+            reset_seconds=getattr(settings, 'CHAPA_BREAKER_RESET_SECONDS', 30),
+        )
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f"Bearer {secret_key}",
+            'Content-Type': 'application/json',
+        })
+
+    def get(self, path, endpoint):
+        return self.request('GET', path, endpoint)
+
+    def post(self, path, endpoint, json=None):
+        return self.request('POST', path, endpoint, json=json)
+
+    def request(self, method, path, endpoint, json=None):
+        """
+        Call ``path`` (relative to the base URL) and return the final response;
+        HTTP errors are left to the caller's raise_for_status().
+
+        Args:
+            endpoint: Name of the endpoint for the metrics
+
+        Raises:
+            CircuitOpenError: If the gateway is considered down
+            requests.exceptions.RequestException: If the call failed on every attempt
+        """
+        idempotent = method == 'GET'
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                REQUEST_SECONDS.labels(endpoint, 'circuit_open').observe(0)
+                raise CircuitOpenError(f"Chapa is unavailable (circuit open), not calling {endpoint}")
+
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", json=json, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                REQUEST_SECONDS.labels(endpoint, 'error').observe(time.perf_counter() - started)
+                self.breaker.record_failure()
+                # A write is only safe to repeat if it never reached the gateway
+                retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or attempt >= self.retries:
+                    raise
+            else:
+                REQUEST_SECONDS.labels(endpoint, f'{response.status_code // 100}xx').observe(time.perf_counter() - started)
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not (idempotent and response.status_code in RETRYABLE_STATUSES) or attempt >= self.retries:
+                    return response
+
+            RETRIES.labels(endpoint).inc()
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_chapa_client(gateway):
+    """Shared client for the gateway's current configuration."""
+    config = gateway.config
+    key = (gateway.code, config.get('CHAPA_BASE_URL', 'https://api.chapa.co/v1'), config.get('CHAPA_SECRET_KEY'))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Drop the client of a previous configuration of this gateway (requests
+            # still running on it finish; its connections close when it is collected)
+            for old_key in [k for k in _clients if k[0] == gateway.code]:
+                del _clients[old_key]
+            client = _clients[key] = ChapaClient(base_url=key[1], secret_key=key[2])
+    return client
@@ -0,0 +1,139 @@
+"""
+Local stand-in for the Chapa API, for load tests and benchmarks.
+
+Serves the endpoints ChapaService uses under /v1. Every reference gets a fixed
+outcome (success or, with probability ``fail_rate``, failure) that is only
+revealed after ``pending_checks`` verify calls; until then deposits answer
+"not paid yet" (HTTP 400, as Chapa does) and transfers report "pending".
+``error_rate`` of all calls fail with HTTP 500 and each call takes ``latency``
+seconds. Point a gateway at it with CHAPA_BASE_URL = stub.base_url.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BANKS = [
+    {'id': 946, 'name': 'Commercial Bank of Ethiopia', 'slug': 'cbe', 'swift': 'CBETETAA', 'acct_length': 13, 'active': 1, 'is_mobilemoney': 0, 'currency': 'ETB'},
+    {'id': 855, 'name': 'telebirr', 'slug': 'telebirr', 'swift': None, 'acct_length': 10, 'active': 1, 'is_mobilemoney': 1, 'currency': 'ETB'},
+]
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of new connections, like a real front end
+    request_queue_size = 128
+
+
+class StubChapaServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, pending_checks=1, fail_rate=0.1, error_rate=0.0):
+        self.latency = latency
+        self.pending_checks = pending_checks
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.checks = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.httpd = StubHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def outcome(self, reference):
+        """Final outcome of ``reference``: 'success' or 'failed'."""
+        return 'failed' if random.Random(reference).random() < self.fail_rate else 'success'
+
+    def start(self):
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _check(self, reference):
+        """Count a verify call; return the outcome, or None while still pending."""
+        with self._lock:
+            self.checks[reference] = self.checks.get(reference, 0) + 1
+            if self.checks[reference] <= self.pending_checks:
+                return None
+        return self.outcome(reference)
+
+    def handle(self, method, path, body):
+        """Return (status, payload) for a request."""
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            return 500, {'message': 'Internal server error', 'status': 'failed', 'data': None}
+
+        match = re.fullmatch(r'/v1/transaction/verify/(.+)', path)
+        if method == 'GET' and match:
+            reference = match.group(1)
+            outcome = self._check(reference)
+            if outcome is None:
+                return 400, {'message': 'Payment not paid yet', 'status': 'failed', 'data': None}
+            if outcome == 'failed':
+                return 200, {'message': 'Payment failed', 'status': 'failed', 'data': None}
+            return 200, {'message': 'Payment details', 'status': 'success', 'data': {
+                'tx_ref': reference, 'reference': f'CH{zlib.crc32(reference.encode())}', 'status': 'success',
+            }}
+
+        match = re.fullmatch(r'/v1/transfers/verify/(.+)', path)
+        if method == 'GET' and match:
+            reference = match.group(1)
+            outcome = self._check(reference) or 'pending'
+            return 200, {'message': 'Transfer details', 'status': 'success', 'data': {
+                'reference': reference, 'chapa_transfer_id': f'TR{zlib.crc32(reference.encode())}', 'status': outcome,
+            }}
+
+        if method == 'GET' and path == '/v1/banks':
+            return 200, {'message': 'Banks retrieved', 'status': 'success', 'data': BANKS}
+        if method == 'POST' and path == '/v1/transaction/initialize':
+            return 200, {'message': 'Hosted Link', 'status': 'success', 'data': {
+                'checkout_url': f"https://checkout.invalid/{body.get('tx_ref')}",
+            }}
+        if method == 'POST' and path == '/v1/transfers':
+            return 200, {'message': 'Transfer Queued Successfully', 'status': 'success', 'data': body.get('reference')}
+        return 404, {'message': 'Not found', 'status': 'failed', 'data': None}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, keep-alive
+            # clients wait on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                status, payload = stub.handle(method, self.path.split('?')[0], body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,131 @@
+"""
+Double-entry ledger.
+
+Every movement of money is a LedgerEntry that moves ``amount`` out of its
+``credit_account`` into its ``debit_account``. An account's balance is the sum
+of its debits minus the sum of its credits, so the balances of all accounts
+always add up to zero. Accounts are plain strings:
+
+    wallet:<id>            spendable balance of a wallet
+    wallet:<id>:locked     money held for package requests and withdrawals
+    platform:revenue       listing/request fees and commission
+    external:<gateway>     money that came in (negative) or went out through a gateway
+    opening                wallet balances that predate the ledger
+
+Wallet.balance and Wallet.locked_balance are snapshots of the two wallet
+accounts: post() appends entries and applies them to the snapshots in the same
+database transaction, and rebuild_wallet() recomputes a snapshot from the ledger.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import LedgerEntry, Wallet
+
+PLATFORM_REVENUE = 'platform:revenue'
+OPENING = 'opening'
+
+
+def wallet_account(wallet_id, locked=False):
+    return f'wallet:{wallet_id}:locked' if locked else f'wallet:{wallet_id}'
+
+
+def gateway_account(gateway=None):
+    return f"external:{gateway.code if gateway else 'unknown'}"
+
+
+def parse_wallet_account(account):
+    """Return (wallet_id, locked) for a wallet account, or None for any other account."""
+    parts = account.split(':')
+    if parts[0] != 'wallet':
+        return None
+    return int(parts[1]), len(parts) == 3
+
+
+def wallet_deltas(entries):
+    """
+    Net effect of ``entries`` on wallet snapshots.
+
+    Returns:
+        dict: {wallet_id: [balance_delta, locked_delta]}
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+    for debit_account, credit_account, amount in entries:
+        for account, signed_amount in ((debit_account, amount), (credit_account, -amount)):
+            parsed = parse_wallet_account(account)
+            if parsed:
+                wallet_id, locked = parsed
+                deltas[wallet_id][1 if locked else 0] += signed_amount
+    return deltas
+
+
+def post(entries, wallets=()):
+    """
+    Append ``entries`` to the ledger and apply them to the wallet snapshots,
+    as F() increments in wallet id order. The wallets involved must already be
+    locked by the caller (see WalletService.lock_wallets).
+
+    Args:
+        entries: Unsaved LedgerEntry instances
+        wallets: Wallet instances to update in memory as well
+
+    Returns:
+        list: The created entries (zero amounts are skipped)
+    """
+    entries = [entry for entry in entries if entry.amount]
+    deltas = wallet_deltas((entry.debit_account, entry.credit_account, entry.amount) for entry in entries)
+    instances = {wallet.id: wallet for wallet in wallets}
+    now = timezone.now()
+    for wallet_id in sorted(deltas):
+        balance_delta, locked_delta = deltas[wallet_id]
+        if not balance_delta and not locked_delta:
+            continue
+        Wallet.objects.filter(pk=wallet_id).update(
+            balance=F('balance') + balance_delta,
+            locked_balance=F('locked_balance') + locked_delta,
+            updated_at=now,
+        )
+        wallet = instances.get(wallet_id)
+        if wallet is not None:
+            wallet.balance += balance_delta
+            wallet.locked_balance += locked_delta
+            wallet.updated_at = now
+    return LedgerEntry.objects.bulk_create(entries)
+
+
+def account_balance(account):
+    """Debits minus credits of one account."""
+    debits = LedgerEntry.objects.filter(debit_account=account).aggregate(total=Sum('amount'))['total']
+    credits = LedgerEntry.objects.filter(credit_account=account).aggregate(total=Sum('amount'))['total']
+    return (debits or Decimal('0')) - (credits or Decimal('0'))
+
+
+@transaction.atomic
+def rebuild_wallet(wallet_id):
+    """
+    Recompute a wallet's balance snapshot from its ledger accounts.
+
+    Returns:
+        tuple: (wallet, changed)
+    """
+    wallet = Wallet.objects.select_for_update().get(pk=wallet_id)
+    balance = account_balance(wallet_account(wallet_id))
+    locked_balance = account_balance(wallet_account(wallet_id, locked=True))
+    changed = (wallet.balance, wallet.locked_balance) != (balance, locked_balance)
+    if changed:
+        wallet.balance = balance
+        wallet.locked_balance = locked_balance
+        wallet.save(update_fields=['balance', 'locked_balance', 'updated_at'])
+    return wallet, changed
+
+
+def delete_wallet_accounts(wallets):
+    """
+    Delete every entry touching the accounts of ``wallets``. Only for throwaway
+    data (load tests and benchmarks); real corrections are new entries.
+    """
+    accounts = [wallet_account(wallet.id, locked) for wallet in wallets for locked in (False, True)]
+    LedgerEntry.objects.filter(Q(debit_account__in=accounts) | Q(credit_account__in=accounts)).delete()
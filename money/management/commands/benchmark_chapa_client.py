@@ -0,0 +1,89 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from prometheus_client import REGISTRY
+
+from money.chapa_client import ChapaClient, CircuitBreaker, CircuitOpenError
+from money.chapa_stub import StubChapaServer
+
+
+class Command(BaseCommand):
+    help = 'Compare bare requests calls with the pooled Chapa client against a local stub gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--latency', type=float, default=0.02, help='Seconds every gateway call takes')
+        parser.add_argument('--error-rate', type=float, default=0.05, help='Share of gateway calls answered with HTTP 500')
+
+    def handle(self, *args, **options):
+        stub = StubChapaServer(latency=options['latency'], pending_checks=0, fail_rate=0, error_rate=options['error_rate']).start()
+        try:
+            def bare(number):
+                return requests.get(f'{stub.base_url}/transaction/verify/bench-{number}', timeout=(3.05, 10))
+
+            client = ChapaClient(stub.base_url, 'bench-key', pool_size=options['workers'], backoff=0.01)
+
+            def pooled(number):
+                return client.get(f'/transaction/verify/bench-{number}', 'bench_verify')
+
+            self._run('bare requests', bare, options)
+            self._run('pooled client', pooled, options)
+            self._report_histogram('bench_verify')
+        finally:
+            stub.stop()
+
+        # With the gateway gone the breaker opens and calls fail fast
+        client = ChapaClient(stub.base_url, 'bench-key', retries=0, breaker=CircuitBreaker(threshold=5, reset_seconds=60))
+        outcomes = []
+        started = time.perf_counter()
+        for number in range(50):
+            try:
+                client.get(f'/transaction/verify/down-{number}', 'bench_down')
+                outcomes.append('ok')
+            except CircuitOpenError:
+                outcomes.append('circuit_open')
+            except requests.exceptions.RequestException:
+                outcomes.append('error')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'gateway down: 50 calls in {elapsed * 1000:.0f}ms, {outcomes.count("error")} reached the network, '
+            f'{outcomes.count("circuit_open")} short-circuited (breaker {client.breaker.state})'
+        )
+
+    def _run(self, label, call, options):
+        latencies = []
+        failures = 0
+
+        def timed(number):
+            started = time.perf_counter()
+            try:
+                ok = call(number).status_code < 500
+            except requests.exceptions.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for latency, ok in pool.map(timed, range(options['calls'])):
+                latencies.append(latency)
+                failures += not ok
+        elapsed = time.perf_counter() - started
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{label}: {options["calls"]} calls in {elapsed:.2f}s ({options["calls"] / elapsed:.0f}/s) '
+            f'p50={quantiles[49] * 1000:.1f}ms p95={quantiles[94] * 1000:.1f}ms p99={quantiles[98] * 1000:.1f}ms '
+            f'failed={failures}'
+        )
+
+    def _report_histogram(self, endpoint):
+        for metric in REGISTRY.collect():
+            if metric.name not in ('chapa_request_duration_seconds', 'chapa_request_retries'):
+                continue
+            for sample in metric.samples:
+                if sample.labels.get('endpoint') != endpoint or sample.name.endswith('_bucket') or sample.name.endswith('_created'):
+                    continue
+                self.stdout.write(f'  {sample.name}{{{", ".join(f"{k}={v}" for k, v in sample.labels.items())}}} {sample.value:g}')
@@ -0,0 +1,145 @@
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from money import ledger
+from money.chapa_stub import StubChapaServer
+from money.models import LedgerEntry, PaymentGateway, Transaction, Wallet
+from money.services import ChapaService
+from money.verifier import verify_pending
+from money.wallet_service import WalletService
+
+User = get_user_model()
+
+EMAIL_DOMAIN = '@verifier-bench.invalid'
+GATEWAY_CODE = 'chapa-stub'
+
+
+class Command(BaseCommand):
+    help = 'Verify pending deposits and withdrawals against a local stub gateway and check the outcome'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=400, help='Pending transactions (half deposits, half withdrawals)')
+        parser.add_argument('--workers', type=int, default=8, help='Verifier concurrency')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds every gateway call takes')
+        parser.add_argument('--pending-checks', type=int, default=1, help='Checks answered "pending" before the outcome')
+        parser.add_argument('--fail-rate', type=float, default=0.1)
+        parser.add_argument('--error-rate', type=float, default=0.02, help='Share of gateway calls answered with HTTP 500')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        stub = StubChapaServer(
+            latency=options['latency'],
+            pending_checks=options['pending_checks'],
+            fail_rate=options['fail_rate'],
+            error_rate=options['error_rate'],
+        ).start()
+        gateway, _ = PaymentGateway.objects.update_or_create(
+            code=GATEWAY_CODE,
+            defaults={'name': 'Chapa stub', 'is_active': False, 'config': {'CHAPA_BASE_URL': stub.base_url}},
+        )
+        try:
+            transactions = self._pending_transactions(gateway, options['transactions'])
+            service = ChapaService(gateway=gateway)
+            ok = self._run(stub, service, transactions, options)
+        finally:
+            stub.stop()
+            if not options['keep']:
+                ledger.delete_wallet_accounts(Wallet.objects.filter(user__email__endswith=EMAIL_DOMAIN))
+                User.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+                gateway.delete()
+        if not ok:
+            raise CommandError('Verified transactions do not match the gateway outcomes')
+
+    def _run(self, stub, service, transactions, options):
+        ids = [txn.id for txn in transactions]
+        rounds = 0
+        totals = Counter()
+        started = time.perf_counter()
+        while Transaction.objects.filter(id__in=ids, status=Transaction.Status.PENDING).exists():
+            rounds += 1
+            if rounds > options['pending_checks'] + 10:
+                break
+            # Pretend the re-check delay has passed
+            Transaction.objects.filter(id__in=ids).update(next_check_at=timezone.now())
+            results = verify_pending(
+                batch_size=options['batch_size'], workers=options['workers'], time_budget=3600, service=service,
+            )
+            totals.update({key: value for key, value in results.items() if key != 'errors'})
+            totals['errors'] += len(results['errors'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{len(ids)} transactions settled in {rounds} round(s), {elapsed:.2f}s: {totals["processed"]} checks '
+            f'({totals["processed"] / elapsed:.0f}/s, {stub.requests} gateway calls) '
+            f'success={totals["success"]} not_verified={totals["failed"]} errors={totals["errors"]}'
+        )
+
+        mismatched = []
+        for txn in Transaction.objects.filter(id__in=ids).annotate(entry_count=Count('ledger_entries')):
+            expected = Transaction.Status.SUCCESS if stub.outcome(txn.reference) == 'success' else Transaction.Status.FAILED
+            # Deposits: one credit when paid. Withdrawals: the hold, then a settlement or a release.
+            expected_entries = (1 if expected == Transaction.Status.SUCCESS else 0) if txn.transaction_type == Transaction.TransactionType.DEPOSIT else 2
+            if txn.status != expected or txn.entry_count != expected_entries:
+                mismatched.append(f'{txn.reference}: {txn.status} with {txn.entry_count} ledger entries, expected {expected} with {expected_entries}')
+        for line in mismatched[:20]:
+            self.stdout.write(line)
+        call_command('reconcile_ledger', stdout=self.stdout)
+
+        if mismatched:
+            self.stdout.write(self.style.ERROR(f'{len(mismatched)} transaction(s) ended in the wrong state'))
+            return False
+        self.stdout.write(self.style.SUCCESS('Every transaction ended as the gateway decided, exactly once'))
+        return True
+
+    def _pending_transactions(self, gateway, count):
+        users = []
+        for number in range(10):
+            user = User.objects.filter(email=f'user{number}{EMAIL_DOMAIN}').first()
+            if user is None:
+                user = User.objects.create_user(
+                    email=f'user{number}{EMAIL_DOMAIN}',
+                    username=f'verifier-bench-{number}',
+                    phone_number=f'0988{number:07d}',
+                )
+            users.append(user)
+
+        deposits = Transaction.objects.bulk_create([
+            Transaction(
+                wallet=users[number % len(users)].wallet,
+                amount=Decimal('100'),
+                transaction_type=Transaction.TransactionType.DEPOSIT,
+                status=Transaction.Status.PENDING,
+                gateway=gateway,
+                description='Deposit via Chapa stub',
+            )
+            for number in range(count // 2)
+        ])
+
+        withdrawals = []
+        with transaction.atomic():
+            wallets = WalletService.lock_wallets([user.id for user in users]).values()
+            ledger.post([
+                LedgerEntry(debit_account=ledger.wallet_account(wallet.id), credit_account=ledger.gateway_account(gateway), amount=Decimal('10') * count)
+                for wallet in wallets
+            ])
+            for number in range(count - count // 2):
+                txn = Transaction.objects.create(
+                    wallet=users[number % len(users)].wallet,
+                    amount=Decimal('10'),
+                    transaction_type=Transaction.TransactionType.WITHDRAWAL,
+                    status=Transaction.Status.PENDING,
+                    gateway=gateway,
+                    description='Withdrawal via Chapa stub',
+                )
+                WalletService.hold_withdrawal(txn)
+                withdrawals.append(txn)
+        return deposits + withdrawals
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from money.chapa_stub import StubChapaServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Chapa API (point a gateway at it with CHAPA_BASE_URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds every call takes')
+        parser.add_argument('--pending-checks', type=int, default=1, help='Verify calls answered "pending" before the outcome')
+        parser.add_argument('--fail-rate', type=float, default=0.1, help='Share of payments and transfers that end up failed')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with HTTP 500')
+
+    def handle(self, *args, **options):
+        stub = StubChapaServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            pending_checks=options['pending_checks'],
+            fail_rate=options['fail_rate'],
+            error_rate=options['error_rate'],
+        )
+        self.stdout.write(f'Stub Chapa API at {stub.base_url} (Ctrl+C to stop)')
+        try:
+            stub.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.httpd.server_close()
@@ -0,0 +1,83 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from money import ledger
+from money.models import LedgerEntry, Wallet
+
+
+class Command(BaseCommand):
+    help = 'Replay the ledger and check every wallet balance against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per round trip of the streaming cursors')
+        parser.add_argument('--repair', action='store_true', help='Rebuild the balance of mismatched wallets from the ledger')
+        parser.add_argument('--show', type=int, default=20, help='Mismatched wallets to print')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Both passes see the same snapshot, so postings made meanwhile
+                # don't show up as mismatches
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            entry_count, wallet_count, others, mismatched, orphaned = self._scan(chunk_size)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'{entry_count} entries and {wallet_count} wallets checked in {elapsed:.2f}s')
+        for account, balance in sorted(others.items()):
+            self.stdout.write(f'  {account}: {balance}')
+        if orphaned:
+            self.stdout.write(f'{len(orphaned)} ledger account(s) of deleted wallets still hold money')
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Every wallet matches the ledger'))
+            return
+
+        for wallet_id, balance, locked_balance, (expected_balance, expected_locked) in mismatched[:options['show']]:
+            self.stdout.write(
+                f'wallet {wallet_id}: balance={balance} locked={locked_balance} '
+                f'ledger balance={expected_balance} locked={expected_locked}'
+            )
+        if not options['repair']:
+            raise CommandError(f'{len(mismatched)} wallet(s) do not match the ledger (rerun with --repair to rebuild them)')
+
+        # Rebuild under the wallet lock, from the ledger as it is now
+        repaired = sum(ledger.rebuild_wallet(wallet_id)[1] for wallet_id, *_ in mismatched)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {repaired} of {len(mismatched)} mismatched wallet(s)'))
+
+    def _scan(self, chunk_size):
+        # One pass over the ledger; iterator() streams it through a server-side
+        # cursor on PostgreSQL, so memory is bounded by the number of accounts
+        wallets = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+        others = defaultdict(Decimal)
+        entry_count = 0
+        entries = LedgerEntry.objects.order_by().values_list('debit_account', 'credit_account', 'amount')
+        for debit_account, credit_account, amount in entries.iterator(chunk_size=chunk_size):
+            entry_count += 1
+            for account, signed_amount in ((debit_account, amount), (credit_account, -amount)):
+                parsed = ledger.parse_wallet_account(account)
+                if parsed:
+                    wallet_id, locked = parsed
+                    wallets[wallet_id][1 if locked else 0] += signed_amount
+                else:
+                    others[account] += signed_amount
+
+        # One pass over the wallets
+        mismatched = []
+        wallet_count = 0
+        rows = Wallet.objects.order_by().values_list('id', 'balance', 'locked_balance')
+        for wallet_id, balance, locked_balance in rows.iterator(chunk_size=chunk_size):
+            wallet_count += 1
+            expected = wallets.pop(wallet_id, None) or [Decimal('0'), Decimal('0')]
+            if [balance, locked_balance] != expected:
+                mismatched.append((wallet_id, balance, locked_balance, expected))
+        # Whatever is left belongs to deleted wallets
+        orphaned = {wallet_id: sums for wallet_id, sums in wallets.items() if any(sums)}
+        return entry_count, wallet_count, others, mismatched, orphaned
@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Count
+
+from money import ledger
+from money.chapa_stub import StubChapaServer
+from money.models import LedgerEntry, PaymentGateway, Transaction, Wallet, WebhookEvent
+from money.services import ChapaService
+from money.wallet_service import WalletService
+from money.webhooks import apply_event, parse_event
+
+User = get_user_model()
+
+EMAIL_DOMAIN = '@webhook-replay.invalid'
+GATEWAY_CODE = 'chapa-replay'
+
+
+class Command(BaseCommand):
+    help = 'Deliver the same gateway webhook many times at once and check each transaction is settled exactly once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', type=int, default=100, help='Concurrent deliveries of every webhook')
+        parser.add_argument('--deposits', type=int, default=3)
+        parser.add_argument('--withdrawals', type=int, default=3)
+        parser.add_argument('--workers', type=int, default=32, help='Thread pool size')
+        parser.add_argument('--latency', type=float, default=0.02, help='Seconds every gateway call takes')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            # SQLite serializes writers on a file lock, so the deliveries would never race
+            raise CommandError('This replay test needs PostgreSQL (concurrent settlement is what is being tested).')
+
+        stub = StubChapaServer(latency=options['latency'], pending_checks=0, fail_rate=0).start()
+        gateway, _ = PaymentGateway.objects.update_or_create(
+            code=GATEWAY_CODE,
+            defaults={'name': 'Chapa replay stub', 'is_active': False, 'config': {'CHAPA_BASE_URL': stub.base_url}},
+        )
+        try:
+            wallet, transactions = self._pending_transactions(gateway, options['deposits'], options['withdrawals'])
+            ok = self._run(ChapaService(gateway=gateway), gateway, wallet, transactions, options)
+        finally:
+            stub.stop()
+            if not options['keep']:
+                WebhookEvent.objects.filter(gateway=GATEWAY_CODE).delete()
+                ledger.delete_wallet_accounts(Wallet.objects.filter(user__email__endswith=EMAIL_DOMAIN))
+                User.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+                gateway.delete()
+        if not ok:
+            raise CommandError('A replayed webhook was applied more than once')
+
+    def _run(self, service, gateway, wallet, transactions, options):
+        payloads = [
+            {'type': 'Payout', 'reference': str(txn.reference), 'status': 'success'}
+            if txn.transaction_type == Transaction.TransactionType.WITHDRAWAL
+            else {'tx_ref': str(txn.reference), 'status': 'success'}
+            for txn in transactions
+        ]
+        deliveries = [payload for payload in payloads for _ in range(options['deliveries'])]
+        barrier = threading.Barrier(min(options['workers'], len(deliveries)))
+
+        def deliver(payload):
+            try:
+                try:
+                    barrier.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+                # What the inbox does with every delivery: store it once, then apply it
+                event = parse_event(GATEWAY_CODE, payload)
+                event, created = WebhookEvent.objects.get_or_create(
+                    event_key=event.event_key,
+                    defaults={'gateway': event.gateway, 'kind': event.kind, 'reference': event.reference, 'payload': payload},
+                )
+                # Apply every delivery, as overlapping drains, the user's own check and
+                # the periodic verifier would, to race the settlement itself
+                status, message = apply_event(service, event)
+                return created, status
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            outcomes = list(pool.map(deliver, deliveries))
+        elapsed = time.perf_counter() - started
+
+        stored = sum(1 for created, _ in outcomes if created)
+        statuses = Counter(str(status) for _, status in outcomes)
+        self.stdout.write(
+            f'{len(deliveries)} deliveries of {len(payloads)} webhooks in {elapsed:.2f}s: '
+            f'{stored} event(s) stored, outcomes {dict(statuses)}'
+        )
+
+        problems = []
+        if stored != len(payloads):
+            problems.append(f'{stored} events stored for {len(payloads)} webhooks')
+        for txn in Transaction.objects.filter(id__in=[txn.id for txn in transactions]).annotate(entry_count=Count('ledger_entries')):
+            # Deposits: the credit. Withdrawals: the hold and the settlement.
+            expected_entries = 1 if txn.transaction_type == Transaction.TransactionType.DEPOSIT else 2
+            if txn.status != Transaction.Status.SUCCESS or txn.entry_count != expected_entries:
+                problems.append(f'{txn.reference}: {txn.status} with {txn.entry_count} ledger entries, expected {expected_entries}')
+
+        wallet.refresh_from_db()
+        deposited = sum(txn.amount for txn in transactions if txn.transaction_type == Transaction.TransactionType.DEPOSIT)
+        withdrawn = sum(txn.amount for txn in transactions if txn.transaction_type == Transaction.TransactionType.WITHDRAWAL)
+        expected_balance = self.opening + deposited - withdrawn
+        if wallet.balance != expected_balance or wallet.locked_balance != 0:
+            problems.append(
+                f'Wallet holds {wallet.balance} (locked {wallet.locked_balance}), expected {expected_balance} (locked 0)'
+            )
+        for line in problems:
+            self.stdout.write(line)
+        call_command('reconcile_ledger', stdout=self.stdout)
+
+        if problems:
+            self.stdout.write(self.style.ERROR(f'{len(problems)} problem(s) found'))
+            return False
+        self.stdout.write(self.style.SUCCESS('Every webhook was stored and settled exactly once'))
+        return True
+
+    def _pending_transactions(self, gateway, deposits, withdrawals):
+        user = User.objects.filter(email=f'replay{EMAIL_DOMAIN}').first()
+        if user is None:
+            user = User.objects.create_user(email=f'replay{EMAIL_DOMAIN}', username='webhook-replay', phone_number='09870000000')
+        amount = Decimal('25')
+
+        transactions = []
+        with transaction.atomic():
+            wallet = WalletService.lock_wallets([user.id])[user.id]
+            ledger.post([
+                LedgerEntry(debit_account=ledger.wallet_account(wallet.id), credit_account=ledger.gateway_account(gateway), amount=amount * withdrawals),
+            ], [wallet])
+            for transaction_type, count in ((Transaction.TransactionType.DEPOSIT, deposits), (Transaction.TransactionType.WITHDRAWAL, withdrawals)):
+                for _ in range(count):
+                    txn = Transaction.objects.create(
+                        wallet=wallet,
+                        amount=amount,
+                        transaction_type=transaction_type,
+                        status=Transaction.Status.PENDING,
+                        gateway=gateway,
+                        description='Webhook replay',
+                    )
+                    if transaction_type == Transaction.TransactionType.WITHDRAWAL:
+                        WalletService.hold_withdrawal(txn)
+                    transactions.append(txn)
+        wallet.refresh_from_db()
+        # What the wallet holds once every withdrawal is paid out, before the deposits
+        self.opening = wallet.balance + wallet.locked_balance
+        return wallet, transactions
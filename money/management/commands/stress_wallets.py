@@ -0,0 +1,203 @@
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from listings.models import Country, PackageRequest, Region, TransportType, TravelListing
+from money import ledger
+from money.models import LedgerEntry, PlatformConfig, Transaction, Wallet
+from money.wallet_service import InsufficientBalanceError, WalletService
+
+User = get_user_model()
+
+STRESS_MARKER = '[wallet-stress]'
+EMAIL_DOMAIN = '@wallet-stress.invalid'
+STRESS_ACCOUNT = 'external:wallet-stress'
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent wallet operations across a pool of wallets and check that no money is created or lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=20, help='Number of wallets (fewer wallets = more contention)')
+        parser.add_argument('--operations', type=int, default=2000, help='Package requests to lock and then release or refund')
+        parser.add_argument('--listing-fees', type=int, default=500, help='Listing fees to charge alongside')
+        parser.add_argument('--balance', type=int, default=100000, help='Starting balance of every wallet')
+        parser.add_argument('--workers', type=int, default=32, help='Thread pool size')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            # SQLite ignores select_for_update and serializes writers on a file lock,
+            # so neither the race nor the throughput would be representative
+            raise CommandError('This stress test needs PostgreSQL (row locks are what is being tested).')
+
+        rng = random.Random(options['seed'])
+        # Create the config row up front so the workers don't race to create it
+        PlatformConfig.get_config()
+        try:
+            users = self._users(options['wallets'], Decimal(options['balance']))
+            listings = self._listings(users)
+            requests = self._pending_requests(users, listings, options['operations'], rng)
+            jobs = [('request', package_request, rng.random() < 0.5) for package_request in requests]
+            jobs += [('listing_fee', rng.choice(listings), None) for _ in range(options['listing_fees'])]
+            rng.shuffle(jobs)
+            ok = self._run(users, jobs, Decimal(options['balance']), options['workers'])
+        finally:
+            if not options['keep']:
+                TravelListing.objects.filter(notes=STRESS_MARKER).delete()
+                ledger.delete_wallet_accounts(Wallet.objects.filter(user__email__endswith=EMAIL_DOMAIN))
+                User.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+
+        if not ok:
+            raise CommandError('Wallet balances drifted from the transaction log')
+
+    def _run(self, users, jobs, starting_balance, workers):
+        def work(job):
+            kind, target, release = job
+            try:
+                if kind == 'listing_fee':
+                    WalletService.deduct_listing_fee(target.user, target)
+                    return 'listing_fee'
+                WalletService.deduct_request_fee_and_lock_amount(target.user, target)
+                if release:
+                    WalletService.release_payment_to_traveler(target)
+                    return 'released'
+                WalletService.refund_locked_amount(target)
+                return 'refunded'
+            except InsufficientBalanceError:
+                return 'declined'
+            finally:
+                # Every worker thread holds its own connection
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = Counter(pool.map(work, jobs))
+        elapsed = time.perf_counter() - started
+
+        wallet_ids = [user.wallet.id for user in users]
+        transactions = Transaction.objects.filter(wallet_id__in=wallet_ids, status=Transaction.Status.SUCCESS)
+        committed = outcomes['listing_fee'] + outcomes['released'] + outcomes['refunded']
+        self.stdout.write(
+            f'{len(jobs)} operations in {elapsed:.2f}s ({len(jobs) / elapsed:.0f} ops/s, '
+            f'{transactions.count() / elapsed:.0f} transactions/s), {dict(outcomes)}'
+        )
+
+        # 1. Conservation: wallets plus platform revenue still add up to what we started with
+        totals = Wallet.objects.filter(id__in=wallet_ids).aggregate(balance=Sum('balance'), locked=Sum('locked_balance'))
+        revenue = transactions.filter(
+            transaction_category=Transaction.TransactionCategory.SYSTEM_REVENUE
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        expected_total = starting_balance * len(users)
+        actual_total = totals['balance'] + totals['locked'] + revenue
+        conserved = actual_total == expected_total and totals['locked'] == 0
+        self.stdout.write(
+            f'total: balance={totals["balance"]} locked={totals["locked"]} revenue={revenue} '
+            f'sum={actual_total} expected={expected_total} ({committed} committed operations)'
+        )
+
+        # 2. Every wallet matches a replay of its transaction log
+        expected = defaultdict(lambda: [starting_balance, Decimal('0')])
+        for txn in transactions.order_by('id').iterator():
+            wallet = expected[txn.wallet_id]
+            if txn.transaction_type in (Transaction.TransactionType.LISTING_FEE, Transaction.TransactionType.REQUEST_FEE):
+                wallet[0] -= txn.amount
+            elif txn.transaction_type == Transaction.TransactionType.PAYMENT_LOCK:
+                wallet[0] -= txn.amount
+                wallet[1] += txn.amount
+            elif txn.transaction_type == Transaction.TransactionType.PAYMENT_UNLOCK:
+                wallet[0] += txn.amount
+                wallet[1] -= txn.amount
+            elif txn.transaction_type == Transaction.TransactionType.PAYMENT_RELEASE:
+                wallet[1] -= txn.amount
+                expected[txn.recipient_wallet_id][0] += txn.amount
+            elif txn.transaction_type == Transaction.TransactionType.COMMISSION:
+                wallet[1] -= txn.amount
+        drifted = [
+            wallet for wallet in Wallet.objects.filter(id__in=wallet_ids)
+            if [wallet.balance, wallet.locked_balance] != expected[wallet.id]
+        ]
+        for wallet in drifted[:10]:
+            self.stdout.write(
+                f'wallet {wallet.id}: balance={wallet.balance} locked={wallet.locked_balance} '
+                f'replayed={expected[wallet.id]}'
+            )
+
+        if conserved and not drifted:
+            self.stdout.write(self.style.SUCCESS('balances are conserved and match the transaction log'))
+            return True
+        self.stdout.write(self.style.ERROR(f'conserved={conserved}, {len(drifted)} wallet(s) drifted'))
+        return False
+
+    def _users(self, count, balance):
+        users = []
+        for number in range(count):
+            user = User.objects.filter(email=f'user{number}{EMAIL_DOMAIN}').first()
+            if user is None:
+                user = User.objects.create_user(
+                    email=f'user{number}{EMAIL_DOMAIN}',
+                    username=f'wallet-stress-{number}',
+                    phone_number=f'0999{number:07d}',
+                )
+            users.append(user)
+        Transaction.objects.filter(wallet__user__in=users).delete()
+        # Top the wallets up through the ledger, so they still reconcile afterwards
+        with transaction.atomic():
+            wallets = WalletService.lock_wallets([user.id for user in users]).values()
+            ledger.post([
+                LedgerEntry(debit_account=ledger.wallet_account(wallet.id), credit_account=STRESS_ACCOUNT, amount=balance - wallet.balance)
+                for wallet in wallets if wallet.balance < balance
+            ] + [
+                LedgerEntry(debit_account=STRESS_ACCOUNT, credit_account=ledger.wallet_account(wallet.id), amount=wallet.balance - balance)
+                for wallet in wallets if wallet.balance > balance
+            ])
+        return users
+
+    def _listings(self, users):
+        country, _ = Country.objects.get_or_create(code='ZS', defaults={'name': 'Stress Country'})
+        region, _ = Region.objects.get_or_create(country=country, name='Stress Region')
+        transport, _ = TransportType.objects.get_or_create(name='Stress')
+        return [
+            TravelListing.objects.create(
+                user=user,
+                pickup_country=country,
+                pickup_region=region,
+                destination_country=country,
+                destination_region=region,
+                travel_date=(timezone.now() + timedelta(days=7)).date(),
+                travel_time=timezone.now().time().replace(microsecond=0),
+                mode_of_transport=transport,
+                maximum_weight_in_kg=Decimal('100'),
+                price_per_kg=Decimal('100'),
+                status='published',
+                notes=STRESS_MARKER,
+            )
+            for user in users
+        ]
+
+    def _pending_requests(self, users, listings, count, rng):
+        # bulk_create skips the listing signals: the wallet operations are driven directly
+        created = PackageRequest.objects.bulk_create([
+            PackageRequest(
+                user=rng.choice(users),
+                travel_listing=rng.choice(listings),
+                package_description='stress',
+                weight=Decimal('1'),
+                total_price=Decimal(rng.randint(1, 50000)) / 100,
+                status='pending',
+            )
+            for _ in range(count)
+        ])
+        return list(PackageRequest.objects.filter(
+            pk__in=[package_request.pk for package_request in created]
+        ).select_related('user', 'travel_listing'))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_wallet_accounts(apps, schema_editor):
+    # Existing balances enter the ledger as opening entries, so every wallet
+    # reconciles from the start (accounts as in money.ledger)
+    Wallet = apps.get_model('money', 'Wallet')
+    LedgerEntry = apps.get_model('money', 'LedgerEntry')
+    entries = []
+    for wallet_id, balance, locked_balance in Wallet.objects.values_list('id', 'balance', 'locked_balance').iterator():
+        for account, amount in ((f'wallet:{wallet_id}', balance), (f'wallet:{wallet_id}:locked', locked_balance)):
+            if amount > 0:
+                entries.append(LedgerEntry(debit_account=account, credit_account='opening', amount=amount))
+            elif amount < 0:
+                entries.append(LedgerEntry(debit_account='opening', credit_account=account, amount=-amount))
+    LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0004_platformconfig_transaction_recipient_wallet_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debit_account', models.CharField(db_index=True, max_length=64)),
+                ('credit_account', models.CharField(db_index=True, max_length=64)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='money.transaction')),
+            ],
+            options={
+                'verbose_name_plural': 'Ledger entries',
+                'constraints': [models.CheckConstraint(condition=models.Q(('amount__gt', 0)), name='ledger_entry_amount_positive')],
+            },
+        ),
+        migrations.RunPython(open_wallet_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_travellisting_capacity_columns'),
+        ('money', '0005_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='check_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'next_check_at'], name='transaction_status_check_idx'),
+        ),
+    ]
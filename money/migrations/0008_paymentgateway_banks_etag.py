@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0007_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentgateway',
+            name='banks_etag',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from config.versioned_cache import VersionedCache
 import uuid
 
 class Wallet(models.Model):
@@ -20,12 +22,32 @@ class PaymentGateway(models.Model):
     is_active = models.BooleanField(default=False)
     config = models.JSONField(default=dict, blank=True, help_text="Configuration for the payment gateway (API keys, etc.)")
     required_fields = models.JSONField(default=list, blank=True, help_text="List of required configuration fields")
+    # Hash of the bank list last synced from the gateway (see ChapaService.sync_banks)
+    banks_etag = models.CharField(max_length=64, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_active(cls, code):
+        """
+        Active gateway by code, cached like PlatformConfig.get_config() and
+        invalidated when a gateway is saved.
+
+        Raises:
+            PaymentGateway.DoesNotExist: If there is no active gateway with that code
+        """
+        gateway = payment_gateway_cache.get(code)
+        if gateway is None:
+            raise cls.DoesNotExist(f"No active payment gateway '{code}'")
+        return gateway
+
+    @classmethod
+    def load_active(cls, code):
+        return cls.objects.filter(code=code, is_active=True).first()
+
 class Transaction(models.Model):
     class TransactionType(models.TextChoices):
         DEPOSIT = 'DEPOSIT', _('Deposit')
@@ -88,12 +110,89 @@ class Transaction(models.Model):
         related_name='transactions'
     )
     
+    # Gateway status polling of pending transactions (see money.verifier)
+    next_check_at = models.DateTimeField(null=True, blank=True)
+    check_attempts = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_check_at'], name='transaction_status_check_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} - {self.status}"
 
+class WebhookEvent(models.Model):
+    """
+    Inbox of signature-checked gateway webhooks. The view only stores them;
+    money.tasks.process_webhook_events re-verifies and applies them (see money.webhooks).
+    """
+    class Kind(models.TextChoices):
+        PAYMENT = 'payment', _('Payment')
+        PAYOUT = 'payout', _('Payout')
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROCESSED = 'processed', _('Processed')
+        FAILED = 'failed', _('Failed')
+
+    gateway = models.CharField(max_length=50)
+    # Identifies the event across gateway retries: gateway, kind, reference and status
+    event_key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    reference = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    process_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'process_after'], name='webhook_event_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_key} ({self.status})"
+
+class LedgerEntry(models.Model):
+    """
+    One movement of money in the double-entry ledger (see money.ledger):
+    ``amount`` leaves ``credit_account`` and enters ``debit_account``.
+    Entries are append-only; corrections are new entries.
+    """
+    debit_account = models.CharField(max_length=64, db_index=True)
+    credit_account = models.CharField(max_length=64, db_index=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Ledger entries"
+        constraints = [
+            models.CheckConstraint(condition=models.Q(amount__gt=0), name='ledger_entry_amount_positive'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.credit_account} -> {self.debit_account}: {self.amount}"
+
+
 class Bank(models.Model):
     gateway = models.ForeignKey(PaymentGateway, on_delete=models.CASCADE, related_name='banks')
     name = models.CharField(max_length=100)
@@ -197,9 +296,36 @@ class PlatformConfig(models.Model):
     
     @classmethod
     def get_config(cls):
-        """Get or create the singleton config instance."""
+        """
+        Get or create the singleton config instance.
+
+        Served from a process-local copy that is checked against the shared
+        cache at most every PLATFORM_CONFIG_LOCAL_SECONDS (see
+        config.versioned_cache), so requests normally do not query for it at
+        all. Saving the config invalidates every copy.
+        """
+        return platform_config_cache.get()
+
+    @classmethod
+    def load(cls, key=None):
         config, created = cls.objects.get_or_create(pk=1)
+        if created:
+            # Load the field defaults back as Decimals
+            config.refresh_from_db()
         return config
+
+    @classmethod
+    def invalidate_cache(cls):
+        platform_config_cache.invalidate()
     
     def __str__(self):
         return "Platform Configuration"
+
+
+payment_gateway_cache = VersionedCache(
+    'payment_gateway', PaymentGateway.load_active, local_seconds_setting='PAYMENT_GATEWAY_LOCAL_SECONDS'
+)
+
+platform_config_cache = VersionedCache(
+    'platform_config', PlatformConfig.load, local_seconds_setting='PLATFORM_CONFIG_LOCAL_SECONDS'
+)
@@ -1,18 +1,52 @@
 import requests
 from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
 from .models import PaymentGateway, Transaction, Wallet
+from .chapa_client import get_chapa_client
+from .wallet_service import WalletService
 import uuid
 import json
 
+
 class ChapaService:
-    def __init__(self):
-        self.gateway = PaymentGateway.objects.get(code='chapa', is_active=True)
+    def __init__(self, gateway=None, client=None):
+        # Both are shared per process: the gateway row is cached and the client
+        # keeps its connections open across services
+        self.gateway = gateway or PaymentGateway.get_active('chapa')
         self.config = self.gateway.config
-        self.base_url = self.config.get('CHAPA_BASE_URL', 'https://api.chapa.co/v1')
-        self.headers = {
-            'Authorization': f"Bearer {self.config.get('CHAPA_SECRET_KEY')}",
-            'Content-Type': 'application/json'
-        }
+        self.client = client or get_chapa_client(self.gateway)
+
+    @staticmethod
+    def settle(transaction, status, apply=None, **fields):
+        """
+        Move a pending transaction to ``status`` exactly once.
+
+        The status change is a conditional UPDATE (... WHERE status = 'PENDING'),
+        so of several concurrent verifications of the same reference (webhook,
+        user check, periodic task) only one makes it; the others wait on its row
+        lock and then match no row. ``apply`` moves the money in the same
+        database transaction, only for the call that made the change.
+
+        Args:
+            transaction: Transaction instance, refreshed in place
+            status: Final Transaction.Status
+            apply: Callable taking the transaction, e.g. WalletService.credit_deposit
+            **fields: Other fields to update with the status
+
+        Returns:
+            bool: Whether this call settled the transaction
+        """
+        with db_transaction.atomic():
+            settled = Transaction.objects.filter(
+                pk=transaction.pk, status=Transaction.Status.PENDING
+            ).update(status=status, updated_at=timezone.now(), **fields)
+            transaction.refresh_from_db()
+            if settled and apply:
+                apply(transaction)
+        return bool(settled)
 
     def verify_webhook_signature(self, body_data, chapa_signature=None, x_chapa_signature=None):
         """
@@ -96,7 +130,7 @@ class ChapaService:
         }
 
         try:
-            response = requests.post(f"{self.base_url}/transaction/initialize", json=payload, headers=self.headers)
+            response = self.client.post("/transaction/initialize", "initialize", json=payload)
             response.raise_for_status()
             data = response.json()
             if data['status'] == 'success':
@@ -123,29 +157,49 @@ class ChapaService:
             transaction.save()
             raise e
 
-    def verify_transaction(self, tx_ref):
+    # Chapa's answers for a payment that was never made: "Payment not paid yet"
+    # (400) and "Invalid transaction or Transaction not found" (404)
+    UNPAID_STATUSES = (400, 404)
+    UNPAID_MESSAGES = ('not paid', 'not found')
+
+    def is_unpaid_answer(self, response):
+        """Whether a verify response definitively says the payment was not made."""
+        if response.status_code not in self.UNPAID_STATUSES:
+            return False
         try:
-            response = requests.get(f"{self.base_url}/transaction/verify/{tx_ref}", headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
+            message = str(response.json().get('message') or '').lower()
+        except ValueError:
+            return False
+        return any(text in message for text in self.UNPAID_MESSAGES)
+
+    def verify_transaction(self, tx_ref, final=False):
+        """
+        Verify a deposit with Chapa and settle it.
+
+        With ``final`` (the last check of a deposit too old to keep polling),
+        Chapa's "not paid" or "not found" answer fails the deposit instead of
+        leaving it pending. Any other error (401/403, 429, 5xx, network) still
+        leaves it pending for the next check.
+        """
+        try:
+            response = self.client.get(f"/transaction/verify/{tx_ref}", "verify_transaction")
+            if final and self.is_unpaid_answer(response):
+                data = {'status': 'failed'}
+            else:
+                response.raise_for_status()
+                data = response.json()
             
             transaction = Transaction.objects.get(reference=tx_ref)
             
             if data['status'] == 'success':
-                if transaction.status != Transaction.Status.SUCCESS:
-                    transaction.status = Transaction.Status.SUCCESS
-                    transaction.external_reference = data['data'].get('reference') # Chapa reference
-                    transaction.save()
-                    
-                    # Credit wallet
-                    wallet = transaction.wallet
-                    wallet.balance += transaction.amount
-                    wallet.save()
-                    
+                # Credit wallet, once however many verifications race here
+                self.settle(
+                    transaction, Transaction.Status.SUCCESS, WalletService.credit_deposit,
+                    external_reference=data['data'].get('reference'),  # Chapa reference
+                )
                 return True, "Transaction verified successfully"
             else:
-                transaction.status = Transaction.Status.FAILED
-                transaction.save()
+                self.settle(transaction, Transaction.Status.FAILED)
                 return False, "Transaction verification failed"
                 
         except Transaction.DoesNotExist:
@@ -155,14 +209,30 @@ class ChapaService:
 
     def get_banks(self):
         try:
-            response = requests.get(f"{self.base_url}/banks", headers=self.headers)
+            response = self.client.get("/banks", "banks")
             response.raise_for_status()
             return response.json()
         except Exception as e:
             raise Exception(f"Failed to fetch banks: {str(e)}")
 
+    BANK_FIELDS = ['name', 'slug', 'swift', 'acct_length', 'is_active', 'is_mobilemoney', 'currency']
+
     def sync_banks(self):
+        """
+        Bring the gateway's banks in line with the gateway's bank list.
+
+        The existing banks are loaded in one query and diffed in memory: new banks
+        are inserted and changed ones updated in bulk, banks no longer listed are
+        deactivated (withdrawals reference them by code, so they are kept). A list
+        whose hash matches the last synced one (PaymentGateway.banks_etag) is not
+        diffed at all.
+
+        Returns:
+            tuple: (success, message)
+        """
         from .models import Bank
+        from .banks import invalidate_bank_list
+        import hashlib
         import logging
         logger = logging.getLogger(__name__)
         
@@ -173,24 +243,56 @@ class ChapaService:
             if not banks_data and data.get('status') == 'failed':
                 return False, data.get('message', 'Failed to sync banks')
 
-            count = 0
+            etag = hashlib.sha256(json.dumps(banks_data, sort_keys=True, default=str).encode()).hexdigest()
+            # The cached gateway row may be older than the last sync
+            if PaymentGateway.objects.filter(pk=self.gateway.pk, banks_etag=etag).exists():
+                return True, f"Banks unchanged ({len(banks_data)} banks)"
+
+            upstream = {}
             for bank_info in banks_data:
-                Bank.objects.update_or_create(
-                    gateway=self.gateway,
-                    code=str(bank_info.get('id')),
-                    defaults={
-                        'name': bank_info.get('name'),
-                        'slug': bank_info.get('slug'),
-                        'swift': bank_info.get('swift'),
-                        'acct_length': bank_info.get('acct_length'),
-                        'is_active': bank_info.get('active') == 1 or bank_info.get('is_active') == 1,
-                        'is_mobilemoney': bank_info.get('is_mobilemoney') == 1,
-                        'currency': bank_info.get('currency', 'ETB'),
-                    }
+                upstream[str(bank_info.get('id'))] = {
+                    'name': bank_info.get('name'),
+                    'slug': bank_info.get('slug'),
+                    'swift': bank_info.get('swift'),
+                    'acct_length': bank_info.get('acct_length'),
+                    'is_active': bank_info.get('active') == 1 or bank_info.get('is_active') == 1,
+                    'is_mobilemoney': bank_info.get('is_mobilemoney') == 1,
+                    'currency': bank_info.get('currency', 'ETB'),
+                }
+
+            now = timezone.now()
+            with db_transaction.atomic():
+                existing = {bank.code: bank for bank in Bank.objects.filter(gateway=self.gateway)}
+                created, changed = [], []
+                for code, fields in upstream.items():
+                    bank = existing.get(code)
+                    if bank is None:
+                        created.append(Bank(gateway=self.gateway, code=code, **fields))
+                    elif any(getattr(bank, name) != value for name, value in fields.items()):
+                        for name, value in fields.items():
+                            setattr(bank, name, value)
+                        changed.append(bank)
+                deactivated = [bank for code, bank in existing.items() if code not in upstream and bank.is_active]
+                for bank in deactivated:
+                    bank.is_active = False
+                for bank in changed + deactivated:
+                    bank.updated_at = now
+
+                # A concurrent sync may have inserted the same banks meanwhile
+                Bank.objects.bulk_create(
+                    created, update_conflicts=True, unique_fields=['gateway', 'code'],
+                    update_fields=self.BANK_FIELDS + ['updated_at'],
                 )
-                count += 1
-            
-            return True, f"Synced {count} banks"
+                Bank.objects.bulk_update(changed + deactivated, self.BANK_FIELDS + ['updated_at'])
+                # update(), not save(): the etag is not configuration, so the gateway cache stays
+                PaymentGateway.objects.filter(pk=self.gateway.pk).update(banks_etag=etag)
+
+            if created or changed or deactivated:
+                db_transaction.on_commit(lambda: invalidate_bank_list(self.gateway.code))
+            return True, (
+                f"Synced {len(upstream)} banks: {len(created)} added, {len(changed)} updated, "
+                f"{len(deactivated)} deactivated"
+            )
         except Exception as e:
             logger.error(f"Bank sync error: {str(e)}")
             return False, str(e)
@@ -202,21 +304,20 @@ class ChapaService:
 
         tx_ref = f"tr-{uuid.uuid4().hex[:32]}"
         
-        # Create pending withdrawal transaction
-        transaction = Transaction.objects.create(
-            wallet=wallet,
-            amount=amount,
-            transaction_type=Transaction.TransactionType.WITHDRAWAL,
-            status=Transaction.Status.PENDING,
-            reference=tx_ref,
-            gateway=self.gateway,
-            description=f"Withdrawal to {account_name} ({account_number})"
-        )
+        with db_transaction.atomic():
+            # Create pending withdrawal transaction
+            transaction = Transaction.objects.create(
+                wallet=wallet,
+                amount=amount,
+                transaction_type=Transaction.TransactionType.WITHDRAWAL,
+                status=Transaction.Status.PENDING,
+                reference=tx_ref,
+                gateway=self.gateway,
+                description=f"Withdrawal to {account_name} ({account_number})"
+            )
 
-        # Lock balance
-        wallet.balance -= amount
-        wallet.locked_balance += amount
-        wallet.save()
+            # Lock balance
+            WalletService.hold_withdrawal(transaction)
 
         # Try to convert bank_code to int if it's a numeric string
         try:
@@ -234,7 +335,7 @@ class ChapaService:
         }
 
         try:
-            response = requests.post(f"{self.base_url}/transfers", json=payload, headers=self.headers)
+            response = self.client.post("/transfers", "transfer", json=payload)
             response.raise_for_status()
             data = response.json()
             
@@ -242,9 +343,7 @@ class ChapaService:
                 return data, transaction
             else:
                 # Rollback balance if Chapa rejects immediately
-                wallet.balance += amount
-                wallet.locked_balance -= amount
-                wallet.save()
+                WalletService.release_withdrawal(transaction)
                 
                 transaction.status = Transaction.Status.FAILED
                 transaction.description = f"Chapa transfer failed: {data.get('message')}"
@@ -258,9 +357,7 @@ class ChapaService:
                 error_data = {'text': e.response.text}
             
             # Rollback balance
-            wallet.balance += amount
-            wallet.locked_balance -= amount
-            wallet.save()
+            WalletService.release_withdrawal(transaction)
             
             transaction.status = Transaction.Status.FAILED
             transaction.description = f"Chapa transfer error: {json.dumps(error_data)}"
@@ -268,9 +365,7 @@ class ChapaService:
             raise Exception(f"Chapa transfer failed: {json.dumps(error_data)}")
         except Exception as e:
             # Rollback balance on other errors
-            wallet.balance += amount
-            wallet.locked_balance -= amount
-            wallet.save()
+            WalletService.release_withdrawal(transaction)
             
             transaction.status = Transaction.Status.FAILED
             transaction.description = f"Chapa transfer error: {str(e)}"
@@ -279,12 +374,11 @@ class ChapaService:
 
     def verify_transfer(self, tx_ref):
         try:
-            response = requests.get(f"{self.base_url}/transfers/verify/{tx_ref}", headers=self.headers)
+            response = self.client.get(f"/transfers/verify/{tx_ref}", "verify_transfer")
             response.raise_for_status()
             data = response.json()
             
             transaction = Transaction.objects.get(reference=tx_ref)
-            wallet = transaction.wallet
             
             if data['status'] == 'success':
                 # Handle Test Mode response: {"message":"Transfer details (Test Mode)","status":"success","data":[null]}
@@ -293,36 +387,24 @@ class ChapaService:
                 
                 if is_test_mode and (transfer_data == [None] or transfer_data == []):
                     # In test mode, if we get success but null data, assume it's a successful test transfer
-                    if transaction.status != Transaction.Status.SUCCESS:
-                        transaction.status = Transaction.Status.SUCCESS
-                        transaction.description += " (Test Mode Success)"
-                        transaction.save()
-                        
-                        # Finalize withdrawal: remove from locked balance
-                        wallet.locked_balance -= transaction.amount
-                        wallet.save()
+                    # Finalize withdrawal: remove from locked balance
+                    self.settle(
+                        transaction, Transaction.Status.SUCCESS, WalletService.settle_withdrawal,
+                        description=Concat(F('description'), Value(" (Test Mode Success)")),
+                    )
                     return True, "Transfer verified (Test Mode)"
 
                 if isinstance(transfer_data, dict):
                     transfer_status = transfer_data.get('status')
                     if transfer_status == 'success':
-                        if transaction.status != Transaction.Status.SUCCESS:
-                            transaction.status = Transaction.Status.SUCCESS
-                            transaction.external_reference = transfer_data.get('chapa_transfer_id')
-                            transaction.save()
-                            
-                            # Finalize withdrawal: remove from locked balance
-                            wallet.locked_balance -= transaction.amount
-                            wallet.save()
+                        # Finalize withdrawal: remove from locked balance
+                        self.settle(
+                            transaction, Transaction.Status.SUCCESS, WalletService.settle_withdrawal,
+                            external_reference=transfer_data.get('chapa_transfer_id'),
+                        )
                     elif transfer_status == 'failed':
-                        if transaction.status != Transaction.Status.FAILED:
-                            transaction.status = Transaction.Status.FAILED
-                            transaction.save()
-                            
-                            # Rollback withdrawal: return to balance
-                            wallet.locked_balance -= transaction.amount
-                            wallet.balance += transaction.amount
-                            wallet.save()
+                        # Rollback withdrawal: return to balance
+                        self.settle(transaction, Transaction.Status.FAILED, WalletService.release_withdrawal)
                     
                     return True, f"Transfer status: {transfer_status}"
                 
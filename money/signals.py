@@ -1,9 +1,28 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
-from .models import Wallet
+from django.db import transaction
+from .models import Bank, PaymentGateway, PlatformConfig, Wallet, payment_gateway_cache
+from .banks import invalidate_bank_list
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_wallet_for_new_user(sender, instance, created, **kwargs):
     if created:
         Wallet.objects.create(user=instance)
+
+
+@receiver(post_save, sender=PlatformConfig)
+def invalidate_platform_config(sender, instance, **kwargs):
+    # After commit, so no process can cache the old row under the new version
+    transaction.on_commit(PlatformConfig.invalidate_cache)
+
+
+@receiver([post_save, post_delete], sender=PaymentGateway)
+def invalidate_payment_gateways(sender, instance, **kwargs):
+    transaction.on_commit(payment_gateway_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Bank)
+def invalidate_banks(sender, instance, **kwargs):
+    gateway_code = instance.gateway.code
+    transaction.on_commit(lambda: invalidate_bank_list(gateway_code))
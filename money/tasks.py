@@ -15,21 +15,39 @@ def sync_chapa_banks():
             logger.error(f"Failed to sync Chapa banks: {message}")
     except Exception as e:
         logger.error(f"Error syncing Chapa banks: {str(e)}")
-from .models import Transaction
+@shared_task
+def refresh_bank_list(gateway_code):
+    """
+    Rebuild the cached bank list of a gateway once it has gone stale
+    """
+    from .banks import invalidate_bank_list
+    invalidate_bank_list(gateway_code)
+
+from .verifier import verify_pending
 
 @shared_task
 def verify_pending_transfers():
     """
     Periodically check pending transactions (deposits and withdrawals)
     """
-    pending_transactions = Transaction.objects.filter(status=Transaction.Status.PENDING)
-    service = ChapaService()
-    
-    for tx in pending_transactions:
-        try:
-            if tx.transaction_type == Transaction.TransactionType.DEPOSIT:
-                service.verify_transaction(tx.reference)
-            elif tx.transaction_type == Transaction.TransactionType.WITHDRAWAL:
-                service.verify_transfer(tx.reference)
-        except Exception as e:
-            logger.error(f"Error verifying transaction {tx.reference}: {str(e)}")
+    results = verify_pending()
+    logger.info(
+        f"Verified pending transactions: processed={results['processed']} success={results['success']} "
+        f"failed={results['failed']} expired={results['expired']} errors={len(results['errors'])}"
+    )
+    for error in results['errors']:
+        logger.error(error)
+
+from . import webhooks
+
+@shared_task
+def process_webhook_events():
+    """
+    Drain the webhook inbox; queued by every new webhook and run periodically
+    to pick up retries
+    """
+    results = webhooks.drain()
+    logger.info(
+        f"Processed webhook events: processed={results['processed']} failed={results['failed']} "
+        f"retried={results['retried']}"
+    )
@@ -0,0 +1,174 @@
+"""
+Verification of pending gateway transactions.
+
+Pending deposits and withdrawals are polled at the gateway in claimed batches:
+a worker locks a batch of due rows with SELECT ... FOR UPDATE SKIP LOCKED,
+pushes their next_check_at into the future and commits, so overlapping runs
+never check the same row, and then verifies the batch PAYMENT_VERIFY_WORKERS at a
+time over the shared Chapa client (money.chapa_client).
+
+A row that is still pending is checked again after PAYMENT_VERIFY_BASE_DELAY
+seconds, doubling after every check up to PAYMENT_VERIFY_MAX_DELAY. Once it is
+older than PAYMENT_VERIFY_MAX_AGE_HOURS it is no longer polled: a deposit gets
+one last check at the gateway, which credits it if it was paid after all and
+fails it only if the gateway says it was not paid or is unknown (any other
+error leaves it pending for a later run); withdrawals are left pending for manual review since their money
+may already have been paid out.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Transaction
+from .services import ChapaService
+
+logger = logging.getLogger(__name__)
+
+VERIFIED_TYPES = (Transaction.TransactionType.DEPOSIT, Transaction.TransactionType.WITHDRAWAL)
+
+
+def next_check_delay(attempts):
+    """Seconds until the next check of a transaction that has been checked ``attempts`` times."""
+    base = getattr(settings, 'PAYMENT_VERIFY_BASE_DELAY', 60)
+    return min(base * 2 ** max(attempts - 1, 0), getattr(settings, 'PAYMENT_VERIFY_MAX_DELAY', 3600))
+
+
+def oldest_polled(now):
+    return now - timedelta(hours=getattr(settings, 'PAYMENT_VERIFY_MAX_AGE_HOURS', 48))
+
+
+def due_transactions(now):
+    return Transaction.objects.filter(
+        Q(next_check_at__isnull=True) | Q(next_check_at__lte=now),
+        status=Transaction.Status.PENDING,
+        transaction_type__in=VERIFIED_TYPES,
+        created_at__gte=oldest_polled(now),
+    )
+
+
+def stale_deposits(now):
+    """Pending deposits too old to be polled that are due their last check."""
+    return Transaction.objects.filter(
+        Q(next_check_at__isnull=True) | Q(next_check_at__lte=now),
+        status=Transaction.Status.PENDING,
+        transaction_type=Transaction.TransactionType.DEPOSIT,
+        created_at__lt=oldest_polled(now),
+    )
+
+
+@transaction.atomic
+def claim_batch(batch_size, due=due_transactions):
+    """
+    Claim up to ``batch_size`` due transactions by scheduling their next check.
+
+    Returns:
+        list: Transaction instances (id, reference, transaction_type, check_attempts)
+    """
+    now = timezone.now()
+    batch = list(
+        due(now)
+        .select_for_update(skip_locked=True)
+        .order_by('next_check_at', 'id')
+        .only('id', 'reference', 'transaction_type', 'check_attempts')[:batch_size]
+    )
+    for txn in batch:
+        txn.check_attempts += 1
+        txn.next_check_at = now + timedelta(seconds=next_check_delay(txn.check_attempts))
+    Transaction.objects.bulk_update(batch, ['check_attempts', 'next_check_at'])
+    return batch
+
+
+def verify_one(service, txn):
+    """
+    Check one transaction at the gateway.
+
+    Returns:
+        tuple: (success, message) as returned by ChapaService
+    """
+    try:
+        if txn.transaction_type == Transaction.TransactionType.DEPOSIT:
+            return service.verify_transaction(txn.reference)
+        return service.verify_transfer(txn.reference)
+    finally:
+        # Pool threads each hold their own database connection
+        connections.close_all()
+
+
+def final_check(service, txn):
+    try:
+        return service.verify_transaction(txn.reference, final=True)
+    finally:
+        connections.close_all()
+
+
+def expire_stale_deposits(pool, service, batch_size, deadline):
+    """
+    Give pending deposits that are too old to be polled one last check at the
+    gateway: the ones that were paid after all are credited, the ones the
+    gateway reports as unpaid or unknown are failed. Any other outcome leaves
+    the deposit pending until its next check.
+
+    Returns:
+        int: How many stale deposits were failed
+    """
+    checked = []
+    while time.monotonic() < deadline:
+        batch = claim_batch(batch_size, due=stale_deposits)
+        if not batch:
+            break
+        for txn, future in [(txn, pool.submit(final_check, service, txn)) for txn in batch]:
+            try:
+                success, message = future.result()
+            except Exception as e:
+                success, message = False, str(e)
+            if not success:
+                logger.info(f"Last check of stale deposit {txn.reference}: {message}")
+        checked.extend(txn.id for txn in batch)
+        if len(batch) < batch_size:
+            break
+    return Transaction.objects.filter(id__in=checked, status=Transaction.Status.FAILED).count()
+
+
+def verify_pending(batch_size=None, workers=None, time_budget=None, service=None):
+    """
+    Verify due pending transactions until none are left or ``time_budget``
+    seconds have passed (so a backlog can't make the periodic task overrun).
+
+    Returns:
+        dict: Counts of processed, success and failed checks, expired deposits, and errors
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_VERIFY_BATCH_SIZE', 50)
+    workers = workers or getattr(settings, 'PAYMENT_VERIFY_WORKERS', 8)
+    time_budget = time_budget or getattr(settings, 'PAYMENT_VERIFY_TIME_BUDGET', 240)
+    service = service or ChapaService()
+
+    results = {'processed': 0, 'success': 0, 'failed': 0, 'expired': 0, 'errors': []}
+    deadline = time.monotonic() + time_budget
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results['expired'] = expire_stale_deposits(pool, service, batch_size, deadline)
+        while time.monotonic() < deadline:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            futures = [(txn, pool.submit(verify_one, service, txn)) for txn in batch]
+            for txn, future in futures:
+                results['processed'] += 1
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    results['errors'].append(f"Error verifying {txn.reference}: {str(e)}")
+                    continue
+                if success:
+                    results['success'] += 1
+                else:
+                    results['failed'] += 1
+                    logger.info(f"Transaction {txn.reference} not verified: {message}")
+            if len(batch) < batch_size:
+                break
+    return results
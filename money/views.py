@@ -2,9 +2,12 @@ from rest_framework import viewsets, status, permissions
 from drf_spectacular.utils import extend_schema
 from rest_framework.response import Response
 from django.conf import settings
-from .models import PaymentGateway, Transaction, Wallet, Bank, PlatformConfig
+from .models import PaymentGateway, Transaction, Wallet, PlatformConfig
 from .services import ChapaService
-from .serializers import PaymentGatewaySerializer, DepositSerializer, WalletSerializer, TransactionSerializer, WithdrawalSerializer, BankSerializer
+from .verifier import verify_pending
+from .banks import get_bank_list
+from . import webhooks
+from .serializers import PaymentGatewaySerializer, DepositSerializer, WalletSerializer, TransactionSerializer, WithdrawalSerializer
 from config.views import StandardResponseViewSet, StandardAPIView
 import hmac
 import hashlib
@@ -31,19 +34,8 @@ class BanksListView(StandardAPIView):
 
     def get(self, request):
         gateway_code = request.query_params.get('gateway', 'chapa')
-        banks = Bank.objects.filter(gateway__code=gateway_code, is_active=True)
-        
-        # If no banks found, try to sync if it's chapa (optional, but good for first run)
-        if not banks.exists() and gateway_code == 'chapa':
-            try:
-                chapa_service = ChapaService()
-                chapa_service.sync_banks()
-                banks = Bank.objects.filter(gateway__code=gateway_code, is_active=True)
-            except:
-                pass
-
-        serializer = BankSerializer(banks, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Served from the cache; a gateway without banks yet gets a sync queued
+        return Response(get_bank_list(gateway_code), status=status.HTTP_200_OK)
 
 @extend_schema(tags=['Money'], description="Initiate a withdrawal via Chapa")
 class WithdrawalView(StandardAPIView):
@@ -100,7 +92,7 @@ class TransferApprovalView(StandardAPIView):
             return Response({'error': 'Missing signature'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            gateway = PaymentGateway.objects.get(code='chapa', is_active=True)
+            gateway = PaymentGateway.get_active('chapa')
             secret = gateway.config.get('CHAPA_APPROVAL_SECRET')
             if not secret:
                 return Response({'error': 'Approval secret not configured'}, status=status.HTTP_400_BAD_REQUEST)
@@ -153,32 +145,25 @@ class ChapaWebhookView(StandardAPIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
+        """
+        Verify the signature and queue the event; it is re-verified with Chapa and
+        applied by the process_webhook_events task (see money.webhooks).
+        """
         import logging
-        import json
-        logger = logging.getLogger('app')
-        
+        logger = logging.getLogger(__name__)
+
         try:
             raw_body = request.body
         except Exception as e:
             logger.error(f"Error reading request body: {str(e)}")
             return Response({'error': 'Could not read request body'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        logger.info(f"Webhook Headers: {request.headers}")
-        try:
-            logger.info(f"Webhook Body: {raw_body.decode('utf-8')}")
-        except:
-            logger.info(f"Webhook Body (bytes): {raw_body}")
-
-        chapa_sig = request.headers.get('Chapa-Signature')
-        x_chapa_sig = request.headers.get('x-chapa-signature')
-        
-        logger.info(f"Chapa-Signature: {chapa_sig}")
-        logger.info(f"x-chapa-signature: {x_chapa_sig}")
 
         try:
             chapa_service = ChapaService()
             # Verify signature
-            if not chapa_service.verify_webhook_signature(raw_body, chapa_sig, x_chapa_sig):
+            if not chapa_service.verify_webhook_signature(
+                raw_body, request.headers.get('Chapa-Signature'), request.headers.get('x-chapa-signature')
+            ):
                 logger.error("Webhook signature verification failed")
                 return Response({'status': 'error', 'message': 'Invalid signature'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -186,35 +171,17 @@ class ChapaWebhookView(StandardAPIView):
                 data = json.loads(raw_body)
             except json.JSONDecodeError:
                 return Response({'status': 'error', 'message': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
-            event_type = data.get('type')
-            event_status = data.get('status')
-            
-            # 1. Handle Payout (Withdrawal) Events
-            if event_type == 'Payout':
-                reference = data.get('reference')
-                if not reference:
-                    return Response({'status': 'error', 'message': 'Missing reference'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Re-verify with Chapa API for security (as recommended by Chapa docs)
-                success, message = chapa_service.verify_transfer(reference)
-                return Response({'message': message}, status=status.HTTP_200_OK)
-
-            # 2. Handle Transaction (Deposit) Events
-            else:
-                tx_ref = data.get('tx_ref') or data.get('reference')
-                if not tx_ref:
-                    return Response({'status': 'error', 'message': 'Missing tx_ref'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(data, dict):
+                return Response({'status': 'error', 'message': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
 
-                # Re-verify with Chapa API for security
-                success, message = chapa_service.verify_transaction(tx_ref)
-                if success:
-                    return Response({'message': message}, status=status.HTTP_200_OK)
-                else:
-                    return Response({'message': message}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                event, created = webhooks.ingest(chapa_service.gateway.code, data)
+            except webhooks.InvalidWebhook as e:
+                return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            # A repeated delivery is acknowledged as well, so Chapa stops retrying it
+            return Response({'status': 'received', 'reference': event.reference}, status=status.HTTP_200_OK)
 
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Webhook error: {str(e)}")
             return Response({'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -279,40 +246,13 @@ class VerifyTransferView(StandardAPIView):
 
 class VerifyPendingTransfersView(StandardAPIView):
     """
-    Admin-only view to manually trigger verification of all pending transfers.
+    Admin-only view to manually trigger verification of the pending transactions that are due.
     """
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        pending_transactions = Transaction.objects.filter(status=Transaction.Status.PENDING)
-        service = ChapaService()
-        
-        results = {
-            'total_pending': pending_transactions.count(),
-            'processed': 0,
-            'success': 0,
-            'failed': 0,
-            'errors': []
-        }
-
-        for tx in pending_transactions:
-            try:
-                success = False
-                message = ""
-                
-                if tx.transaction_type == Transaction.TransactionType.DEPOSIT:
-                    success, message = service.verify_transaction(tx.reference)
-                elif tx.transaction_type == Transaction.TransactionType.WITHDRAWAL:
-                    success, message = service.verify_transfer(tx.reference)
-                
-                results['processed'] += 1
-                if success:
-                    results['success'] += 1
-                else:
-                    results['failed'] += 1
-            except Exception as e:
-                results['errors'].append(f"Error verifying {tx.reference}: {str(e)}")
-        
+        results = {'total_pending': Transaction.objects.filter(status=Transaction.Status.PENDING).count()}
+        results.update(verify_pending())
         return Response(results, status=status.HTTP_200_OK)
 
 class UserTransactionViewSet(StandardResponseViewSet):
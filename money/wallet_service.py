@@ -1,13 +1,23 @@
 """
 Wallet Service for handling all money-related operations.
 This service manages wallet balance checks, fee deductions, payment locks, and transfers.
+
+Every mutation locks the wallets it touches (SELECT ... FOR UPDATE) in wallet id
+order, so concurrent operations on the same wallets queue up instead of losing
+updates, and two operations on the same pair of wallets cannot deadlock. The
+money moves as ledger entries (see money.ledger), which also update the wallet
+balances, and the Transaction rows of an operation are inserted with one
+bulk_create.
 """
 from django.db import transaction
-from django.core.exceptions import ValidationError
-from decimal import Decimal
-from .models import Wallet, Transaction, PlatformConfig
+from decimal import Decimal, ROUND_HALF_UP
+from . import ledger
+from .ledger import PLATFORM_REVENUE, gateway_account, wallet_account
+from .models import LedgerEntry, Wallet, Transaction, PlatformConfig
 import uuid
 
+CENT = Decimal('0.01')
+
 
 class InsufficientBalanceError(Exception):
     """Raised when wallet has insufficient balance."""
@@ -25,6 +35,33 @@ class WalletService:
         """Get platform configuration."""
         return PlatformConfig.get_config()
     
+    @staticmethod
+    def lock_wallets(user_ids):
+        """
+        Lock the wallets of ``user_ids`` for the rest of the transaction, in wallet id order.
+
+        Returns:
+            dict: {user_id: Wallet} with freshly read balances
+
+        Raises:
+            Wallet.DoesNotExist: If one of the users has no wallet
+        """
+        user_ids = set(user_ids)
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.select_for_update().filter(user_id__in=user_ids).order_by('id')
+        }
+        missing = user_ids - wallets.keys()
+        if missing:
+            raise Wallet.DoesNotExist(f"No wallet for user(s) {sorted(missing)}")
+        return wallets
+
+    @staticmethod
+    def lock_transaction_wallet(txn):
+        """Lock the wallet of ``txn`` and attach the freshly read instance to it."""
+        txn.wallet = Wallet.objects.select_for_update().get(pk=txn.wallet_id)
+        return txn.wallet
+
     @staticmethod
     def check_balance_for_listing(user):
         """
@@ -76,7 +113,7 @@ class WalletService:
             InsufficientBalanceError: If wallet has insufficient balance
         """
         config = WalletService.get_config()
-        wallet = user.wallet
+        wallet = WalletService.lock_wallets([user.id])[user.id]
         fee_amount = config.min_balance_for_travel_listing
         
         # Check balance
@@ -85,10 +122,6 @@ class WalletService:
                 f"Insufficient balance. Required: {fee_amount}, Available: {wallet.balance}"
             )
         
-        # Deduct from wallet
-        wallet.balance -= fee_amount
-        wallet.save()
-        
         # Create transaction record
         txn = Transaction.objects.create(
             wallet=wallet,
@@ -101,6 +134,11 @@ class WalletService:
             related_listing=listing
         )
         
+        # Deduct from wallet
+        ledger.post([
+            LedgerEntry(debit_account=PLATFORM_REVENUE, credit_account=wallet_account(wallet.id), amount=fee_amount, transaction=txn),
+        ], [wallet])
+        
         return txn
     
     @staticmethod
@@ -121,7 +159,7 @@ class WalletService:
             InsufficientBalanceError: If wallet has insufficient balance
         """
         config = WalletService.get_config()
-        wallet = user.wallet
+        wallet = WalletService.lock_wallets([user.id])[user.id]
         fee_amount = config.min_balance_for_package_request
         lock_amount = package_request.total_price
         total_required = fee_amount + lock_amount
@@ -132,37 +170,36 @@ class WalletService:
                 f"Insufficient balance. Required: {total_required}, Available: {wallet.balance}"
             )
         
-        # Deduct fee from balance
-        wallet.balance -= fee_amount
+        fee_txn, lock_txn = Transaction.objects.bulk_create([
+            # Fee transaction
+            Transaction(
+                wallet=wallet,
+                amount=fee_amount,
+                transaction_type=Transaction.TransactionType.REQUEST_FEE,
+                status=Transaction.Status.SUCCESS,
+                reference=f"request-fee-{uuid.uuid4().hex[:16]}",
+                description=f"Fee for creating package request #{package_request.id}",
+                transaction_category=Transaction.TransactionCategory.SYSTEM_REVENUE,
+                related_package_request=package_request
+            ),
+            # Lock transaction
+            Transaction(
+                wallet=wallet,
+                amount=lock_amount,
+                transaction_type=Transaction.TransactionType.PAYMENT_LOCK,
+                status=Transaction.Status.SUCCESS,
+                reference=f"lock-{uuid.uuid4().hex[:16]}",
+                description=f"Locked payment for package request #{package_request.id}",
+                transaction_category=Transaction.TransactionCategory.USER_TRANSACTION,
+                related_package_request=package_request
+            ),
+        ])
         
-        # Lock the payment amount
-        wallet.balance -= lock_amount
-        wallet.locked_balance += lock_amount
-        wallet.save()
-        
-        # Create fee transaction
-        fee_txn = Transaction.objects.create(
-            wallet=wallet,
-            amount=fee_amount,
-            transaction_type=Transaction.TransactionType.REQUEST_FEE,
-            status=Transaction.Status.SUCCESS,
-            reference=f"request-fee-{uuid.uuid4().hex[:16]}",
-            description=f"Fee for creating package request #{package_request.id}",
-            transaction_category=Transaction.TransactionCategory.SYSTEM_REVENUE,
-            related_package_request=package_request
-        )
-        
-        # Create lock transaction
-        lock_txn = Transaction.objects.create(
-            wallet=wallet,
-            amount=lock_amount,
-            transaction_type=Transaction.TransactionType.PAYMENT_LOCK,
-            status=Transaction.Status.SUCCESS,
-            reference=f"lock-{uuid.uuid4().hex[:16]}",
-            description=f"Locked payment for package request #{package_request.id}",
-            transaction_category=Transaction.TransactionCategory.USER_TRANSACTION,
-            related_package_request=package_request
-        )
+        # Deduct fee from balance and lock the payment amount
+        ledger.post([
+            LedgerEntry(debit_account=PLATFORM_REVENUE, credit_account=wallet_account(wallet.id), amount=fee_amount, transaction=fee_txn),
+            LedgerEntry(debit_account=wallet_account(wallet.id, locked=True), credit_account=wallet_account(wallet.id), amount=lock_amount, transaction=lock_txn),
+        ], [wallet])
         
         return fee_txn, lock_txn
     
@@ -180,46 +217,50 @@ class WalletService:
             tuple: (payment_transaction, commission_transaction)
         """
         config = WalletService.get_config()
-        requester_wallet = package_request.user.wallet
-        traveler_wallet = package_request.travel_listing.user.wallet
+        requester_id = package_request.user_id
+        traveler_id = package_request.travel_listing.user_id
+        wallets = WalletService.lock_wallets([requester_id, traveler_id])
+        requester_wallet = wallets[requester_id]
+        traveler_wallet = wallets[traveler_id]
         
         locked_amount = package_request.total_price
         commission_percentage = config.platform_commission_percentage / Decimal('100')
-        commission_amount = locked_amount * commission_percentage
+        # Rounded to the cent so commission + traveler amount is exactly the locked amount
+        commission_amount = (locked_amount * commission_percentage).quantize(CENT, rounding=ROUND_HALF_UP)
         traveler_amount = locked_amount - commission_amount
         
-        # Unlock from requester
-        requester_wallet.locked_balance -= locked_amount
-        requester_wallet.save()
-        
-        # Transfer to traveler
-        traveler_wallet.balance += traveler_amount
-        traveler_wallet.save()
+        payment_txn, commission_txn = Transaction.objects.bulk_create([
+            # Payment release transaction
+            Transaction(
+                wallet=requester_wallet,
+                amount=traveler_amount,
+                transaction_type=Transaction.TransactionType.PAYMENT_RELEASE,
+                status=Transaction.Status.SUCCESS,
+                reference=f"release-{uuid.uuid4().hex[:16]}",
+                description=f"Payment released to traveler for package request #{package_request.id}",
+                transaction_category=Transaction.TransactionCategory.INTERNAL_TRANSFER,
+                recipient_wallet=traveler_wallet,
+                related_package_request=package_request
+            ),
+            # Commission transaction
+            Transaction(
+                wallet=requester_wallet,
+                amount=commission_amount,
+                transaction_type=Transaction.TransactionType.COMMISSION,
+                status=Transaction.Status.SUCCESS,
+                reference=f"commission-{uuid.uuid4().hex[:16]}",
+                description=f"Platform commission for package request #{package_request.id}",
+                transaction_category=Transaction.TransactionCategory.SYSTEM_REVENUE,
+                related_package_request=package_request
+            ),
+        ])
         
-        # Create payment release transaction
-        payment_txn = Transaction.objects.create(
-            wallet=requester_wallet,
-            amount=traveler_amount,
-            transaction_type=Transaction.TransactionType.PAYMENT_RELEASE,
-            status=Transaction.Status.SUCCESS,
-            reference=f"release-{uuid.uuid4().hex[:16]}",
-            description=f"Payment released to traveler for package request #{package_request.id}",
-            transaction_category=Transaction.TransactionCategory.INTERNAL_TRANSFER,
-            recipient_wallet=traveler_wallet,
-            related_package_request=package_request
-        )
-        
-        # Create commission transaction
-        commission_txn = Transaction.objects.create(
-            wallet=requester_wallet,
-            amount=commission_amount,
-            transaction_type=Transaction.TransactionType.COMMISSION,
-            status=Transaction.Status.SUCCESS,
-            reference=f"commission-{uuid.uuid4().hex[:16]}",
-            description=f"Platform commission for package request #{package_request.id}",
-            transaction_category=Transaction.TransactionCategory.SYSTEM_REVENUE,
-            related_package_request=package_request
-        )
+        # Unlock from requester and transfer to traveler
+        requester_locked = wallet_account(requester_wallet.id, locked=True)
+        ledger.post([
+            LedgerEntry(debit_account=wallet_account(traveler_wallet.id), credit_account=requester_locked, amount=traveler_amount, transaction=payment_txn),
+            LedgerEntry(debit_account=PLATFORM_REVENUE, credit_account=requester_locked, amount=commission_amount, transaction=commission_txn),
+        ], [requester_wallet, traveler_wallet])
         
         return payment_txn, commission_txn
     
@@ -235,14 +276,9 @@ class WalletService:
         Returns:
             Transaction: Created transaction record
         """
-        wallet = package_request.user.wallet
+        wallet = WalletService.lock_wallets([package_request.user_id])[package_request.user_id]
         locked_amount = package_request.total_price
         
-        # Unlock amount
-        wallet.locked_balance -= locked_amount
-        wallet.balance += locked_amount
-        wallet.save()
-        
         # Create unlock transaction
         txn = Transaction.objects.create(
             wallet=wallet,
@@ -255,4 +291,73 @@ class WalletService:
             related_package_request=package_request
         )
         
+        # Unlock amount
+        ledger.post([
+            LedgerEntry(debit_account=wallet_account(wallet.id), credit_account=wallet_account(wallet.id, locked=True), amount=locked_amount, transaction=txn),
+        ], [wallet])
+        
         return txn
+    
+    @staticmethod
+    @transaction.atomic
+    def credit_deposit(txn):
+        """
+        Credit a successful gateway deposit to its wallet.
+        
+        Args:
+            txn: DEPOSIT Transaction
+        """
+        wallet = WalletService.lock_transaction_wallet(txn)
+        ledger.post([
+            LedgerEntry(debit_account=wallet_account(wallet.id), credit_account=gateway_account(txn.gateway), amount=txn.amount, transaction=txn),
+        ], [wallet])
+    
+    @staticmethod
+    @transaction.atomic
+    def hold_withdrawal(txn):
+        """
+        Move a withdrawal amount from the spendable to the locked balance while
+        the gateway processes it.
+        
+        Args:
+            txn: WITHDRAWAL Transaction
+            
+        Raises:
+            InsufficientBalanceError: If wallet has insufficient balance
+        """
+        wallet = WalletService.lock_transaction_wallet(txn)
+        if wallet.balance < txn.amount:
+            raise InsufficientBalanceError(
+                f"Insufficient balance. Required: {txn.amount}, Available: {wallet.balance}"
+            )
+        ledger.post([
+            LedgerEntry(debit_account=wallet_account(wallet.id, locked=True), credit_account=wallet_account(wallet.id), amount=txn.amount, transaction=txn),
+        ], [wallet])
+    
+    @staticmethod
+    @transaction.atomic
+    def release_withdrawal(txn):
+        """
+        Return a held withdrawal amount to the spendable balance (the transfer failed).
+        
+        Args:
+            txn: WITHDRAWAL Transaction
+        """
+        wallet = WalletService.lock_transaction_wallet(txn)
+        ledger.post([
+            LedgerEntry(debit_account=wallet_account(wallet.id), credit_account=wallet_account(wallet.id, locked=True), amount=txn.amount, transaction=txn),
+        ], [wallet])
+    
+    @staticmethod
+    @transaction.atomic
+    def settle_withdrawal(txn):
+        """
+        Pay out a held withdrawal amount through the gateway (the transfer succeeded).
+        
+        Args:
+            txn: WITHDRAWAL Transaction
+        """
+        wallet = WalletService.lock_transaction_wallet(txn)
+        ledger.post([
+            LedgerEntry(debit_account=gateway_account(txn.gateway), credit_account=wallet_account(wallet.id, locked=True), amount=txn.amount, transaction=txn),
+        ], [wallet])
@@ -0,0 +1,163 @@
+"""
+Gateway webhook inbox.
+
+The webhook view only checks the signature and stores the event (ingest); a
+duplicate delivery maps to the same event_key and is stored once. The gateway
+gets its 200 right away, and process_webhook_events drains the inbox: it claims
+due events with SELECT ... FOR UPDATE SKIP LOCKED (pushing process_after
+forward, so overlapping drains never take the same event), re-verifies each
+with the gateway WEBHOOK_WORKERS at a time, and applies the result through
+ChapaService, which only moves money for a transaction that is still pending.
+
+An event whose transaction is still pending after the check is retried after
+WEBHOOK_RETRY_BASE_DELAY seconds, doubling, until WEBHOOK_MAX_ATTEMPTS; the
+pending-transaction poller (money.verifier) still covers it after that.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Transaction, WebhookEvent
+from .services import ChapaService
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidWebhook(Exception):
+    """Raised for a webhook payload that cannot be stored."""
+
+
+def parse_event(gateway_code, data):
+    """
+    Return the unsaved WebhookEvent for a Chapa webhook payload.
+
+    Raises:
+        InvalidWebhook: If the payload has no reference
+    """
+    if data.get('type') == 'Payout':
+        kind, reference = WebhookEvent.Kind.PAYOUT, data.get('reference')
+    else:
+        kind, reference = WebhookEvent.Kind.PAYMENT, data.get('tx_ref') or data.get('reference')
+    if not reference:
+        raise InvalidWebhook('Missing reference' if kind == WebhookEvent.Kind.PAYOUT else 'Missing tx_ref')
+    return WebhookEvent(
+        gateway=gateway_code,
+        event_key=f"{gateway_code}:{kind}:{reference}:{data.get('status') or ''}"[:255],
+        kind=kind,
+        reference=str(reference)[:100],
+        payload=data,
+    )
+
+
+def ingest(gateway_code, data):
+    """
+    Store a verified webhook and schedule the inbox drain.
+
+    Returns:
+        tuple: (event, created) - created is False for a repeated delivery
+    """
+    event = parse_event(gateway_code, data)
+    event, created = WebhookEvent.objects.get_or_create(
+        event_key=event.event_key,
+        defaults={'gateway': event.gateway, 'kind': event.kind, 'reference': event.reference, 'payload': event.payload},
+    )
+    if created:
+        from .tasks import process_webhook_events
+        # robust: if the broker is down the event still waits in the inbox for the periodic drain
+        transaction.on_commit(process_webhook_events.delay, robust=True)
+    return event, created
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'WEBHOOK_RETRY_BASE_DELAY', 30)
+    return min(base * 2 ** max(attempts - 1, 0), 3600)
+
+
+@transaction.atomic
+def claim_batch(batch_size):
+    """Claim up to ``batch_size`` due events by pushing their process_after forward."""
+    now = timezone.now()
+    batch = list(
+        WebhookEvent.objects.select_for_update(skip_locked=True)
+        .filter(status=WebhookEvent.Status.PENDING, process_after__lte=now)
+        .order_by('process_after', 'id')
+        .only('id', 'kind', 'reference', 'attempts')[:batch_size]
+    )
+    for event in batch:
+        event.attempts += 1
+        event.process_after = now + timedelta(seconds=retry_delay(event.attempts))
+    WebhookEvent.objects.bulk_update(batch, ['attempts', 'process_after'])
+    return batch
+
+
+def apply_event(service, event):
+    """
+    Re-verify an event with the gateway and apply it.
+
+    Returns:
+        tuple: (status, message) - the WebhookEvent status it ends in, or None to retry it
+    """
+    try:
+        if event.kind == WebhookEvent.Kind.PAYOUT:
+            success, message = service.verify_transfer(event.reference)
+        else:
+            success, message = service.verify_transaction(event.reference)
+        if message == "Transaction not found":
+            return WebhookEvent.Status.FAILED, message
+        still_pending = Transaction.objects.filter(
+            reference=event.reference, status=Transaction.Status.PENDING
+        ).exists()
+        if success or not still_pending:
+            return WebhookEvent.Status.PROCESSED, message
+        return None, message
+    finally:
+        # Pool threads each hold their own database connection
+        connections.close_all()
+
+
+def drain(batch_size=None, workers=None, time_budget=None, service=None):
+    """
+    Process due inbox events until none are left or ``time_budget`` seconds have passed.
+
+    Returns:
+        dict: Counts of processed, failed and retried events
+    """
+    batch_size = batch_size or getattr(settings, 'WEBHOOK_BATCH_SIZE', 50)
+    workers = workers or getattr(settings, 'WEBHOOK_WORKERS', 8)
+    time_budget = time_budget or getattr(settings, 'WEBHOOK_TIME_BUDGET', 50)
+    max_attempts = getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 8)
+    service = service or ChapaService()
+
+    results = {'processed': 0, 'failed': 0, 'retried': 0}
+    deadline = time.monotonic() + time_budget
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while time.monotonic() < deadline:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            futures = [(event, pool.submit(apply_event, service, event)) for event in batch]
+            for event, future in futures:
+                try:
+                    status, message = future.result()
+                except Exception as e:
+                    status, message = None, str(e)
+                if status is None and event.attempts >= max_attempts:
+                    status = WebhookEvent.Status.FAILED
+                    logger.warning(f"Giving up on webhook {event.reference} after {event.attempts} attempts: {message}")
+                if status is None:
+                    results['retried'] += 1
+                    WebhookEvent.objects.filter(pk=event.pk).update(last_error=message)
+                    continue
+                results[status] += 1
+                WebhookEvent.objects.filter(pk=event.pk).update(
+                    status=status, processed_at=timezone.now(),
+                    last_error='' if status == WebhookEvent.Status.PROCESSED else message,
+                )
+            if len(batch) < batch_size:
+                break
+    return results
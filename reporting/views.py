@@ -230,18 +230,13 @@ class AdminMetricsViewSet(StandardResponseViewSet):
         """
         Returns the unfilled kg for each route (pickup/destination pair).
         """
-        from django.db.models import Sum
         data = []
-        routes = TravelListing.objects.values('pickup_region__name', 'destination_region__name', 'id', 'maximum_weight_in_kg')
+        routes = TravelListing.objects.values('pickup_region__name', 'destination_region__name', 'available_weight_kg')
         for route in routes:
-            accepted_kg = PackageRequest.objects.filter(
-                travel_listing_id=route['id'], status='accepted'
-            ).aggregate(total=Sum('weight'))['total'] or 0
-            unfilled_kg = float(route['maximum_weight_in_kg']) - float(accepted_kg)
             data.append({
                 'pickup': route['pickup_region__name'],
                 'destination': route['destination_region__name'],
-                'unfilled_kg': unfilled_kg
+                'unfilled_kg': float(route['available_weight_kg'])
             })
         return self._standardize_response(Response({'route_saturation': data}))
 
@@ -1,81 +1,234 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
 from listings.models import Review, TravelListing, PackageRequest
-from users.models import Profile, CustomUser
-from django.db.models import Avg, Count
+from users.models import Profile
+
+STAT_FIELDS = [
+    'total_trips_created',
+    'total_offer_sent',
+    'total_offer_received',
+    'total_completed_deliveries',
+    'average_rating',
+    'total_rating_received',
+    'rating_sum',
+]
+
+PHASES = ('load', 'aggregate', 'write')
+
+
+def touched_user_ids(since):
+    """
+    Users whose statistics may have changed since ``since``: owners of listings and
+    requests created/updated, travelers whose listings got requests or reviews.
+    Deletions leave no trace, so a periodic full run is still needed.
+    """
+    user_ids = set()
+    user_ids.update(TravelListing.objects.filter(updated_at__gte=since).values_list('user_id', flat=True))
+    requests = PackageRequest.objects.filter(updated_at__gte=since)
+    user_ids.update(requests.values_list('user_id', flat=True))
+    user_ids.update(requests.values_list('travel_listing__user_id', flat=True))
+    user_ids.update(
+        Review.objects.filter(created_at__gte=since).values_list('travel_listing__user_id', flat=True)
+    )
+    return sorted(user_ids)
+
+
+def compute_stats(user_filter):
+    """
+    Compute every statistic for the users matched by ``user_filter`` (a dict of
+    lookups on a user id, e.g. {'gte': 1, 'lte': 1000} or {'in': [...]}) with one
+    grouped query per source table.
+
+    Returns:
+        dict: user_id -> {field: value} for users with any activity
+    """
+    def lookups(path):
+        return {f'{path}__{lookup}': value for lookup, value in user_filter.items()}
+
+    stats = defaultdict(dict)
+    trips = (
+        TravelListing.objects.filter(**lookups('user_id'))
+        .order_by().values('user_id').annotate(total=Count('id'))
+    )
+    for row in trips:
+        stats[row['user_id']]['total_trips_created'] = row['total']
+
+    sent = (
+        PackageRequest.objects.filter(**lookups('user_id'))
+        .order_by().values('user_id').annotate(total=Count('id'))
+    )
+    for row in sent:
+        stats[row['user_id']]['total_offer_sent'] = row['total']
+
+    received = (
+        PackageRequest.objects.filter(**lookups('travel_listing__user_id'))
+        .order_by().values('travel_listing__user_id')
+        .annotate(total=Count('id'), completed=Count('id', filter=Q(status='completed')))
+    )
+    for row in received:
+        user_stats = stats[row['travel_listing__user_id']]
+        user_stats['total_offer_received'] = row['total']
+        user_stats['total_completed_deliveries'] = row['completed']
+
+    ratings = (
+        Review.objects.filter(**lookups('travel_listing__user_id'))
+        .order_by().values('travel_listing__user_id')
+        .annotate(total=Count('id'), rate_sum=Sum('rate'))
+    )
+    for row in ratings:
+        user_stats = stats[row['travel_listing__user_id']]
+        user_stats['total_rating_received'] = row['total']
+        user_stats['rating_sum'] = row['rate_sum'] or 0
+        user_stats['average_rating'] = round(user_stats['rating_sum'] / row['total'], 2) if row['total'] else 0.0
+
+    return stats
+
+
+def recalculate_users(user_ids=None, id_range=None, batch_size=1000):
+    """
+    Recalculate the profiles of either an explicit list of user ids or an inclusive
+    user id range, ``batch_size`` profiles at a time. Only profiles whose values
+    changed are written (bulk_update).
+
+    Returns:
+        dict: profiles scanned/updated and seconds spent per phase
+    """
+    result = {'scanned': 0, 'updated': 0, **{phase: 0.0 for phase in PHASES}}
+    profiles = Profile.objects.order_by('user_id').only('id', 'user_id', *STAT_FIELDS)
+    if user_ids is not None:
+        batches = (user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size))
+    else:
+        batches = None
+    last_user_id = id_range[0] - 1 if id_range else None
+
+    while True:
+        started = time.perf_counter()
+        if batches is not None:
+            chunk = next(batches, None)
+            if chunk is None:
+                break
+            batch = list(profiles.filter(user_id__in=chunk))
+            user_filter = {'in': chunk}
+        else:
+            batch = list(profiles.filter(user_id__gt=last_user_id, user_id__lte=id_range[1])[:batch_size])
+            if not batch:
+                break
+            last_user_id = batch[-1].user_id
+            user_filter = {'gte': batch[0].user_id, 'lte': batch[-1].user_id}
+        result['load'] += time.perf_counter() - started
+        if not batch:
+            continue
+
+        started = time.perf_counter()
+        stats = compute_stats(user_filter)
+        result['aggregate'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        changed = []
+        for profile in batch:
+            values = stats.get(profile.user_id, {})
+            dirty = False
+            for field in STAT_FIELDS:
+                value = values.get(field, 0.0 if field == 'average_rating' else 0)
+                if getattr(profile, field) != value:
+                    setattr(profile, field, value)
+                    dirty = True
+            if dirty:
+                changed.append(profile)
+        if changed:
+            Profile.objects.bulk_update(changed, STAT_FIELDS, batch_size=batch_size)
+        result['write'] += time.perf_counter() - started
+
+        result['scanned'] += len(batch)
+        result['updated'] += len(changed)
+
+    return result
+
+
+def _run_shard(shard):
+    # Runs in a forked worker: never reuse the parent's database connections
+    connections.close_all()
+    try:
+        return recalculate_users(**shard)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
-    help = 'Recalculate all profile statistics from existing data'
+    help = 'Recalculate all profile statistics from existing data (reconciles the incrementally maintained counters)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Profiles per aggregate/bulk_update batch')
+        parser.add_argument(
+            '--since',
+            help='Only recalculate users touched at or after this ISO datetime (e.g. the value printed by the last run)'
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes sharding the user id range')
 
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = max(1, options['workers'])
+        run_started_at = timezone.now()
+        started = time.perf_counter()
+
         self.stdout.write(self.style.SUCCESS('Starting profile statistics recalculation...'))
         self.stdout.write('=' * 60)
-        
-        all_users = CustomUser.objects.all()
-        updated_count = 0
-        
-        for user in all_users:
-            try:
-                profile = user.profile
-                
-                # 1. Total trips created
-                total_trips = TravelListing.objects.filter(user=user).count()
-                
-                # 2. Total offer sent (package requests created by user)
-                total_sent = PackageRequest.objects.filter(user=user).count()
-                
-                # 3. Total offer received (package requests for user's listings)
-                total_received = PackageRequest.objects.filter(
-                    travel_listing__user=user
-                ).count()
-                
-                # 4. Total completed deliveries
-                total_completed = PackageRequest.objects.filter(
-                    travel_listing__user=user,
-                    status='completed'
-                ).count()
-                
-                # 5. Average rating and total reviews
-                traveler_listings = TravelListing.objects.filter(user=user)
-                reviews = Review.objects.filter(travel_listing__in=traveler_listings)
-                
-                stats = reviews.aggregate(
-                    avg_rating=Avg('rate'),
-                    total_reviews=Count('id')
-                )
-                
-                avg_rating = round(stats['avg_rating'], 2) if stats['avg_rating'] else 0.0
-                total_reviews = stats['total_reviews'] or 0
-                
-                # Update profile
-                profile.total_trips_created = total_trips
-                profile.total_offer_sent = total_sent
-                profile.total_offer_received = total_received
-                profile.total_completed_deliveries = total_completed
-                profile.average_rating = avg_rating
-                profile.total_rating_received = total_reviews
-                profile.save()
-                
-                updated_count += 1
-                
-                # Print summary for users with activity
-                if any([total_trips, total_sent, total_received, total_completed, total_reviews]):
-                    self.stdout.write(f"\n{user.username} ({user.email}):")
-                    self.stdout.write(f"  Trips Created: {total_trips}")
-                    self.stdout.write(f"  Offers Sent: {total_sent}")
-                    self.stdout.write(f"  Offers Received: {total_received}")
-                    self.stdout.write(f"  Completed Deliveries: {total_completed}")
-                    self.stdout.write(f"  Average Rating: {avg_rating} ({total_reviews} reviews)")
-                    
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"Error updating {user.username}: {str(e)}")
-                )
-        
+
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            user_ids = touched_user_ids(since)
+            self.stdout.write(f'select: {len(user_ids)} users touched since {since.isoformat()} '
+                              f'({time.perf_counter() - started:.2f}s)')
+            per_worker = -(-len(user_ids) // workers) or 1
+            shards = [
+                {'user_ids': user_ids[i:i + per_worker], 'batch_size': batch_size}
+                for i in range(0, len(user_ids), per_worker)
+            ]
+        else:
+            id_bounds = Profile.objects.order_by('user_id').values_list('user_id', flat=True)
+            first_id, last_id = id_bounds.first(), id_bounds.last()
+            if first_id is None:
+                shards = []
+            else:
+                span = -(-(last_id - first_id + 1) // workers)
+                shards = [
+                    {'id_range': (low, min(low + span - 1, last_id)), 'batch_size': batch_size}
+                    for low in range(first_id, last_id + 1, span)
+                ]
+
+        if len(shards) > 1:
+            # Forked workers must not inherit open connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as pool:
+                results = list(pool.map(_run_shard, shards))
+        else:
+            results = [recalculate_users(**shard) for shard in shards]
+
+        for index, (shard, result) in enumerate(zip(shards, results), start=1):
+            scope = shard.get('id_range') or f"{len(shard['user_ids'])} users"
+            self.stdout.write(
+                f"worker {index} [{scope}]: scanned={result['scanned']} updated={result['updated']} "
+                + ' '.join(f"{phase}={result[phase]:.2f}s" for phase in PHASES)
+            )
+
         self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(
-            self.style.SUCCESS(f'Total users updated: {updated_count}')
-        )
-        self.stdout.write(
-            self.style.SUCCESS('Profile statistics recalculation complete!')
-        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Total users updated: {sum(r['updated'] for r in results)} "
+            f"of {sum(r['scanned'] for r in results)} scanned in {time.perf_counter() - started:.2f}s"
+        ))
+        self.stdout.write(f'Next run: --since {run_started_at.isoformat()}')
+        self.stdout.write(self.style.SUCCESS('Profile statistics recalculation complete!'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_sum(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Review = apps.get_model('listings', 'Review')
+    rate_sum = Review.objects.filter(
+        travel_listing__user_id=OuterRef('user_id')
+    ).order_by().values('travel_listing__user_id').annotate(total=Sum('rate')).values('total')
+    Profile.objects.update(rating_sum=Coalesce(Subquery(rate_sum), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_remove_travelpricesetting_price_per_file'),
+        ('listings', '0011_travellisting_capacity_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False, help_text='Sum of all review rates; average_rating = rating_sum / total_rating_received'),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_profile_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_upload_status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20),
+        ),
+    ]
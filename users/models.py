@@ -93,6 +93,12 @@ class Profile(models.Model):
     front_side_identity_card_url = models.CharField(max_length=255, blank=True, null=True)
     back_side_identity_card_url = models.CharField(max_length=255, blank=True, null=True)
     selfie_photo_url = models.CharField(max_length=255, blank=True, null=True)
+    IMAGE_UPLOAD_STATUS_CHOICES = [
+        ('processing', 'Processing'), # spooled, upload pending (see users.tasks.upload_profile_images)
+        ('ready', 'Ready'),
+        ('failed', 'Failed'), # at least one image of the last submission was not stored
+    ]
+    image_upload_status = models.CharField(max_length=20, choices=IMAGE_UPLOAD_STATUS_CHOICES, default='ready')
 
     gender = models.CharField(
         max_length=20, 
@@ -118,6 +124,7 @@ class Profile(models.Model):
     total_completed_deliveries = models.IntegerField(default=0)
     average_rating = models.FloatField(default=0)
     total_rating_received = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0, editable=False, help_text="Sum of all review rates; average_rating = rating_sum / total_rating_received")
     preferred_payment_method = models.CharField(
         max_length=255, 
         choices=[ ('bank_transfer', 'Bank Transfer'),('telebirr', 'Tele Birr'),('cash', "Cash"), ('system_coin', 'System Coin'), ('others', 'Others')], 
@@ -6,7 +6,8 @@ from listings.models import Region, Country
 from listings.serializers import RegionSerializer, CountrySerializer
 from .models import IdType, TravelPriceSetting
 from django.conf import settings
-from config.utils import upload_image, delete_image, optimized_image_url, auto_crop_url
+from config.uploads import queue_upload, spool
+from .tasks import upload_profile_images
 User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
@@ -152,10 +153,11 @@ class ProfileSerializer(serializers.ModelSerializer):
             'front_side_identity_card', 
             'back_side_identity_card_url', 
             'back_side_identity_card',
+            'image_upload_status',
             'created_at', 
             'updated_at'
         )
-        read_only_fields = ('created_at', 'updated_at', 'city_of_residence', 'id_type', 'issue_country', 'full_name')
+        read_only_fields = ('created_at', 'updated_at', 'city_of_residence', 'id_type', 'issue_country', 'full_name', 'image_upload_status')
     
     def create(self, validated_data):
         profile_picture = validated_data.pop('profile_picture', None)
@@ -164,15 +166,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         selfie_photo = validated_data.pop('selfie_photo', None) 
 
         instance = Profile.objects.create(**validated_data)
-        if profile_picture:
-            instance.profile_picture_url = upload_image(profile_picture, f"verlo/profile/profile_{instance.user.id}")['secure_url']
-        if front_side_identity_card:
-            instance.front_side_identity_card_url = upload_image(front_side_identity_card, f"verlo/front_id/front_id_{instance.user.id}")['secure_url']
-        if back_side_identity_card:
-            instance.back_side_identity_card_url = upload_image(back_side_identity_card, f"verlo/back_id/back_id_{instance.user.id}")['secure_url']
-        if selfie_photo:
-            instance.selfie_photo_url = upload_image(selfie_photo, f"verlo/selfie/selfie_{instance.user.id}")['secure_url']
-        instance.save() 
+        self.upload_images_later(instance, profile_picture, front_side_identity_card, back_side_identity_card, selfie_photo)
         return instance
 
     def update(self, instance, validated_data):
@@ -185,23 +179,33 @@ class ProfileSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        if profile_picture:
-            # if instance.profile_picture_url:
-            #     delete_image(instance.profile_picture_url.split('/')[-1].split('.')[0])
-            instance.profile_picture_url = upload_image(profile_picture, f"verlo/profile/profile_{instance.user.id}")['secure_url']
-        
-        if front_side_identity_card:
-            instance.front_side_identity_card_url = upload_image(front_side_identity_card, f"verlo/front_id/front_id_{instance.user.id}")['secure_url']
-        
-        if back_side_identity_card:
-            instance.back_side_identity_card_url = upload_image(back_side_identity_card, f"verlo/back_id/back_id_{instance.user.id}")['secure_url']
-        
-        if selfie_photo:
-            instance.selfie_photo_url = upload_image(selfie_photo, f"verlo/selfie/selfie_{instance.user.id}")['secure_url']
-
         instance.save()
+        self.upload_images_later(instance, profile_picture, front_side_identity_card, back_side_identity_card, selfie_photo)
         return instance
 
+    @staticmethod
+    def upload_images_later(instance, profile_picture, front_side_identity_card, back_side_identity_card, selfie_photo):
+        """
+        Spool the submitted images and upload them from a worker once the
+        transaction commits; the URL fields are set when the uploads finish.
+        """
+        user_id = instance.user_id
+        images = {
+            'profile_picture_url': (profile_picture, f"verlo/profile/profile_{user_id}"),
+            'front_side_identity_card_url': (front_side_identity_card, f"verlo/front_id/front_id_{user_id}"),
+            'back_side_identity_card_url': (back_side_identity_card, f"verlo/back_id/back_id_{user_id}"),
+            'selfie_photo_url': (selfie_photo, f"verlo/selfie/selfie_{user_id}"),
+        }
+        uploads = {field: [spool(file), public_id] for field, (file, public_id) in images.items() if file}
+        if uploads:
+            # update(): Profile.save() re-reads the row for its identity documents check
+            Profile.objects.filter(pk=instance.pk).update(image_upload_status='processing', updated_at=timezone.now())
+            instance.image_upload_status = 'processing'
+            queue_upload(
+                upload_profile_images, (instance.id, uploads), [path for path, _ in uploads.values()],
+                on_failure=lambda: Profile.objects.filter(pk=instance.pk).update(image_upload_status='failed'),
+            )
+
 class UserProfileSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer(required=False)
     verification_status = serializers.SerializerMethodField()
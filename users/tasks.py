@@ -1,6 +1,14 @@
 from celery import shared_task
+from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from config.uploads import sweep_spool, upload_spooled
+from .models import Profile
 from .utils import send_verification_email
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -20,3 +28,44 @@ def send_verification_email_task(user_id, otp_code):
 @shared_task
 def send_report():
     print("Sending daily report...")
+
+
+@shared_task
+def upload_profile_images(profile_id, uploads):
+    """
+    Upload spooled profile images and store their URLs on the profile.
+    ``uploads`` maps a Profile URL field to [spool path, public_id].
+    The profile's image_upload_status ends up 'ready', or 'failed' if any image failed.
+    """
+    fields = list(uploads)
+    results = upload_spooled([tuple(uploads[field]) for field in fields])
+    urls = {}
+    for field, result in zip(fields, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to upload {field} of profile #{profile_id}: {str(result)}")
+        else:
+            urls[field] = result['secure_url']
+    profile = Profile.objects.filter(id=profile_id).first()
+    if profile is None:
+        return []
+    for field, url in urls.items():
+        setattr(profile, field, url)
+    profile.image_upload_status = 'ready' if len(urls) == len(fields) else 'failed'
+    # save() (not update()) so the identity documents check in Profile.save runs
+    profile.save(update_fields=[*urls, 'image_upload_status', 'updated_at'])
+    return list(urls)
+
+
+@shared_task
+def sweep_upload_spool():
+    """
+    Remove spooled files whose upload task never ran, and fail the profile
+    uploads still processing after UPLOAD_SPOOL_MAX_AGE seconds.
+    """
+    removed = sweep_spool()
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'UPLOAD_SPOOL_MAX_AGE', 6 * 60 * 60))
+    expired = Profile.objects.filter(image_upload_status='processing', updated_at__lt=cutoff).update(
+        image_upload_status='failed'
+    )
+    logger.info(f"Swept upload spool: removed {removed} files, {expired} profile uploads failed")
+    return removed
@@ -7,7 +7,9 @@ from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model, authenticate
 from django.utils import timezone
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 from .models import Profile, OTP, CustomUser, IdType, TravelPriceSetting
 from .serializers import (
     UserRegistrationSerializer, UserProfileSerializer, ProfileSerializer,
@@ -91,6 +93,22 @@ class UserLoginView(APIView):
             status_code=status.HTTP_200_OK
         )
 
+def blacklist_access_token(access_token):
+    """
+    Record an access token in the simplejwt blacklist by its jti (simplejwt
+    only blacklists refresh tokens on its own).
+    """
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=access_token['jti'],
+        defaults={
+            'user_id': access_token['user_id'],
+            'token': str(access_token),
+            'created_at': datetime_from_epoch(access_token['iat']) if 'iat' in access_token else timezone.now(),
+            'expires_at': datetime_from_epoch(access_token['exp']),
+        }
+    )
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+
 @extend_schema(tags=['User'], description="Logout by blacklisting the refresh token")
 class UserLogoutView(APIView):
     permission_classes = [IsAuthenticated]
@@ -105,6 +123,9 @@ class UserLogoutView(APIView):
         try:
             token = RefreshToken(refresh_token)
             token.blacklist()
+            if isinstance(request.auth, AccessToken):
+                # Also revoke the access token so it cannot open new websockets
+                blacklist_access_token(request.auth)
             return standard_response(
                 data={'message': 'Successfully logged out'},
                 status_code=status.HTTP_205_RESET_CONTENT